@@ -39,8 +39,11 @@ def main():
             user_id = input("Telegram ID: ")
             number = input("Табельный номер: ")
             full_name = input("ФИО: ")
-            add_user(user_id, number, full_name)
-            print("✅ Добавлен.")
+            try:
+                add_user(user_id, number, full_name)
+                print("✅ Добавлен.")
+            except ValueError as e:
+                print(e)
         elif choice == "2":
             user_id = input("Telegram ID: ")
             set_subscription(user_id, active=True)
@@ -0,0 +1,104 @@
+"""
+Накладные расходы антифлуда на одно событие: прежний список отметок и кольцо.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_flood.py --users 100000 --limit 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("NUMBER_PEPPER", "benchmark")
+
+from middlewares.flood_control import FloodControlMiddleware  # noqa: E402
+
+
+class LegacyFloodControl:
+    # Прежняя реализация: список отметок пересобирается на каждое сообщение
+    def __init__(self, limit, period, block_time):
+        self.limit = limit
+        self.period = period
+        self.block_time = block_time
+        self.user_messages = defaultdict(list)
+        self.blocked_until = {}
+        self.admin_ids = set()
+
+    async def __call__(self, handler, event, data):
+        user_id = event.from_user.id
+        now = time.time()
+        if user_id in self.admin_ids:
+            return await handler(event, data)
+        if user_id in self.blocked_until and now < self.blocked_until[user_id]:
+            return
+        timestamps = [t for t in self.user_messages[user_id] if now - t <= self.period]
+        timestamps.append(now)
+        self.user_messages[user_id] = timestamps
+        if len(timestamps) > self.limit:
+            self.blocked_until[user_id] = now + self.block_time
+            await event.answer("🚫")
+            return
+        return await handler(event, data)
+
+
+async def handler(event, data):
+    return None
+
+
+async def answer(text):
+    return None
+
+
+def make_events(users):
+    return [SimpleNamespace(from_user=SimpleNamespace(id=i), answer=answer) for i in range(users)]
+
+
+async def run(middleware, events, rounds):
+    # Каждый пользователь пишет rounds раз подряд — окно заполнено почти до лимита
+    data = {}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for event in events:
+            await middleware(handler, event, data)
+    return (time.perf_counter() - start) / (rounds * len(events))
+
+
+def measure(factory, events, rounds):
+    tracemalloc.start()
+    middleware = factory()
+    per_event = asyncio.run(run(middleware, events, rounds))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return per_event, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--period", type=int, default=60)
+    args = parser.parse_args()
+
+    events = make_events(args.users)
+    rounds = args.limit  # ровно до лимита: никто не блокируется, проверка идёт до хендлера
+
+    legacy, legacy_mem = measure(lambda: LegacyFloodControl(args.limit, args.period, 15), events, rounds)
+    ring, ring_mem = measure(lambda: FloodControlMiddleware(args.limit, args.period, 15), events, rounds)
+
+    print(f"Пользователей: {args.users}, лимит {args.limit}/{args.period}s, событий: {args.users * rounds}\n")
+    print(f"{'реализация':<14}{'мкс/событие':>14}{'память, МБ':>14}")
+    print(f"{'список':<14}{legacy * 1e6:>14.2f}{legacy_mem / 2**20:>14.1f}")
+    print(f"{'кольцо':<14}{ring * 1e6:>14.2f}{ring_mem / 2**20:>14.1f}")
+    print(f"\nускорение: {legacy / ring:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Пересменка против лимитов Telegram: прямая отправка и очередь исходящих.
+
+Все пользователи одновременно получают по нескольку ответов, а в чаты
+админов параллельно сыплются уведомления. Запросы идут на локальный
+фейковый Bot API (fake_telegram.py) с лимитами 30/s на бот и 1/s на чат.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_outbound.py --users 60 --replies 3 --alerts 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("NUMBER_PEPPER", "benchmark")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from services.outbound import OutboundLimiter, priority, BACKGROUND  # noqa: E402
+
+ADMINS = (900001, 900002)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def send(bot, chat_id, text, latencies, errors, start):
+    try:
+        await bot.send_message(chat_id, text)
+        latencies.append(time.monotonic() - start)
+    except TelegramRetryAfter:
+        errors.append(chat_id)
+
+
+async def alerts(bot, count, latencies, errors, start):
+    # Уведомления — фоновым приоритетом, как их шлёт services.notifier
+    with priority(BACKGROUND):
+        await asyncio.gather(*(
+            send(bot, ADMINS[i % len(ADMINS)], f"🚫 alert {i}", latencies, errors, start)
+            for i in range(count)
+        ))
+
+
+async def scenario(args, limiter):
+    server = FakeTelegram(rate=30, chat_rate=1, chat_burst=3, latency=args.latency / 1000)
+    url = await server.start()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(url))
+    if limiter is not None:
+        session.middleware(limiter)
+    bot = Bot("42:benchmark", session=session)
+
+    replies, reply_errors, alert_lat, alert_errors = [], [], [], []
+    start = time.monotonic()
+    await asyncio.gather(
+        alerts(bot, args.alerts, alert_lat, alert_errors, start),
+        *(
+            send(bot, 1000 + user, f"ответ {n}", replies, reply_errors, start)
+            for user in range(args.users) for n in range(args.replies)
+        ),
+    )
+    elapsed = time.monotonic() - start
+    await session.close()
+    await server.close()
+    return {
+        "elapsed": elapsed,
+        "delivered": len(server.sent),
+        "429": sum(server.limited.values()),
+        "lost": len(reply_errors) + len(alert_errors),
+        "reply_p50": percentile(replies, 0.5),
+        "reply_p95": percentile(replies, 0.95),
+        "alert_p50": percentile(alert_lat, 0.5),
+        "alert_p95": percentile(alert_lat, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--replies", type=int, default=3)
+    parser.add_argument("--alerts", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=20, help="мс на ответ API")
+    args = parser.parse_args()
+
+    total = args.users * args.replies + args.alerts
+    print(f"Пользователей: {args.users} × {args.replies} ответа, уведомлений: {args.alerts}, всего {total}\n")
+    print(f"{'режим':<10}{'время, с':>10}{'доставлено':>12}{'429':>7}{'потеряно':>10}"
+          f"{'ответ p50/p95, с':>20}{'уведомл. p50/p95, с':>23}")
+    for name, limiter in (("напрямую", None), ("очередь", OutboundLimiter(rate=25, chat_rate=1, chat_burst=3))):
+        r = asyncio.run(scenario(args, limiter))
+        print(f"{name:<10}{r['elapsed']:>10.2f}{r['delivered']:>12}{r['429']:>7}{r['lost']:>10}"
+              f"{r['reply_p50']:>11.2f}/{r['reply_p95']:<8.2f}{r['alert_p50']:>14.2f}/{r['alert_p95']:<8.2f}")
+
+
+if __name__ == "__main__":
+    main()
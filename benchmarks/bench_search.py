@@ -0,0 +1,99 @@
+"""
+Сравнение линейного поиска по FLAT_DATA и инвертированного индекса.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_search.py --copies 200
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# handlers.menu тянет за собой db и аудит — пусть пишут во временный каталог
+WORKDIR = Path(tempfile.mkdtemp(prefix="nikitich-bench-"))
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("NUMBER_PEPPER", "benchmark")
+os.environ["DB_PATH"] = str(WORKDIR / "users.db")
+os.environ["AUDIT_DIR"] = str(WORKDIR / "audit")
+os.environ["DOCS_SNAPSHOT"] = "0"
+
+from handlers.menu import expand_query  # noqa: E402
+from services.docs import flatten_json  # noqa: E402
+from services.search_index import SearchIndex  # noqa: E402
+
+QUERIES = ["заправка", "контроль", "бсто", "fault", "ресет", "кислород", "мастер ресет", "xyz", "ос"]
+
+
+def enlarge(data: dict, copies: int) -> dict:
+    # Каждая копия — отдельный «тип ВС» со своими ключами верхнего уровня
+    big = {}
+    for i in range(copies):
+        for top, subtree in data.items():
+            big[f"{top} #{i}"] = subtree
+    return big
+
+
+def linear_scan(flat_data, query):
+    # Прежняя реализация search_documents
+    search_terms = expand_query(query)
+    result_paths = {}
+    for entry in flat_data:
+        path = entry.path
+        entry_text = f"{entry.category} {entry.text}".lower()
+        if any(term in entry_text for term in search_terms):
+            key = path[1] if len(path) > 1 else path[0]
+            result_paths[key] = path[:2]
+    return result_paths
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=100, help="во сколько раз увеличить data.json")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(ROOT / "data.json", encoding="utf-8") as f:
+        data = enlarge(json.load(f), args.copies)
+    flat = flatten_json(data)
+
+    index = SearchIndex()
+    build_time = timeit(lambda: index.build(flat), 1)
+    print(f"Записей: {len(flat)}, построение индекса: {build_time * 1000:.1f} мс\n")
+    print(f"{'запрос':<16}{'скан, мс':>12}{'индекс, мс':>14}{'с кэшем, мс':>14}{'ускорение':>12}")
+
+    for query in QUERIES:
+        expected = linear_scan(flat, query)
+        actual = index.search(expand_query(query))
+        assert actual == expected and list(actual) == list(expected), f"расхождение для «{query}»"
+
+        def uncached():
+            index._cache.clear()
+            index.search(expand_query(query))
+
+        scan = timeit(lambda: linear_scan(flat, query), args.repeat)
+        indexed = timeit(uncached, args.repeat)
+        cached = timeit(lambda: index.search(expand_query(query)), args.repeat)
+        print(
+            f"{query:<16}{scan * 1000:>12.3f}{indexed * 1000:>14.3f}"
+            f"{cached * 1000:>14.3f}{scan / indexed:>11.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
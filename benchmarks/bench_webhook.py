@@ -0,0 +1,200 @@
+"""
+Long polling против webhook: пропускная способность и задержка ответа.
+
+Апдейты подаются с заданной частотой: в очередь getUpdates фейкового Bot API
+(polling) или POST-запросами в WebhookServer (webhook). Задержка — от подачи
+апдейта до прихода ответа бота на фейковый API. Хендлеры имитируют нашу
+смесь: навигация по меню, /start, нажатия inline-кнопок, каждое со своей
+долей ожидания I/O. Вместо синтетики можно подать записанные апдейты —
+JSONL, по одному объекту Update на строку.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_webhook.py --count 2000 --rate 200 --api-latency 50
+    python benchmarks/bench_webhook.py --updates recorded_updates.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("NUMBER_PEPPER", "benchmark")
+
+from aiohttp import ClientSession  # noqa: E402
+from aiogram import Bot, Dispatcher, F, Router, types  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.filters import CommandStart  # noqa: E402
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from services.webhook import WebhookServer  # noqa: E402
+
+# Доли апдейтов и ожидание I/O (БД, документы) на каждый вид, мс
+MIX = (
+    ("menu", 0.7, 5),
+    ("start", 0.2, 20),
+    ("callback", 0.1, 10),
+)
+MENU_TEXTS = ("🔧 Двигатель", "⚙️ Трансмиссия", "🔙 Назад", "📄 Регламент ТО", "🔍 Поиск")
+
+
+def make_router(io_scale: float) -> Router:
+    router = Router()
+    cost = {kind: ms / 1000 * io_scale for kind, _, ms in MIX}
+
+    @router.message(CommandStart())
+    async def start(message: types.Message, event_update: types.Update):
+        await asyncio.sleep(cost["start"])
+        await message.answer(str(event_update.update_id))
+
+    @router.message(F.text)
+    async def menu(message: types.Message, event_update: types.Update):
+        await asyncio.sleep(cost["menu"])
+        await message.answer(str(event_update.update_id))
+
+    @router.callback_query()
+    async def callback(query: types.CallbackQuery, event_update: types.Update):
+        await asyncio.sleep(cost["callback"])
+        await query.message.answer(str(event_update.update_id))
+
+    return router
+
+
+def synthetic_updates(count: int, users: int, seed: int = 1) -> list[dict]:
+    rng = random.Random(seed)
+    kinds = [kind for kind, _, _ in MIX]
+    weights = [share for _, share, _ in MIX]
+    updates = []
+    for i in range(count):
+        user = {"id": 100000 + rng.randrange(users), "is_bot": False, "first_name": "Механик"}
+        chat = {"id": user["id"], "type": "private"}
+        message = {"message_id": i + 1, "date": int(time.time()), "chat": chat, "from": user}
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "callback":
+            updates.append({"callback_query": {
+                "id": str(i), "from": user, "chat_instance": "1", "data": "noop",
+                "message": {**message, "from": {"id": 1, "is_bot": True, "first_name": "Никитич"}, "text": "меню"},
+            }})
+        elif kind == "start":
+            updates.append({"message": {**message, "text": "/start",
+                                        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}})
+        else:
+            updates.append({"message": {**message, "text": rng.choice(MENU_TEXTS)}})
+    return updates
+
+
+def load_updates(path: Path) -> list[dict]:
+    updates = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                update = json.loads(line)
+                update.pop("update_id", None)
+                updates.append(update)
+    return updates
+
+
+async def run(mode: str, updates: list[dict], args) -> dict:
+    server = FakeTelegram(rate=1e9, chat_rate=1e9, chat_burst=1e9, latency=args.api_latency / 1000)
+    injected: dict[int, float] = {}
+    latencies: list[float] = []
+    done = asyncio.Event()
+
+    def on_send(method, params):
+        update_id = int(params.get("text", 0) or 0)
+        if update_id in injected:
+            latencies.append(time.monotonic() - injected.pop(update_id))
+            if len(latencies) == len(updates):
+                done.set()
+
+    server.on_send = on_send
+    url = await server.start()
+    bot = Bot("42:benchmark", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    dp = Dispatcher()
+    dp.include_router(make_router(args.io_scale))
+
+    webhook = client = polling = None
+    if mode == "webhook":
+        webhook = WebhookServer(dp, bot, path="/webhook", max_concurrency=args.concurrency, drain_timeout=5)
+        await webhook.start("127.0.0.1", args.webhook_port)
+        client = ClientSession()
+    else:
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+
+    async def post(update):
+        async with client.post(f"http://127.0.0.1:{args.webhook_port}/webhook", json=update) as response:
+            await response.read()
+
+    posts = []
+    start = time.monotonic()
+    for i, update in enumerate(updates, 1):
+        target = start + i / args.rate
+        delay = target - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = {"update_id": i, **update}
+        injected[i] = time.monotonic()
+        if webhook is not None:
+            posts.append(asyncio.create_task(post(update)))
+        else:
+            server.push_update(update)
+
+    try:
+        await asyncio.wait_for(done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.monotonic() - start
+
+    if webhook is not None:
+        await asyncio.gather(*posts, return_exceptions=True)
+        await client.close()
+        await webhook.close()
+    else:
+        await dp.stop_polling()
+        await polling
+    await bot.session.close()
+    await server.close()
+
+    latencies.sort()
+    pick = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0  # noqa: E731
+    return {
+        "answered": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": pick(0.5),
+        "p99": pick(0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000, help="число синтетических апдейтов")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--updates", type=Path, help="JSONL с записанными апдейтами")
+    parser.add_argument("--rate", type=float, default=200, help="апдейтов в секунду")
+    parser.add_argument("--api-latency", type=float, default=50, help="мс на каждый запрос к API")
+    parser.add_argument("--io-scale", type=float, default=1.0, help="множитель ожидания I/O в хендлерах")
+    parser.add_argument("--concurrency", type=int, default=100, help="WEBHOOK_MAX_CONCURRENCY")
+    parser.add_argument("--webhook-port", type=int, default=8787)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count, args.users)
+    print(f"Апдейтов: {len(updates)}, подача {args.rate:.0f}/с, задержка API {args.api_latency:.0f} мс\n")
+    print(f"{'режим':<10}{'ответов':>9}{'время, с':>10}{'апд/с':>9}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for mode in ("polling", "webhook"):
+        r = asyncio.run(run(mode, updates, args))
+        print(f"{mode:<10}{r['answered']:>9}{r['elapsed']:>10.2f}{r['throughput']:>9.0f}"
+              f"{r['p50'] * 1000:>10.0f}{r['p99'] * 1000:>10.0f}{r['max'] * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Локальный сервер Bot API для нагрузочных прогонов: отвечает как Telegram
+и так же режет частоту — общий лимит на бот и лимит на чат, сверх них 429
+с retry_after. Настоящих сообщений никуда не уходит.
+
+Отдельный запуск (бот направляется на него через TelegramAPIServer.from_base):
+    python benchmarks/fake_telegram.py --port 8081
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self) -> float:
+        # 0 — маркер выдан, иначе через сколько секунд он появится
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def _limited(method: str) -> bool:
+    return method.startswith(("send", "copyMessage", "forwardMessage", "editMessage")) and method != "sendChatAction"
+
+
+class FakeTelegram:
+    """
+    Сервер с лимитами rate сообщений в секунду на бот и chat_rate
+    (с запасом chat_burst) на чат. latency — задержка каждого ответа.
+    Апдейты для getUpdates кладутся через push_update(), on_send(method, params)
+    вызывается на каждое доставленное сообщение.
+    """
+
+    def __init__(self, rate: float = 30, chat_rate: float = 1, chat_burst: float = 3, latency: float = 0.0):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.latency = latency
+        self._global = _Bucket(rate, rate)
+        self._chats: dict[str, _Bucket] = {}
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self.calls = Counter()
+        self.limited = Counter()
+        self.sent: list[tuple[float, str, str]] = []  # (время, чат, метод)
+        self.on_send = None
+        self.runner: web.AppRunner | None = None
+        self.url = None
+
+    # --- Жизненный цикл ---
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def push_update(self, update: dict):
+        update = {"update_id": next(self._update_ids), **update}
+        self._updates.put_nowait(update)
+        return update["update_id"]
+
+    # --- Обработка ---
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if _limited(method):
+            chat_id = str(params.get("chat_id", ""))
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = _Bucket(self.chat_rate, self.chat_burst)
+            wait = bucket.take() or self._global.take()
+            if wait:
+                self.limited[method] += 1
+                retry_after = max(1, math.ceil(wait))
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                })
+            self.sent.append((time.monotonic(), chat_id, method))
+            if self.on_send is not None:
+                self.on_send(method, params)
+
+        return web.json_response({"ok": True, "result": await self._result(method, params)})
+
+    async def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Никитич", "username": "fake_bot"}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if _limited(method):
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def _get_updates(self, params: dict):
+        # Выданный апдейт из очереди уходит сразу, offset не нужен
+        timeout = float(params.get("timeout") or 0)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self._updates.get(), timeout or 0.01))
+        except asyncio.TimeoutError:
+            return []
+        while not self._updates.empty() and len(updates) < 100:
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def stats(self) -> dict:
+        return {
+            "calls": sum(self.calls.values()),
+            "delivered": len(self.sent),
+            "429": sum(self.limited.values()),
+        }
+
+
+async def _serve(args):
+    server = FakeTelegram(args.rate, args.chat_rate, args.chat_burst, args.latency / 1000)
+    url = await server.start(args.host, args.port)
+    print(f"Фейковый Bot API: {url}  (лимиты {args.rate}/s на бот, {args.chat_rate}/s на чат)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps(server.stats(), ensure_ascii=False))
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate", type=float, default=30)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--latency", type=float, default=0, help="мс на ответ")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
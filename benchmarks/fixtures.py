@@ -0,0 +1,70 @@
+"""
+Воспроизводимые данные для бенчмарков: увеличенный data.json и синтетическая
+база пользователей. Одинаковые параметры и seed дают одинаковые файлы.
+
+Модуль импортирует db, поэтому DB_PATH должен быть задан до импорта.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bcrypt
+
+import db
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FIRST_NAMES = ("Иван", "Пётр", "Сергей", "Алексей", "Дмитрий", "Николай", "Андрей", "Олег")
+LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Волков", "Соколов", "Попов")
+# Табельные номера синтетических пользователей: FIRST_NUMBER, FIRST_NUMBER + 1, ...
+FIRST_NUMBER = 100000
+FIRST_USER_ID = 500000000
+
+
+def enlarge(data: dict, copies: int) -> dict:
+    # Каждая копия — отдельный «тип ВС» со своими ключами верхнего уровня
+    big = {}
+    for i in range(copies):
+        for top, subtree in data.items():
+            big[f"{top} #{i}"] = subtree
+    return big
+
+
+def write_docs(path: Path, copies: int) -> dict:
+    """data.json проекта, увеличенный в copies раз; возвращает записанное дерево."""
+    with open(ROOT / "data.json", encoding="utf-8") as f:
+        data = enlarge(json.load(f), copies)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return data
+
+
+def write_users(count: int, seed: int = 1) -> list[int]:
+    """
+    Заполняет базу DB_PATH count пользователями и возвращает их Telegram ID.
+    bcrypt считается один раз на всех: ключи номеров (HMAC) у каждого свои,
+    а сам хеш в горячих путях не участвует.
+    """
+    db.init_db()
+    rng = random.Random(seed)
+    hashed = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(rounds=4)).decode()
+    started = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        number = str(FIRST_NUMBER + i)
+        rows.append((
+            FIRST_USER_ID + i,
+            hashed,
+            db.number_digest(number),
+            f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+            "user",
+            (started + timedelta(minutes=rng.randrange(500000))).isoformat(),
+            rng.random() < 0.2,
+        ))
+    db.conn.executemany("""
+        INSERT INTO users (telegram_id, number, number_digest, full_name, role, auth_time, subscription_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    db.conn.commit()
+    return [row[0] for row in rows]
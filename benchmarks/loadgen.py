@@ -0,0 +1,371 @@
+"""
+Нагрузочный прогон бота целиком: механики приходят на смену разом.
+
+Поднимается фейковый Bot API (fake_telegram.py) с лимитами и задержкой как
+у Telegram, и против него запускается настоящий bot.py отдельным процессом —
+со своей временной базой, режимом polling или webhook и нужным числом
+воркеров. Каждый механик проходит сценарий /start → табельный номер →
+несколько разделов меню → главное меню → поиск → переход к найденному,
+с паузой на чтение между шагами. Механики приходят потоком Пуассона с
+частотой --arrival-rate.
+
+Задержка шага — от отправки апдейта до ответа бота на фейковый API, то есть
+вместе с очередью исходящих и лимитами Telegram. Остальные переменные
+окружения (OUTBOUND_RATE, HASH_WORKERS, FLOOD_LIMIT…) передаются боту как есть.
+
+Запуск из корня репозитория:
+    python benchmarks/loadgen.py --mechanics 2000 --arrival-rate 40
+    python benchmarks/loadgen.py --mode webhook --workers 4 --api-latency 60
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import secrets
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from aiohttp import ClientSession  # noqa: E402
+
+from fake_telegram import FakeTelegram  # noqa: E402
+
+TOKEN = "1:loadgen"
+WEBHOOK_PATH = "/webhook"
+FIRST_USER_ID = 700000000
+FIRST_NUMBER = 300000
+QUERIES = ["заправка", "контроль", "бсто", "fault", "ресет", "кислород", "мастер ресет", "проверка"]
+
+SEARCH_BUTTON = "🔍 Поиск документации"
+HOME_BUTTON = "🏠 Главное меню"
+SERVICE_BUTTONS = {SEARCH_BUTTON, HOME_BUTTON, "⬅ Назад", "🚪 Выйти"}
+# Платный раздел отвечает фото с QR-кодом — в сценарий не входит
+SKIPPED_SECTIONS = {"ресеты"}
+
+# Ответ, которым бот завершает шаг; остальные сообщения (подсказки,
+# описание раздела перед его меню) пропускаются
+STEPS = {
+    "start": ("🔐 Введите табельный номер",),
+    "login": ("✅ Авторизация успешна",),
+    "menu": ("📁 Раздел", "📄 <b>Описание"),
+    "home": ("🏠 Главное меню",),
+    "search_prompt": ("🔎 Введите ключевое слово",),
+    "search": ("🔍 Найдено", "❌ По вашему запросу"),
+    "select": ("📁 Перейдено к",),
+}
+FLOOD_REPLY = "🚫"
+
+
+class StepTimeout(Exception):
+    pass
+
+
+class Load:
+    """Общее для всех механиков: доставка апдейтов боту и ответы по чатам."""
+
+    def __init__(self, server: FakeTelegram, args):
+        self.server = server
+        self.args = args
+        self.inboxes: dict[int, asyncio.Queue] = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.timeouts = Counter()
+        self.flood_replies = 0
+        self.finished = 0
+        self.updates = 0
+        self.first_update = None
+        self.last_reply = None
+        self._update_ids = itertools.count(1)
+        self._client: ClientSession | None = None
+        server.on_send = self._on_send
+
+    def _on_send(self, method, params):
+        now = time.monotonic()
+        self.last_reply = now
+        inbox = self.inboxes.get(int(params.get("chat_id") or 0))
+        if inbox is not None:
+            inbox.put_nowait((now, params))
+
+    async def send(self, update: dict):
+        self.updates += 1
+        if self.first_update is None:
+            self.first_update = time.monotonic()
+        if self.args.mode == "polling":
+            self.server.push_update(update)
+            return
+        if self._client is None:
+            self._client = ClientSession()
+        update = {"update_id": next(self._update_ids), **update}
+        async with self._client.post(
+            f"http://127.0.0.1:{self.args.webhook_port}{WEBHOOK_PATH}",
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": self.args.webhook_secret}
+        ) as response:
+            await response.read()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+
+
+class Mechanic:
+    def __init__(self, load: Load, index: int, rng: random.Random):
+        self.load = load
+        self.user_id = FIRST_USER_ID + index
+        self.number = str(FIRST_NUMBER + index)
+        self.rng = rng
+        self.inbox = load.inboxes[self.user_id] = asyncio.Queue()
+        self._message_ids = itertools.count(1)
+
+    async def say(self, step: str, text: str, need_keyboard: bool = False) -> tuple[str, list[str]]:
+        user = {"id": self.user_id, "is_bot": False, "first_name": "Механик", "last_name": self.number}
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+
+        sent = time.monotonic()
+        await self.load.send({"message": message})
+        deadline = sent + self.load.args.step_timeout
+        while True:
+            try:
+                at, params = await asyncio.wait_for(self.inbox.get(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                self.load.timeouts[step] += 1
+                raise StepTimeout(step)
+            reply = params.get("text") or params.get("caption") or ""
+            if reply.startswith(FLOOD_REPLY):
+                self.load.flood_replies += 1
+                continue
+            markup = json.loads(params["reply_markup"]) if params.get("reply_markup") else {}
+            if not reply.startswith(STEPS[step]) or (need_keyboard and "keyboard" not in markup):
+                continue
+            self.load.latencies[step].append(at - sent)
+            buttons = [button["text"] for row in markup.get("keyboard", []) for button in row]
+            return reply, buttons
+
+    async def think(self):
+        # Читает ответ: ±25% от средней паузы. При паузе от 3,2 с пять
+        # действий не укладываются в 10 с — антифлуд по умолчанию не срабатывает
+        await asyncio.sleep(self.load.args.think * self.rng.uniform(0.75, 1.25))
+
+    def pick(self, buttons: list[str]) -> str | None:
+        sections = [
+            b for b in buttons
+            if b not in SERVICE_BUTTONS and b.strip().lower() not in SKIPPED_SECTIONS
+        ]
+        return self.rng.choice(sections) if sections else None
+
+    async def run(self):
+        try:
+            await self.say("start", "/start")
+            await self.think()
+            _, buttons = await self.say("login", self.number)
+
+            for _ in range(self.rng.randint(1, self.load.args.depth)):
+                section = self.pick(buttons)
+                if section is None:
+                    break
+                await self.think()
+                reply, buttons = await self.say("menu", section, need_keyboard=True)
+                if not reply.startswith("📁"):
+                    break  # Дошёл до описания
+
+            await self.think()
+            await self.say("home", HOME_BUTTON)
+            await self.think()
+            await self.say("search_prompt", SEARCH_BUTTON)
+            await self.think()
+            reply, buttons = await self.say("search", self.rng.choice(QUERIES))
+            found = self.pick(buttons)
+            if found is not None:
+                await self.think()
+                await self.say("select", found)
+            self.load.finished += 1
+        except StepTimeout:
+            pass
+
+
+# === Процесс бота ===
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bot_env(args, api_url: str, workdir: Path) -> dict:
+    env = {
+        **os.environ,
+        "RUN_IN_DOCKER": "1",
+        "BOT_TOKEN": TOKEN,
+        "NUMBER_PEPPER": "loadgen",
+        "TELEGRAM_API_URL": api_url,
+        "DB_PATH": str(workdir / "users.db"),
+        "AUDIT_DIR": str(workdir / "audit"),
+        "DOCS_SNAPSHOT": "0",
+        "AUTHORIZED_NUMBERS": ",".join(str(FIRST_NUMBER + i) for i in range(args.mechanics)),
+        "BOT_MODE": args.mode,
+        "WORKERS": str(args.workers),
+        "PYTHONUNBUFFERED": "1",
+    }
+    if args.mode == "webhook":
+        env.update({
+            "WEBHOOK_BASE_URL": f"http://127.0.0.1:{args.webhook_port}",
+            "WEBHOOK_PATH": WEBHOOK_PATH,
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(args.webhook_port),
+            "WEBHOOK_SECRET": args.webhook_secret,
+        })
+    return env
+
+
+async def start_bot(args, server: FakeTelegram, api_url: str, workdir: Path):
+    output = open(workdir / "stdout.log", "wb")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT / "bot.py"),
+        cwd=workdir, env=bot_env(args, api_url, workdir),
+        stdout=output, stderr=asyncio.subprocess.STDOUT
+    )
+    output.close()
+
+    # Готов, когда начал забирать апдейты или поставил webhook
+    ready = "getUpdates" if args.mode == "polling" else "setWebhook"
+    deadline = time.monotonic() + args.start_timeout
+    while not server.calls[ready]:
+        if process.returncode is not None or time.monotonic() > deadline:
+            if process.returncode is None:
+                process.kill()
+            tail = (workdir / "stdout.log").read_text(encoding="utf-8", errors="replace")[-2000:]
+            raise RuntimeError(f"❌ Бот не запустился:\n{tail}")
+        await asyncio.sleep(0.1)
+    if args.mode == "webhook":
+        await asyncio.sleep(0.2)  # setWebhook уходит сразу после старта сервера
+    return process
+
+
+async def stop_bot(process, timeout: float = 30):
+    # Как при остановке контейнера: SIGTERM и штатное завершение
+    process.send_signal(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Бот не остановился за {timeout:.0f} с — завершаем принудительно")
+        process.kill()
+        await process.wait()
+
+
+# === Отчёт ===
+def quantile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def report(load: Load, server: FakeTelegram, args, elapsed: float):
+    print(f"{'шаг':<15}{'ответов':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}{'без ответа':>12}")
+    everything = []
+    for step in STEPS:
+        values = sorted(load.latencies.get(step, []))
+        everything.extend(values)
+        if not values and not load.timeouts[step]:
+            continue
+        print(
+            f"{step:<15}{len(values):>9}{quantile(values, 0.5) * 1000:>10.0f}{quantile(values, 0.95) * 1000:>10.0f}"
+            f"{quantile(values, 0.99) * 1000:>10.0f}{(values[-1] if values else 0) * 1000:>10.0f}{load.timeouts[step]:>12}"
+        )
+    everything.sort()
+    print(
+        f"{'всего':<15}{len(everything):>9}{quantile(everything, 0.5) * 1000:>10.0f}"
+        f"{quantile(everything, 0.95) * 1000:>10.0f}{quantile(everything, 0.99) * 1000:>10.0f}"
+        f"{(everything[-1] if everything else 0) * 1000:>10.0f}{sum(load.timeouts.values()):>12}"
+    )
+
+    busy = (load.last_reply or 0) - (load.first_update or 0)
+    per_second = Counter(int(at - load.first_update) for at, _, _ in server.sent) if server.sent else Counter()
+    stats = server.stats()
+    print(f"\nЗавершили сценарий: {load.finished} из {args.mechanics} за {elapsed:.1f} с")
+    if busy > 0:
+        print(
+            f"Пропускная способность: {load.updates / busy:.1f} апдейтов/с, "
+            f"{stats['delivered'] / busy:.1f} сообщений бота/с (пик за секунду: {max(per_second.values(), default=0)})"
+        )
+    print(f"Ответов 429 от API: {stats['429']}, блокировок антифлуда: {load.flood_replies}")
+
+
+# === Запуск ===
+async def run(args, workdir: Path):
+    server = FakeTelegram(args.api_rate, args.chat_rate, args.chat_burst, args.api_latency / 1000)
+    api_url = await server.start()
+    process = await start_bot(args, server, api_url, workdir)
+    load = Load(server, args)
+    print(
+        f"Механиков: {args.mechanics}, приход {args.arrival_rate:g}/с, пауза ~{args.think:g} с; "
+        f"режим {args.mode}, воркеров {args.workers}\n"
+        f"API: {args.api_rate:g}/с на бот, {args.chat_rate:g}/с на чат, задержка {args.api_latency:g} мс\n"
+    )
+
+    rng = random.Random(args.seed)
+    tasks = []
+    started = time.monotonic()
+    try:
+        for index in range(args.mechanics):
+            mechanic = Mechanic(load, index, random.Random(rng.random()))
+            tasks.append(asyncio.create_task(mechanic.run()))
+            await asyncio.sleep(rng.expovariate(args.arrival_rate))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        elapsed = time.monotonic() - started
+        await load.close()
+        await stop_bot(process)
+        await server.close()
+    report(load, server, args, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mechanics", type=int, default=1000, help="сколько механиков приходит на смену")
+    parser.add_argument("--arrival-rate", type=float, default=20, help="новых механиков в секунду")
+    parser.add_argument("--think", type=float, default=4, help="средняя пауза между действиями, с")
+    parser.add_argument("--depth", type=int, default=3, help="до скольких разделов меню открывает механик")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--workers", type=int, default=1, help="WORKERS бота")
+    parser.add_argument("--api-rate", type=float, default=30, help="лимит сообщений в секунду на бот")
+    parser.add_argument("--chat-rate", type=float, default=1, help="лимит сообщений в секунду на чат")
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--api-latency", type=float, default=40, help="мс на каждый запрос к API")
+    parser.add_argument("--step-timeout", type=float, default=60, help="сколько ждать ответа на шаг, с")
+    parser.add_argument("--start-timeout", type=float, default=60, help="сколько ждать запуска бота, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="не удалять каталог с базой и логами бота")
+    args = parser.parse_args()
+    args.webhook_port = free_port()
+    args.webhook_secret = secrets.token_hex(16)
+
+    workdir = Path(tempfile.mkdtemp(prefix="nikitich-load-"))
+    try:
+        asyncio.run(run(args, workdir))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.keep:
+            print(f"\n📁 База и логи бота: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Сессия Bot API без сети: запросы не уходят дальше процесса, методы,
+возвращающие Message, получают правдоподобное сообщение, остальные — True.
+Позволяет гонять настоящий Dispatcher и хендлеры, измеряя только свой код.
+"""
+import time
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message
+
+
+class MockSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None):
+        self.calls[method.__api_method__] += 1
+        if method.__returning__ is not Message:
+            return True
+        self._message_id += 1
+        chat_id = getattr(method, "chat_id", None) or 0
+        return Message.model_validate({
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": bot.id, "is_bot": True, "first_name": "Никитич"},
+            "text": getattr(method, "text", None) or "",
+        }, context={"bot": bot})
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
@@ -0,0 +1,399 @@
+"""
+Набор бенчмарков горячих путей бота со сравнением с сохранённой базой.
+
+Данные генерируются при каждом запуске во временном каталоге: data.json
+проекта, увеличенный в --copies раз, и база на --users синтетических
+пользователей. Для каждого кейса — операций в секунду, p50/p99 одной
+операции и пиковая память (tracemalloc, отдельным прогоном: он замедляет
+код в разы). Полный путь апдейта идёт через настоящий Dispatcher из bot.py
+с сессией без сети (mock_bot.MockSession).
+
+Результат сравнивается с benchmarks/baseline.json: падение оп/с или рост
+p99 и памяти больше чем на --threshold — регрессия, код выхода 1. База
+снята на конкретной машине — на другом железе сначала --save-baseline.
+
+Запуск из корня репозитория:
+    python benchmarks/suite.py
+    python benchmarks/suite.py --only search_documents,dispatch
+    python benchmarks/suite.py --save-baseline
+"""
+import argparse
+import asyncio
+import gc
+import inspect
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+# Всё, что пишет бот (база, аудит, bot.log), — во временный каталог
+CWD = Path.cwd()
+WORKDIR = Path(tempfile.mkdtemp(prefix="nikitich-bench-"))
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("NUMBER_PEPPER", "benchmark")
+os.environ["DB_PATH"] = str(WORKDIR / "users.db")
+os.environ["AUDIT_DIR"] = str(WORKDIR / "audit")
+os.environ["DOCS_SNAPSHOT"] = "0"  # не трогать data.snapshot проекта
+os.environ["METRICS_PORT"] = "0"
+# bot.py импортируется ради настоящего диспетчера, сам бот не запускается
+os.environ["RUN_IN_DOCKER"] = "1"
+os.chdir(WORKDIR)
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import bot as app  # noqa: E402
+import db  # noqa: E402
+from config import FLOOD_LIMIT, FLOOD_PERIOD, FLOOD_BLOCK_TIME  # noqa: E402
+from handlers.menu import MenuState, expand_query, menu_keyboard, search_documents  # noqa: E402
+from middlewares.flood_control import FloodControlMiddleware  # noqa: E402
+from services import docs  # noqa: E402
+from services.docs import flatten_json  # noqa: E402
+from services.menu_tree import build_keyboard  # noqa: E402
+from services.stats import ApiTimer  # noqa: E402
+
+import fixtures  # noqa: E402
+from mock_bot import MockSession  # noqa: E402
+
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+QUERIES = ["заправка", "контроль", "бсто", "fault", "ресет", "кислород", "мастер ресет", "xyz", "ос"]
+# Разброс, который не считается регрессией: бенчмарки на общей машине шумят
+DEFAULT_THRESHOLD = 0.3
+# Прирост памяти меньше этого — шум аллокатора, а не регрессия
+MEMORY_SLACK_KB = 64
+# Прогонов на замер времени; берётся лучший — меньше всего помех от соседей по машине
+REPEAT = 3
+
+
+class Case:
+    """Одна операция горячего пути: сколько раз за прогон мерить время и сколько — память."""
+    __slots__ = ("name", "op", "ops", "memory_ops")
+
+    def __init__(self, name: str, op, ops: int, memory_ops: int = 100):
+        self.name = name
+        self.op = op
+        self.ops = ops
+        self.memory_ops = min(memory_ops, ops)
+
+    @property
+    def calls(self) -> int:
+        return self.memory_ops + self.ops * REPEAT
+
+
+# === Кейсы ===
+def docs_cases(data: dict, scale: float) -> list[Case]:
+    snapshot = docs.current()
+    tree = snapshot.menu
+    queries = itertools.cycle(QUERIES)
+
+    async def search():
+        # Кэш запросов сбрасываем: мерим сам поиск, а не попадание в кэш
+        snapshot.search_index._cache.clear()
+        await search_documents(next(queries))
+
+    def search_fts():
+        db.search_fts(expand_query(next(queries)))
+
+    # Переходы по меню: состояние FSM с узлом раздела и текст кнопки,
+    # набранный как попало — как приходит от пользователей
+    rng = random.Random(1)
+    steps = []
+    sections = [((), data)]
+    while sections and len(steps) < 5000:
+        path, node = sections.pop(0)
+        keys = [key for key in node if not key.startswith("_")]
+        for key in rng.sample(keys, min(len(keys), 20)):
+            text = rng.choice((key, key.lower(), f"  {key.upper()} "))
+            steps.append((tree.state_of(tree.find(path)), text))
+            if isinstance(node[key], dict):
+                sections.append(((*path, key), node[key]))
+    steps = itertools.cycle(steps)
+
+    def navigate():
+        state, text = next(steps)
+        tree.resolve(snapshot.node_from_state(state), text)
+
+    return [
+        Case("flatten_json", lambda: flatten_json(data), ops=max(1, int(3 * scale)), memory_ops=1),
+        Case("search_documents", search, ops=int(1000 * scale)),
+        Case("search_fts", search_fts, ops=int(200 * scale)),
+        # Сборка клавиатуры с нуля (прежний generate_menu) — для сравнения с menu_keyboard
+        Case("generate_menu", lambda: build_keyboard(sorted(key for key in data if not key.startswith("_"))), ops=int(1000 * scale)),
+        Case("menu_keyboard", menu_keyboard, ops=int(20000 * scale)),
+        Case("navigate_resolve", navigate, ops=int(20000 * scale)),
+    ]
+
+
+def flood_case(scale: float) -> Case:
+    ops = int(50000 * scale)
+    memory_ops = 1000
+    # Каждому пользователю — на событие меньше лимита: блокировок нет,
+    # мерим обычный путь сообщения
+    users = (memory_ops + ops * REPEAT) // max(FLOOD_LIMIT - 1, 1) + 1
+    middleware = FloodControlMiddleware(limit=FLOOD_LIMIT, period=FLOOD_PERIOD, block_time=FLOOD_BLOCK_TIME)
+
+    async def handler(event, data):
+        return None
+
+    async def answer(text):
+        return None
+
+    events = itertools.cycle([SimpleNamespace(from_user=SimpleNamespace(id=i), answer=answer) for i in range(users)])
+    data = {}
+
+    async def flood():
+        await middleware(handler, next(events), data)
+
+    return Case("flood_control", flood, ops=ops, memory_ops=memory_ops)
+
+
+def users_cases(user_count: int, scale: float) -> list[Case]:
+    # Половина номеров занята, половина — нет
+    rng = random.Random(2)
+    numbers = itertools.cycle([
+        str(fixtures.FIRST_NUMBER + rng.randrange(user_count)) if rng.random() < 0.5
+        else str(rng.randrange(10 ** 6, 10 ** 7))
+        for _ in range(10000)
+    ])
+
+    return [
+        Case("is_number_taken", lambda: db.is_number_taken(next(numbers)), ops=int(10000 * scale)),
+        Case("export_xlsx", lambda: db.write_users_export(WORKDIR / "export.xlsx", "xlsx"),
+             ops=max(1, int(1 * scale)), memory_ops=1),
+        Case("export_csv", lambda: db.write_users_export(WORKDIR / "export.csv", "csv"),
+             ops=max(1, int(3 * scale)), memory_ops=1),
+    ]
+
+
+async def dispatch_case(data: dict, users: list[int], scale: float) -> tuple[Case, MockSession]:
+    """
+    Апдейт «нажата кнопка раздела» от разобранного JSON до ответа: антифлуд,
+    хранилище FSM, хендлер navigate_menu, сессионные middleware. Очередь
+    исходящих (outbound) не подключается — это намеренный ограничитель
+    скорости, у него свой бенчмарк.
+    """
+    case = Case("dispatch", None, ops=int(1000 * scale))
+    users = users[:case.calls]
+    if len(users) < case.calls:
+        raise ValueError(f"❌ Для dispatch нужно не меньше {case.calls} пользователей (--users)")
+
+    session = MockSession()
+    session.middleware(ApiTimer())
+    session.middleware(app.chat_cleanup)
+    app.bot.session = session
+
+    # Каждый пользователь уже в меню и нажимает одну кнопку — антифлуд не срабатывает
+    for user_id in users:
+        key = StorageKey(bot_id=app.bot.id, chat_id=user_id, user_id=user_id)
+        await app.storage.set_state(key, MenuState.path)
+
+    sections = [key for key in data if not key.startswith("_")]
+    counter = itertools.count()
+
+    async def dispatch():
+        i = next(counter)
+        user = {"id": users[i], "is_bot": False, "first_name": "Механик"}
+        update = Update.model_validate({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": int(time.time()),
+                "chat": {"id": users[i], "type": "private"},
+                "from": user,
+                "text": sections[i % len(sections)],
+            },
+        }, context={"bot": app.bot})
+        await app.dp.feed_update(app.bot, update)
+
+    case.op = dispatch
+    return case, session
+
+
+# === Измерение ===
+async def measure(case: Case) -> dict:
+    run_async = inspect.iscoroutinefunction(case.op)
+    op = case.op
+
+    # Прогрев и пиковая память — отдельным прогоном
+    gc.collect()
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    for _ in range(case.memory_ops):
+        if run_async:
+            await op()
+        else:
+            op()
+    peak = tracemalloc.get_traced_memory()[1] - start_memory
+    tracemalloc.stop()
+
+    clock = time.perf_counter_ns
+    result = {"ops": case.ops, "ops_per_sec": 0.0, "p50_us": float("inf"), "p99_us": float("inf")}
+    for _ in range(REPEAT):
+        gc.collect()
+        samples = []
+        started = clock()
+        for _ in range(case.ops):
+            t = clock()
+            if run_async:
+                await op()
+            else:
+                op()
+            samples.append(clock() - t)
+        total = clock() - started
+
+        samples.sort()
+        result["ops_per_sec"] = max(result["ops_per_sec"], case.ops / (total / 1e9))
+        result["p50_us"] = min(result["p50_us"], samples[len(samples) // 2] / 1000)
+        result["p99_us"] = min(result["p99_us"], samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000)
+    return {
+        **result,
+        "peak_kb": peak / 1024,
+    }
+
+
+# === База для сравнения ===
+def load_baseline(path: Path, params: dict) -> dict:
+    if not path.exists():
+        print(f"ℹ️ {path.name} нет — сравнивать не с чем (--save-baseline, чтобы сохранить)\n")
+        return {}
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("params") != params:
+        print(f"⚠️ {path.name} снята с другими параметрами {baseline.get('params')} — сравнение пропущено\n")
+        return {}
+    return baseline.get("cases", {})
+
+
+def regressions(result: dict, base: dict, threshold: float) -> list[str]:
+    found = []
+    if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+        found.append(f"оп/с {base['ops_per_sec']:.0f} → {result['ops_per_sec']:.0f}")
+    if result["p99_us"] > base["p99_us"] * (1 + threshold):
+        found.append(f"p99 {base['p99_us']:.1f} → {result['p99_us']:.1f} мкс")
+    if (result["peak_kb"] > base["peak_kb"] * (1 + threshold)
+            and result["peak_kb"] - base["peak_kb"] > MEMORY_SLACK_KB):
+        found.append(f"память {base['peak_kb']:.0f} → {result['peak_kb']:.0f} КБ")
+    return found
+
+
+def save_baseline(path: Path, params: dict, results: dict):
+    cases = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("params") == params:
+            cases = previous.get("cases", {})  # --only обновляет только свои кейсы
+    cases.update({
+        name: {key: round(value, 2) for key, value in result.items()}
+        for name, result in results.items()
+    })
+    baseline = {
+        "params": params,
+        "machine": f"{platform.python_implementation()} {platform.python_version()}, {platform.machine()}",
+        "saved": datetime.now().isoformat(timespec="seconds"),
+        "cases": dict(sorted(cases.items())),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"\n💾 База сохранена: {path}")
+
+
+# === Запуск ===
+async def run(args) -> int:
+    only = set(args.only.split(",")) if args.only else None
+    params = {"copies": args.copies, "users": args.users, "scale": args.scale}
+
+    docs_path = WORKDIR / "data.json"
+    data = fixtures.write_docs(docs_path, args.copies)
+    users = fixtures.write_users(args.users)
+    app.database.start()
+    app.storage.start()
+    if await docs.reload(docs_path) is None:
+        raise RuntimeError("❌ Не удалось загрузить сгенерированный data.json")
+    print(
+        f"data.json: {docs_path.stat().st_size / 2**20:.1f} МБ, записей {len(docs.current().flat)}; "
+        f"пользователей: {len(users)}\n"
+    )
+    baseline = load_baseline(args.baseline, params)
+
+    cases = [*docs_cases(data, args.scale), flood_case(args.scale), *users_cases(args.users, args.scale)]
+    dispatch = session = None
+    if only is None or "dispatch" in only:
+        dispatch, session = await dispatch_case(data, users, args.scale)
+        cases.append(dispatch)
+    if only is not None:
+        unknown = only - {case.name for case in cases}
+        if unknown:
+            raise ValueError(f"❌ Неизвестные кейсы: {', '.join(sorted(unknown))}")
+        cases = [case for case in cases if case.name in only]
+
+    print(f"{'кейс':<18}{'оп/с':>12}{'p50, мкс':>12}{'p99, мкс':>12}{'память, КБ':>13}{'к базе':>9}")
+    results = {}
+    failed = []
+    for case in cases:
+        result = results[case.name] = await measure(case)
+        base = baseline.get(case.name)
+        change = f"{result['ops_per_sec'] / base['ops_per_sec'] - 1:+.0%}" if base else "—"
+        problems = regressions(result, base, args.threshold) if base else []
+        print(
+            f"{case.name:<18}{result['ops_per_sec']:>12.1f}{result['p50_us']:>12.1f}"
+            f"{result['p99_us']:>12.1f}{result['peak_kb']:>13.0f}{change:>9}{'  ⚠️' if problems else ''}"
+        )
+        failed.extend(f"{case.name}: {problem}" for problem in problems)
+
+    if dispatch is not None:
+        # Без ответов бот свернул не туда, и замер ничего не значит
+        if session.calls["sendMessage"] < dispatch.calls:
+            raise RuntimeError(f"❌ dispatch: ответов {session.calls['sendMessage']} из {dispatch.calls}")
+
+    await app.storage.close()
+    await app.stop_services()
+
+    if args.save_baseline:
+        save_baseline(args.baseline, params, results)
+    elif failed:
+        print(f"\n❌ Регрессии (порог {args.threshold:.0%}):")
+        for line in failed:
+            print(f"  • {line}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=100, help="во сколько раз увеличить data.json")
+    parser.add_argument("--users", type=int, default=20000, help="пользователей в синтетической базе")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель числа операций в кейсах")
+    parser.add_argument("--only", help="кейсы через запятую")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат как новую базу")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+    args.baseline = CWD / args.baseline
+
+    # Бот пишет в лог каждую загрузку и синхронизацию — в таблице это лишнее
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        code = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
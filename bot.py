@@ -1,13 +1,15 @@
 import asyncio
 import logging
 import os
+import signal
 import sys
 from pathlib import Path
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from config import (
     BOT_TOKEN,
@@ -15,7 +17,26 @@ from config import (
     FLOOD_LIMIT,
     FLOOD_PERIOD,
     FLOOD_BLOCK_TIME,
+    FLOOD_PERSIST_BLOCKS,
     AUTHORIZED_NUMBERS,
+    DOCS_WATCH_INTERVAL,
+    FSM_CACHE_SIZE,
+    FSM_FLUSH_INTERVAL,
+    FSM_SESSION_TTL,
+    BOT_MODE,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONCURRENCY,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_DRAIN_TIMEOUT,
+    WORKERS,
+    OUTBOUND_RATE,
+    METRICS_HOST,
+    METRICS_PORT,
+    TELEGRAM_API_URL,
 )
 
 if os.getenv("RUN_IN_DOCKER") != "1":
@@ -23,20 +44,35 @@ if os.getenv("RUN_IN_DOCKER") != "1":
     sys.exit(1)
 
 # Инициализация базы данных и функций
-from db import init_db, clear_blocks, remove_expired_blocks
-from utils import DATA_JSON, FLAT_DATA  # Только глобальные переменные
+import db
+from db import init_db
+from db_async import database, remove_revoked_users
+from services import docs
+from services.blocks import reload_blocks
+from services.scheduler import scheduler
+from services.audit import audit
+from services.notifier import notifier
+from services.outbound import outbound
+from services.chat_cleanup import chat_cleanup
+from services.fsm_storage import SQLiteStorage
+from services.webhook import WebhookServer
+from services.sharding import WorkerPool, ShardForwarder, worker_index
+from services.stats import stats, ApiTimer
+from services.hashing import hasher
+from services.auth_cache import auth_cache
 
 # Подключение роутеров
 from handlers.menu import (
     router as menu_router,
     register_bot_instance,
-    on_startup,
-    read_json,
-    flatten_json
+    register_storage,
+    mark_active
 )
 
 from handlers.admin import router as admin_router  # Новый хендлер
 from middlewares.flood_control import FloodControlMiddleware
+from middlewares.instrumentation import UpdateTimingMiddleware, HandlerNameMiddleware
+from middlewares.activity import ActivityMiddleware
 
 # === Логирование ===
 LOG_FILE = "bot.log"
@@ -59,79 +95,203 @@ if not BOT_TOKEN:
     sys.exit(1)
 
 # === Инициализация бота и диспетчера ===
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+api_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=api_session, default=DefaultBotProperties(parse_mode="HTML"))
+if TELEGRAM_API_URL:
+    logger.info(f"🔌 Bot API: {TELEGRAM_API_URL}")
+# Все исходящие сообщения — через очередь с лимитами Telegram и приоритетами
+bot.session.middleware(ApiTimer())  # Первым: время API считается вместе с ожиданием лимитов
+bot.session.middleware(outbound)
+bot.session.middleware(chat_cleanup)  # Запоминает id отправленных сообщений для /start
+chat_cleanup.bind(bot)
 register_bot_instance(bot)
+notifier.bind(bot)  # Уведомления админам — в фоне, с учётом лимитов Telegram
 
-storage = MemoryStorage()  # TODO: заменить на PostgreSQLStorage в будущем
+# Состояния переживают перезапуск; в памяти — только активные сессии
+storage = SQLiteStorage(
+    cache_size=FSM_CACHE_SIZE,
+    flush_interval=FSM_FLUSH_INTERVAL,
+    session_ttl=FSM_SESSION_TTL
+)
 dp = Dispatcher(storage=storage)
-dp.startup.register(on_startup)
+register_storage(storage)
 
 # === Подключение middleware и роутеров ===
-dp.message.middleware(
-    FloodControlMiddleware(
-        limit=FLOOD_LIMIT,
-        period=FLOOD_PERIOD,
-        block_time=FLOOD_BLOCK_TIME,
-        admin_ids=ADMIN_IDS
-    )
+flood_control = FloodControlMiddleware(
+    limit=FLOOD_LIMIT,
+    period=FLOOD_PERIOD,
+    block_time=FLOOD_BLOCK_TIME,
+    admin_ids=ADMIN_IDS,
+    persist_blocks=FLOOD_PERSIST_BLOCKS
 )
+# Один экземпляр на сообщения и inline-кнопки — общий лимит на пользователя
+dp.message.middleware(flood_control)
+dp.callback_query.middleware(flood_control)
+# Действия авторизованных переносят выход по неактивности
+activity = ActivityMiddleware(mark_active)
+dp.message.middleware(activity)
+dp.callback_query.middleware(activity)
+# Время обработки по хендлерам и состояниям: /stats и /metrics
+dp.update.outer_middleware(UpdateTimingMiddleware())
+handler_names = HandlerNameMiddleware()
+dp.message.middleware(handler_names)
+dp.callback_query.middleware(handler_names)
 dp.include_router(menu_router)
 dp.include_router(admin_router)  # Подключаем /users
 
-# === Фоновая задача: очистка блокировок ===
-async def cleanup_expired_blocks():
-    while True:
-        try:
-            remove_expired_blocks()
-        except Exception as e:
-            logger.exception(f"❌ Ошибка при удалении просроченных блокировок: {e}")
-        await asyncio.sleep(300)
+# === Метрики сервисов ===
+stats.register("hasher", hasher.metrics)
+stats.register("auth_cache", auth_cache.metrics)
+stats.register("database", database.metrics)
+stats.register("fsm", storage.metrics)
+stats.register("flood", flood_control.metrics)
+stats.register("scheduler", scheduler.metrics)
+stats.register("audit", audit.metrics)
+stats.register("notifier", notifier.metrics)
+stats.register("outbound", outbound.metrics)
+stats.register("cleanup", chat_cleanup.metrics)
 
-# === Основная логика ===
-async def main():
-    init_db() # Инициализация базы
+# === Получение апдейтов ===
+async def run_polling(dispatcher: Dispatcher):
+    # Webhook от прошлого запуска мешает getUpdates; накопленные апдейты сохраняются
+    await bot.delete_webhook()
+    await dispatcher.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+
+async def run_webhook(dispatcher: Dispatcher):
+    server = WebhookServer(
+        dispatcher, bot,
+        path=WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET,
+        max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dispatcher.emit_startup(bot=bot)
+    await server.start(WEBHOOK_HOST, WEBHOOK_PORT)
+    # Сервер уже слушает — первые апдейты есть кому принять
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info(f"🌐 Webhook установлен: {WEBHOOK_BASE_URL}{WEBHOOK_PATH}")
+    try:
+        await stop.wait()
+    finally:
+        # Webhook не снимаем: пока бот перезапускается, апдейты копит Telegram
+        await server.close()
+        await dispatcher.emit_shutdown(bot=bot)
+
+
+async def receive_updates(dispatcher: Dispatcher):
+    if BOT_MODE == "webhook":
+        await run_webhook(dispatcher)
+    else:
+        await run_polling(dispatcher)
+
+
+# === Запуск и остановка сервисов ===
+async def start_services():
+    if worker_index() is None:
+        init_db() # Инициализация базы; в режиме воркеров — один раз во фронте до fork
+    database.start()
+    storage.start()
     from config import get_authorized_numbers
-    from db import remove_revoked_users
 
     AUTHORIZED_NUMBERS = get_authorized_numbers()
-    removed_users = remove_revoked_users(AUTHORIZED_NUMBERS)
+    removed_users = await remove_revoked_users(AUTHORIZED_NUMBERS)
     if removed_users:
         for uid, num in removed_users:
             logger.info(f"🗑 Удалён пользователь {uid} с табельным номером {num} (удалён из .env)")
 
-    clear_blocks()    # Чистим старые блокировки при старте
-    asyncio.create_task(cleanup_expired_blocks())  # Фон. задача
+    await reload_blocks()    # Сроки блокировок — в планировщик, истёкшие снимаются сразу
+    await flood_control.restore_blocks()
 
     # Загрузка документации
-    data_path = Path(__file__).parent / "data.json"
-    try:
-        loaded = await read_json(data_path)
-        if not loaded:
-            logger.critical("❌ Ошибка загрузки data.json. Завершаем.")
-            sys.exit(1)
-
-        DATA_JSON.clear()
-        DATA_JSON.update(loaded)
-        FLAT_DATA.clear()
-        FLAT_DATA.extend(flatten_json(DATA_JSON))
-        logger.info(f"📥 Загружено {len(FLAT_DATA)} записей из документации")
-    except Exception as e:
-        logger.exception(f"❌ Ошибка при чтении data.json: {e}")
+    if await docs.reload() is None:
+        logger.critical("❌ Ошибка загрузки data.json. Завершаем.")
         sys.exit(1)
 
+    if DOCS_WATCH_INTERVAL:
+        asyncio.create_task(docs.watch(DOCS_WATCH_INTERVAL))  # Подхват правок data.json без перезапуска
+
     logger.info(f"✅ Авторизованные номера загружены: {len(AUTHORIZED_NUMBERS)}")
 
+    if METRICS_PORT:
+        await stats.start_server(METRICS_HOST, METRICS_PORT + (worker_index() or 0))
+
+
+async def stop_services():
+    await notifier.close()  # Дослать уведомления, пока сессия открыта
+    await chat_cleanup.close()
+    await stats.close()
+    await bot.session.close()
+    logger.info("🔒 Сессия Telegram API закрыта")
+    await scheduler.close()
+    await audit.close()
+    await storage.close()  # Дописать отложенные состояния FSM, пока база открыта
+    await database.close()
+
+
+# === Основная логика ===
+async def main():
+    await start_services()
     try:
-        logger.info("🚀 Бот запущен!")
-        await dp.start_polling(bot)
+        logger.info(f"🚀 Бот запущен! Режим: {BOT_MODE}")
+        await receive_updates(dp)
     finally:
+        await stop_services()
+
+
+# === Несколько процессов (WORKERS > 1) ===
+async def worker_main(worker):
+    db.reopen()
+    audit.suffix = f".w{worker.index}"
+    await start_services()
+    try:
+        logger.info(f"🧩 Воркер {worker.index} готов")
+        await worker.serve(dp, bot)
+    finally:
+        await stop_services()
+
+
+async def front_main(pool: WorkerPool):
+    # Фронт только принимает апдейты и раздаёт их воркерам
+    front = Dispatcher()
+    front.update.outer_middleware(ShardForwarder(pool))
+    try:
+        logger.info(f"🚀 Бот запущен! Режим: {BOT_MODE}, воркеров: {WORKERS}")
+        await receive_updates(front)
+    finally:
+        await pool.close()
         await bot.session.close()
-        logger.info("🔒 Сессия Telegram API закрыта")
+
+
+def run_sharded():
+    # Общий лимит Telegram на бот делится между воркерами
+    outbound.set_rate(OUTBOUND_RATE / WORKERS)
+    # Миграции — один раз, а не наперегонки в каждом воркере. Фронту база
+    # не нужна: закрываем соединение, чтобы через fork не ушло ни одного
+    init_db()
+    db.conn.close()
+    pool = WorkerPool(WORKERS)
+    pool.start(worker_main)  # fork — до запуска цикла событий
+    asyncio.run(front_main(pool))
+
 
 # === Точка входа ===
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if WORKERS > 1:
+            run_sharded()
+        else:
+            asyncio.run(main())
     except asyncio.CancelledError:
         logger.info("🛑 Остановка по CancelledError — graceful shutdown.")
     except KeyboardInterrupt:
@@ -0,0 +1,16 @@
+# compile_docs.py — собирает бинарный снимок data.json заранее,
+# чтобы бот при запуске не разбирал JSON и не строил индексы
+import sys
+from pathlib import Path
+
+from config import DATA_PATH, SNAPSHOT_PATH
+from services.docs import build_snapshot
+
+source = Path(sys.argv[1]) if len(sys.argv) > 1 else DATA_PATH
+target = Path(sys.argv[2]) if len(sys.argv) > 2 else SNAPSHOT_PATH
+
+snapshot = build_snapshot(source, snapshot_path=target)
+print(
+    f"✅ {target.name}: {len(snapshot.flat)} записей, {len(snapshot.menu)} узлов меню "
+    f"({snapshot.source}, {snapshot.build_time * 1000:.0f} мс)"
+)
@@ -1,12 +1,17 @@
 import os
+import re
 import logging
+import secrets
 from pathlib import Path
 from dotenv import load_dotenv
 
 # === Пути ===
 BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "users.db"
 load_dotenv(dotenv_path=BASE_DIR / ".env")
+# Относительный путь — от корня проекта; бенчмарки подставляют временную базу
+DB_PATH = BASE_DIR / os.getenv("DB_PATH", "users.db")
+DATA_PATH = BASE_DIR / "data.json"
+SNAPSHOT_PATH = BASE_DIR / "data.snapshot"
 
 # === Логгер ===
 logger = logging.getLogger(__name__)
@@ -32,6 +37,13 @@ if not BOT_TOKEN:
 if not BOT_TOKEN.startswith(("5", "6", "1")):  # просто как базовая проверка
     logger.warning("⚠️ BOT_TOKEN выглядит подозрительно. Проверь значение в .env")
 
+# === Ключ для поиска по табельному номеру (HMAC) ===
+# Обязателен и не должен меняться: ключи в users.number_digest считаются
+# с ним, при смене ни один не совпадёт и remove_revoked_users удалит всех
+NUMBER_PEPPER = os.getenv("NUMBER_PEPPER")
+if not NUMBER_PEPPER:
+    raise ValueError("❌ NUMBER_PEPPER не найден в .env! Задайте постоянный секрет (до этого использовался BOT_TOKEN)")
+
 # === Админы ===
 ADMIN_IDS = []
 for admin in os.getenv("ADMINS", "").split(","):
@@ -63,6 +75,10 @@ if FLOOD_PERIOD <= 0:
 if FLOOD_BLOCK_TIME < 0:
     raise ValueError("❌ FLOOD_BLOCK_TIME не может быть отрицательным")
 
+# Записывать блокировки антифлуда в blocked_users: переживают перезапуск
+# и на это время закрывают вход и админ-команды
+FLOOD_PERSIST_BLOCKS = os.getenv("FLOOD_PERSIST_BLOCKS", "0").strip() != "0"
+
 # === Блокировка при ошибках авторизации ===
 try:
     BLOCK_DURATION = int(os.getenv("BLOCK_DURATION", 300))
@@ -72,5 +88,217 @@ except ValueError:
 if BLOCK_DURATION < 10:
     logger.warning("⚠️ BLOCK_DURATION слишком мал. Рекомендуется >= 60 секунд")
 
+# === Кэш авторизации ===
+try:
+    AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 300))
+    AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+except ValueError:
+    raise ValueError("❌ AUTH_CACHE_TTL и AUTH_CACHE_SIZE должны быть числами")
+
+if AUTH_CACHE_TTL < 0:
+    raise ValueError("❌ AUTH_CACHE_TTL не может быть отрицательным")
+
+if AUTH_CACHE_SIZE <= 0:
+    raise ValueError("❌ AUTH_CACHE_SIZE должен быть больше 0")
+
+# === Хеширование (bcrypt) ===
+try:
+    HASH_WORKERS = int(os.getenv("HASH_WORKERS", 2))
+    HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", 100))
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках хеширования: {e}")
+
+if HASH_WORKERS <= 0:
+    raise ValueError("❌ HASH_WORKERS должен быть больше 0")
+
+if HASH_QUEUE_LIMIT < 0:
+    raise ValueError("❌ HASH_QUEUE_LIMIT не может быть отрицательным")
+
+# === Документация ===
+try:
+    DOCS_WATCH_INTERVAL = float(os.getenv("DOCS_WATCH_INTERVAL", 5))
+except ValueError:
+    raise ValueError("❌ DOCS_WATCH_INTERVAL должен быть числом")
+
+if DOCS_WATCH_INTERVAL < 0:
+    raise ValueError("❌ DOCS_WATCH_INTERVAL не может быть отрицательным (0 — отключить)")
+
+# Бинарный снимок data.json рядом с исходником; 0 — всегда собирать из JSON
+DOCS_SNAPSHOT = os.getenv("DOCS_SNAPSHOT", "1").strip() != "0"
+
+# === Поиск ===
+# index — n-граммный индекс в памяти, fts — SQLite FTS5 с ранжированием bm25
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "index").strip().lower()
+if SEARCH_BACKEND not in ("index", "fts"):
+    raise ValueError("❌ SEARCH_BACKEND должен быть index или fts")
+
 # === БД ===
 DB_FILE = os.getenv("DB_FILE", "bot_data.db")
+
+try:
+    DB_READERS = int(os.getenv("DB_READERS", 2))
+    DB_COMMIT_WINDOW_MS = float(os.getenv("DB_COMMIT_WINDOW_MS", 2))
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках БД: {e}")
+
+if DB_READERS <= 0:
+    raise ValueError("❌ DB_READERS должен быть больше 0")
+
+if DB_COMMIT_WINDOW_MS < 0:
+    raise ValueError("❌ DB_COMMIT_WINDOW_MS не может быть отрицательным")
+
+# === Состояния FSM ===
+try:
+    FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 5000))
+    FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 1))
+    FSM_SESSION_TTL = float(os.getenv("FSM_SESSION_TTL", 30 * 24 * 3600))
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках FSM: {e}")
+
+if FSM_CACHE_SIZE <= 0:
+    raise ValueError("❌ FSM_CACHE_SIZE должен быть больше 0")
+
+if FSM_FLUSH_INTERVAL <= 0:
+    raise ValueError("❌ FSM_FLUSH_INTERVAL должен быть больше 0")
+
+if FSM_SESSION_TTL < 0:
+    raise ValueError("❌ FSM_SESSION_TTL не может быть отрицательным (0 — хранить всегда)")
+
+# === Журнал аудита ===
+AUDIT_DIR = BASE_DIR / os.getenv("AUDIT_DIR", "audit")
+
+try:
+    AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", 10 * 1024 * 1024))
+    AUDIT_BACKUPS = int(os.getenv("AUDIT_BACKUPS", 5))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 0.5))
+    AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", 365))
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках журнала аудита: {e}")
+
+if AUDIT_MAX_BYTES <= 0:
+    raise ValueError("❌ AUDIT_MAX_BYTES должен быть больше 0")
+
+if AUDIT_BACKUPS < 0:
+    raise ValueError("❌ AUDIT_BACKUPS не может быть отрицательным")
+
+if AUDIT_FLUSH_INTERVAL < 0:
+    raise ValueError("❌ AUDIT_FLUSH_INTERVAL не может быть отрицательным")
+
+if AUDIT_RETENTION_DAYS < 0:
+    raise ValueError("❌ AUDIT_RETENTION_DAYS не может быть отрицательным (0 — хранить всё)")
+
+# === Исходящие сообщения (лимиты Telegram) ===
+try:
+    OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", 25))                # сообщений в секунду на весь бот
+    OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))       # сообщений в секунду в один чат
+    OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", 3))     # сколько можно отправить в чат подряд
+    OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 2))     # повторов после 429
+    OUTBOUND_MAX_RETRY_WAIT = float(os.getenv("OUTBOUND_MAX_RETRY_WAIT", 10))  # дольше retry_after не ждём
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках исходящих сообщений: {e}")
+
+if OUTBOUND_RATE <= 0:
+    raise ValueError("❌ OUTBOUND_RATE должен быть больше 0")
+
+if OUTBOUND_CHAT_RATE <= 0:
+    raise ValueError("❌ OUTBOUND_CHAT_RATE должен быть больше 0")
+
+if OUTBOUND_CHAT_BURST < 1:
+    raise ValueError("❌ OUTBOUND_CHAT_BURST должен быть не меньше 1")
+
+if OUTBOUND_MAX_RETRIES < 0:
+    raise ValueError("❌ OUTBOUND_MAX_RETRIES не может быть отрицательным")
+
+if OUTBOUND_MAX_RETRY_WAIT < 0:
+    raise ValueError("❌ OUTBOUND_MAX_RETRY_WAIT не может быть отрицательным")
+
+# === Уведомления админам ===
+try:
+    NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 5))
+    NOTIFY_MAX_PENDING = int(os.getenv("NOTIFY_MAX_PENDING", 100))       # очередь на один чат
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках уведомлений: {e}")
+
+if NOTIFY_MAX_RETRIES < 0:
+    raise ValueError("❌ NOTIFY_MAX_RETRIES не может быть отрицательным")
+
+if NOTIFY_MAX_PENDING <= 0:
+    raise ValueError("❌ NOTIFY_MAX_PENDING должен быть больше 0")
+
+# === Очистка чата по /start ===
+try:
+    CLEANUP_MAX_MESSAGES = int(os.getenv("CLEANUP_MAX_MESSAGES", 500))  # не больше стольких сообщений назад
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках очистки чата: {e}")
+
+if CLEANUP_MAX_MESSAGES < 0:
+    raise ValueError("❌ CLEANUP_MAX_MESSAGES не может быть отрицательным (0 — не чистить)")
+
+# === Сервер Bot API ===
+# Свой сервер (telegram-bot-api или фейковый из benchmarks/) вместо api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip().rstrip("/")
+
+if TELEGRAM_API_URL and not TELEGRAM_API_URL.startswith(("http://", "https://")):
+    raise ValueError("❌ TELEGRAM_API_URL должен начинаться с http:// или https://")
+
+# === Получение апдейтов: polling или webhook ===
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").strip().rstrip("/")  # https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook").strip()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0").strip()
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+
+try:
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+    WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 100))  # апдейтов в обработке одновременно
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))   # соединений от Telegram (1–100)
+    WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 10))
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройках webhook: {e}")
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("❌ BOT_MODE должен быть polling или webhook")
+
+if BOT_MODE == "webhook" and not WEBHOOK_BASE_URL:
+    raise ValueError("❌ Для BOT_MODE=webhook укажите WEBHOOK_BASE_URL")
+
+if WEBHOOK_SECRET and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+    raise ValueError("❌ WEBHOOK_SECRET: 1–256 символов A-Z, a-z, 0-9, _ и -")
+
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    # Без секрета любой, кто достучится до порта, подделает апдейт от имени админа.
+    # Случайный секрет уходит в set_webhook при каждом запуске
+    WEBHOOK_SECRET = secrets.token_urlsafe(32)
+    logger.warning("⚠️ WEBHOOK_SECRET не задан — сгенерирован случайный на этот запуск")
+
+if not WEBHOOK_PATH.startswith("/"):
+    raise ValueError("❌ WEBHOOK_PATH должен начинаться с /")
+
+if WEBHOOK_MAX_CONCURRENCY <= 0:
+    raise ValueError("❌ WEBHOOK_MAX_CONCURRENCY должен быть больше 0")
+
+if not 1 <= WEBHOOK_MAX_CONNECTIONS <= 100:
+    raise ValueError("❌ WEBHOOK_MAX_CONNECTIONS должен быть от 1 до 100")
+
+if WEBHOOK_DRAIN_TIMEOUT < 0:
+    raise ValueError("❌ WEBHOOK_DRAIN_TIMEOUT не может быть отрицательным")
+
+# === Несколько процессов ===
+try:
+    WORKERS = int(os.getenv("WORKERS", 1))  # 1 — один процесс, как раньше
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройке WORKERS: {e}")
+
+if WORKERS <= 0:
+    raise ValueError("❌ WORKERS должен быть больше 0")
+
+# === Метрики ===
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip()
+
+try:
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # 0 — без HTTP; у воркеров порт + номер воркера
+except ValueError as e:
+    raise ValueError(f"❌ Ошибка в настройке METRICS_PORT: {e}")
+
+if METRICS_PORT < 0:
+    raise ValueError("❌ METRICS_PORT не может быть отрицательным")
@@ -1,11 +1,19 @@
+import csv
 import sqlite3
 from datetime import datetime
 import os
+import re
+import json
+import hmac
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import openpyxl
 from openpyxl.utils import get_column_letter
 import bcrypt
-from config import DB_PATH
+from config import DB_PATH, NUMBER_PEPPER, get_authorized_numbers
+from services.hashing import hasher
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -14,17 +22,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__) # Тоже корневой логгер
 
 # Подключение SQLite
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+
+def reopen():
+    # Соединение SQLite нельзя переносить через fork: воркер открывает своё
+    global conn
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+
+# Потоки AsyncDatabase (db_async.py) подставляют сюда собственные соединения,
+# поэтому одни и те же функции работают и синхронно, и из пула
+_local = threading.local()
+
+def _connection():
+    return getattr(_local, "conn", None) or conn
+
+def _commit():
+    # Писатель AsyncDatabase фиксирует транзакции пачками сам
+    if not getattr(_local, "batch", False):
+        _connection().commit()
+
+# Подписчики на изменения пользователей и блокировок (кэш авторизации).
+# user_id=None — изменилось сразу много записей.
+_change_hooks = []
+
+def on_user_change(hook):
+    _change_hooks.append(hook)
+
+def _notify(user_id):
+    for hook in _change_hooks:
+        try:
+            hook(user_id)
+        except Exception as e:
+            logging.error(f"[CHANGE HOOK] {e}")
+
+def _changed(user_id=None):
+    # В пачке писателя уведомляем только после COMMIT — см. flush_changes
+    if getattr(_local, "batch", False):
+        _local.pending.append(user_id)
+    else:
+        _notify(user_id)
+
+def flush_changes():
+    pending = getattr(_local, "pending", None)
+    if not pending:
+        return
+    _local.pending = []
+    for user_id in dict.fromkeys(pending):
+        _notify(user_id)
 
 # Авторизованные номера и админы (из ENV)
 AUTHORIZED_NUMBERS = set(num.strip() for num in (os.getenv("AUTHORIZED_NUMBERS") or "").split(",") if num.strip())
 ADMIN_IDS = set(admin.strip() for admin in (os.getenv("ADMINS") or "").split(",") if admin.strip())
 
+# Детерминированный ключ табельного номера: bcrypt с солью нельзя искать
+# по индексу, HMAC с секретом — можно, и без секрета номер из него не подобрать
+def number_digest(number: str) -> str:
+    return hmac.new(NUMBER_PEPPER.encode(), number.strip().encode(), hashlib.sha256).hexdigest()
+
+def _match_number(hashed_number, numbers):
+    for number in numbers:
+        if bcrypt.checkpw(number.encode(), hashed_number.encode()):
+            return number
+    return None
+
 # Миграции
 def migrate_users_table():
     expected_columns = {
         "telegram_id": "TEXT PRIMARY KEY",
         "number": "TEXT NOT NULL",
+        "number_digest": "TEXT",
         "full_name": "TEXT",
         "role": "TEXT DEFAULT 'user'",
         "auth_time": "TEXT",
@@ -39,6 +105,37 @@ def migrate_users_table():
             logging.warning(f"[MIGRATION] Добавление колонки users.{col}")
             cursor.execute(f"ALTER TABLE users ADD COLUMN {col} {definition}")
 
+    backfill_number_digests(get_authorized_numbers())
+
+def backfill_number_digests(authorized_numbers):
+    # Для старых строк номер известен только как bcrypt-хеш: один раз
+    # сверяем его с разрешёнными номерами. Не совпавшие строки остаются
+    # без ключа и удаляются в remove_revoked_users.
+    cursor = conn.cursor()
+    cursor.execute("SELECT telegram_id, number FROM users WHERE number_digest IS NULL ORDER BY auth_time DESC")
+    rows = cursor.fetchall()
+    if not rows:
+        return
+
+    logging.warning(f"[MIGRATION] Заполнение users.number_digest для {len(rows)} строк")
+    cursor.execute("SELECT number_digest FROM users WHERE number_digest IS NOT NULL")
+    taken = {digest for (digest,) in cursor.fetchall()}
+    numbers = sorted(authorized_numbers)
+
+    with ThreadPoolExecutor(max_workers=hasher.workers) as pool:
+        matches = pool.map(lambda row: _match_number(row[1], numbers), rows)
+        for (user_id, _), number in zip(rows, matches):
+            if number is None:
+                continue
+            digest = number_digest(number)
+            if digest in taken:
+                # Номер уже привязан к более свежей записи
+                logging.warning(f"[MIGRATION] Повтор табельного номера у {user_id} — ключ не назначен")
+                continue
+            taken.add(digest)
+            cursor.execute("UPDATE users SET number_digest = ? WHERE telegram_id = ?", (digest, user_id))
+    conn.commit()
+
 def migrate_documents_table():
     expected_columns = {"title", "description", "revision", "updated_at", "path"}
     try:
@@ -53,37 +150,40 @@ def migrate_documents_table():
 
 
 def remove_user(telegram_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = _connection().cursor()
     cur.execute("DELETE FROM users WHERE telegram_id = ?", (telegram_id,))
-    conn.commit()
-    conn.close()
+    _commit()
+    _changed(telegram_id)
 
 def remove_revoked_users(authorized_numbers: set[str]):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT telegram_id, number FROM users")
+    cur = _connection().cursor()
+    cur.execute("SELECT telegram_id, number, number_digest FROM users")
     users = cur.fetchall()
 
+    allowed = {number_digest(number) for number in authorized_numbers}
     removed = []
-    for user_id, number in users:
-        if number not in authorized_numbers:
+    for user_id, number, digest in users:
+        if digest not in allowed:
             cur.execute("DELETE FROM users WHERE telegram_id = ?", (user_id,))
             removed.append((user_id, number))
 
-    conn.commit()
-    conn.close()
-
+    _commit()
+    for user_id, _ in removed:
+        _changed(user_id)
     return removed
 
 # Инициализация базы
 def init_db():
     cursor = conn.cursor()
+    # WAL: читатели не ждут писателя, fsync только на чекпоинтах
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
 
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             telegram_id TEXT PRIMARY KEY,
             number TEXT NOT NULL,
+            number_digest TEXT,
             full_name TEXT,
             role TEXT DEFAULT 'user',
             auth_time TEXT,
@@ -106,33 +206,68 @@ def init_db():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS blocked_users (
             user_id INTEGER PRIMARY KEY,
-            unblock_time INTEGER
+            unblock_time INTEGER,
+            reason TEXT
         )
     ''')
+    cursor.execute("PRAGMA table_info(blocked_users)")
+    if "reason" not in {col[1] for col in cursor.fetchall()}:
+        logging.warning("[MIGRATION] Добавление колонки blocked_users.reason")
+        cursor.execute("ALTER TABLE blocked_users ADD COLUMN reason TEXT")
+
+    # Состояния FSM: ключ bot:chat:user:thread:destiny, data — компактный JSON
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER
+        ) WITHOUT ROWID
+    ''')
 
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_number ON users (number);")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_number_digest ON users (number_digest);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm_states (updated_at);")
 
     conn.commit()
     logging.info("✅ База данных успешно инициализирована.")
 
 # --- Пользователи ---
+NUMBER_TAKEN_ERROR = "⚠️ Этот табельный номер уже привязан к другому пользователю."
+
 def add_user(user_id, number, full_name, role="user"):
+    # Синхронный вариант для admin_tool.py; бот ходит через db_async.add_user
     hashed_number = bcrypt.hashpw(number.encode(), bcrypt.gensalt()).decode()
-    cursor = conn.cursor()
-    cursor.execute("""
-        REPLACE INTO users (telegram_id, number, full_name, role, auth_time)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, hashed_number, full_name, role, datetime.utcnow().isoformat()))
-    conn.commit()
+    save_user(user_id, hashed_number, number_digest(number), full_name, role)
     logging.info(f"[LOGIN] {user_id=}, {number=}, {full_name=}")
 
+def save_user(user_id, hashed_number, digest, full_name, role="user"):
+    # Не REPLACE: он разрешил бы конфликт по number_digest удалением чужой
+    # строки. Занятость номера проверяет уникальный индекс, без гонок
+    cursor = _connection().cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO users (telegram_id, number, number_digest, full_name, role, auth_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (telegram_id) DO UPDATE SET
+                number = excluded.number,
+                number_digest = excluded.number_digest,
+                full_name = excluded.full_name,
+                role = excluded.role,
+                auth_time = excluded.auth_time
+        """, (user_id, hashed_number, digest, full_name, role, datetime.utcnow().isoformat()))
+    except sqlite3.IntegrityError:
+        raise ValueError(NUMBER_TAKEN_ERROR)
+    _commit()
+    _changed(user_id)
+
 def set_subscription(user_id, active=True):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("UPDATE users SET subscription_active = ? WHERE telegram_id = ?", (1 if active else 0, user_id))
-    conn.commit()
+    _commit()
 
 def get_last_users(limit=10):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("""
         SELECT telegram_id, number, full_name, auth_time
         FROM users
@@ -143,88 +278,263 @@ def get_last_users(limit=10):
 
 # --- Блокировки ---
 def add_block(user_id, unblock_time):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("INSERT OR REPLACE INTO blocked_users (user_id, unblock_time) VALUES (?, ?)", (user_id, unblock_time))
-    conn.commit()
+    _commit()
+    _changed(user_id)
+
+def extend_block(user_id, unblock_time, reason):
+    # Не укорачивает уже действующую блокировку: остаётся более поздний срок
+    cursor = _connection().cursor()
+    cursor.execute("""
+        INSERT INTO blocked_users (user_id, unblock_time, reason) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            reason = CASE WHEN excluded.unblock_time > unblock_time THEN excluded.reason ELSE reason END,
+            unblock_time = MAX(unblock_time, excluded.unblock_time)
+    """, (user_id, unblock_time, reason))
+    _commit()
+    _changed(user_id)
+
+def release_block(user_id):
+    # Снимает блокировку, только если её срок вышел; иначе возвращает новый срок
+    now = int(datetime.now().timestamp())
+    cursor = _connection().cursor()
+    cursor.execute("DELETE FROM blocked_users WHERE user_id = ? AND (unblock_time IS NULL OR unblock_time <= ?)", (user_id, now))
+    _commit()
+    if cursor.rowcount:
+        _changed(user_id)
+        return None
+    cursor.execute("SELECT unblock_time FROM blocked_users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_blocks():
+    cursor = _connection().cursor()
+    cursor.execute("SELECT user_id, unblock_time FROM blocked_users")
+    return cursor.fetchall()
+
+def get_active_blocks(reason):
+    now = int(datetime.now().timestamp())
+    cursor = _connection().cursor()
+    cursor.execute("SELECT user_id, unblock_time FROM blocked_users WHERE reason = ? AND unblock_time > ?", (reason, now))
+    return cursor.fetchall()
 
 def remove_block(user_id):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("DELETE FROM blocked_users WHERE user_id = ?", (user_id,))
-    conn.commit()
+    _commit()
+    _changed(user_id)
 
 def is_blocked(user_id):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("SELECT 1 FROM blocked_users WHERE user_id = ?", (user_id,))
     return cursor.fetchone() is not None
 
 def remove_expired_blocks():
     now = int(datetime.now().timestamp())
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("DELETE FROM blocked_users WHERE unblock_time <= ?", (now,))
-    conn.commit()
+    _commit()
+    if cursor.rowcount:
+        _changed()
 
 def clear_blocks():
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("DELETE FROM blocked_users")
-    conn.commit()
+    _commit()
+    _changed()
+
+# --- Состояния FSM ---
+def load_fsm_state(key):
+    cursor = _connection().cursor()
+    cursor.execute("SELECT state, data FROM fsm_states WHERE key = ?", (key,))
+    return cursor.fetchone()
+
+def save_fsm_states(rows):
+    # rows: (key, state, data, updated_at); пустая сессия — удаляем строку
+    cursor = _connection().cursor()
+    cursor.executemany(
+        "REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+        [row for row in rows if row[1] is not None or row[2] is not None]
+    )
+    cursor.executemany(
+        "DELETE FROM fsm_states WHERE key = ?",
+        [(row[0],) for row in rows if row[1] is None and row[2] is None]
+    )
+    _commit()
+
+def remove_idle_fsm_states(updated_before):
+    cursor = _connection().cursor()
+    cursor.execute("DELETE FROM fsm_states WHERE updated_at < ?", (updated_before,))
+    _commit()
+    return cursor.rowcount
 
 # --- Авторизация ---
 def is_authorized(user_id):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("SELECT 1 FROM users WHERE telegram_id = ?", (user_id,))
     return cursor.fetchone() is not None
 
 def get_user_role(user_id):
-    cursor = conn.cursor()
+    cursor = _connection().cursor()
     cursor.execute("SELECT role FROM users WHERE telegram_id = ?", (user_id,))
     result = cursor.fetchone()
     return result[0] if result else None
 
+def get_auth_state(user_id):
+    # (авторизован, роль, ключ номера, заблокирован) одним обращением
+    cursor = _connection().cursor()
+    cursor.execute("SELECT role, number_digest FROM users WHERE telegram_id = ?", (user_id,))
+    user = cursor.fetchone()
+    cursor.execute("SELECT 1 FROM blocked_users WHERE user_id = ?", (user_id,))
+    blocked = cursor.fetchone() is not None
+    if user is None:
+        return False, None, None, blocked
+    return True, user[0], user[1], blocked
+
+def get_number_owner(digest):
+    cursor = _connection().cursor()
+    cursor.execute("SELECT telegram_id FROM users WHERE number_digest = ?", (digest,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
 def is_number_taken(number):
-    cursor = conn.cursor()
-    cursor.execute("SELECT number FROM users")
-    for (hashed_number,) in cursor.fetchall():
-        if bcrypt.checkpw(number.encode(), hashed_number.encode()):
-            return True
-    return False
+    return get_number_owner(number_digest(number)) is not None
 
 def is_same_user(user_id, number):
-    cursor = conn.cursor()
-    cursor.execute("SELECT telegram_id, number FROM users")
-    for row_user_id, hashed_number in cursor.fetchall():
-        if bcrypt.checkpw(number.encode(), hashed_number.encode()) and str(row_user_id) == str(user_id):
-            return True
-    return False
+    cursor = _connection().cursor()
+    cursor.execute(
+        "SELECT 1 FROM users WHERE number_digest = ? AND telegram_id = ?",
+        (number_digest(number), user_id)
+    )
+    return cursor.fetchone() is not None
 
 def get_user_number(user_id: int) -> str | None:
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT number FROM users WHERE telegram_id = ?", (user_id,))
-        row = cur.fetchone()
+    cursor = _connection().cursor()
+    cursor.execute("SELECT number FROM users WHERE telegram_id = ?", (user_id,))
+    row = cursor.fetchone()
     return row[0] if row else None
 
-def export_users_to_excel(filename="users_export.xlsx"):
-    cursor = conn.cursor()
+def get_user_number_digest(user_id: int) -> str | None:
+    cursor = _connection().cursor()
+    cursor.execute("SELECT number_digest FROM users WHERE telegram_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+# --- Документация (FTS5) ---
+# Строки, синхронизированные из data.json, хранят в path JSON-список ключей.
+# Остальные строки (например, из init_db.py) синхронизация не трогает.
+_DOC_PATH_FILTER = "path LIKE '[%'"
+
+def _doc_revision(category, text):
+    return hashlib.sha1(f"{category}\x00{text}".encode()).hexdigest()
+
+def sync_documents(flat_data):
+    cursor = _connection().cursor()
+    cursor.execute(f"SELECT rowid, path, revision FROM documents WHERE {_DOC_PATH_FILTER}")
+    existing = {path: (rowid, revision) for rowid, path, revision in cursor.fetchall()}
+
+    now = datetime.utcnow().isoformat()
+    added = updated = 0
+    for entry in flat_data:
+        category = entry.category
+        path = json.dumps(entry.path, ensure_ascii=False)
+        revision = _doc_revision(category, entry.text)
+        current = existing.pop(path, None)
+        if current is None:
+            cursor.execute(
+                "INSERT INTO documents (title, description, revision, updated_at, path) VALUES (?, ?, ?, ?, ?)",
+                (category, entry.text, revision, now, path)
+            )
+            added += 1
+        elif current[1] != revision:
+            cursor.execute(
+                "UPDATE documents SET title = ?, description = ?, revision = ?, updated_at = ? WHERE rowid = ?",
+                (category, entry.text, revision, now, current[0])
+            )
+            updated += 1
+
+    # Всё, что осталось, из data.json удалено
+    cursor.executemany("DELETE FROM documents WHERE rowid = ?", [(rowid,) for rowid, _ in existing.values()])
+    _commit()
+    return added, updated, len(existing)
+
+def _fts_query(terms):
+    # Каждое слово — префиксный запрос, слова внутри термина через AND, термины через OR
+    groups = []
+    for term in terms:
+        words = re.findall(r"\w+", term.lower())
+        if words:
+            groups.append("(" + " ".join(f'"{word}"*' for word in words) + ")")
+    if not groups:
+        return None
+    return "{title description} : (" + " OR ".join(groups) + ")"
+
+def search_fts(terms, limit=100, highlight=("<b>", "</b>")):
+    query = _fts_query(terms)
+    if query is None:
+        return []
+    cursor = _connection().cursor()
+    cursor.execute(f"""
+        SELECT path, snippet(documents, -1, ?, ?, '…', 12)
+        FROM documents
+        WHERE documents MATCH ? AND {_DOC_PATH_FILTER}
+        ORDER BY bm25(documents, 5.0, 1.0, 0.0, 0.0, 0.0)
+        LIMIT ?
+    """, (highlight[0], highlight[1], query, limit))
+    return [(json.loads(path), snippet) for path, snippet in cursor.fetchall()]
+
+EXPORT_HEADERS = ["Telegram ID", "Number", "Full Name", "Role", "Auth Time", "Subscribed"]
+# По скольким первым строкам подбирается ширина столбцов xlsx
+EXPORT_WIDTH_SAMPLE = 500
+EXPORT_MAX_WIDTH = 60
+
+def write_users_export(path, fmt="xlsx"):
+    """
+    Потоково выгружает пользователей в path (xlsx или csv): строки идут
+    из курсора прямо в файл, вся таблица в памяти не собирается.
+    Возвращает число выгруженных строк.
+    """
+    cursor = _connection().cursor()
+    cursor.arraysize = 500
     cursor.execute("""
         SELECT telegram_id, number, full_name, role, auth_time, subscription_active
         FROM users
         ORDER BY auth_time DESC
     """)
-    users = cursor.fetchall()
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Users"
-
-    headers = ["Telegram ID", "Number", "Full Name", "Role", "Auth Time", "Subscribed"]
-    sheet.append(headers)
-
-    for row in users:
-        sheet.append(list(row))
-
-    for col in sheet.columns:
-        max_length = max(len(str(cell.value or "")) for cell in col)
-        sheet.column_dimensions[get_column_letter(col[0].column)].width = max_length + 2
 
-    workbook.save(filename)
-    return filename
+    if fmt == "csv":
+        # utf-8-sig — чтобы Excel открыл кириллицу без мастера импорта
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(EXPORT_HEADERS)
+            count = 0
+            while rows := cursor.fetchmany():
+                writer.writerows(rows)
+                count += len(rows)
+        return count
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Users")
+
+    # В режиме write_only ширины задаются до первой строки: считаем их
+    # по заголовку и первым строкам, остальное пишем не задерживая
+    head = cursor.fetchmany(EXPORT_WIDTH_SAMPLE)
+    widths = [len(h) for h in EXPORT_HEADERS]
+    for row in head:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(str(value or "")))
+    for i, width in enumerate(widths, start=1):
+        sheet.column_dimensions[get_column_letter(i)].width = min(width, EXPORT_MAX_WIDTH) + 2
+
+    sheet.append(EXPORT_HEADERS)
+    count = 0
+    rows = head
+    while rows:
+        for row in rows:
+            sheet.append(row)
+        count += len(rows)
+        rows = cursor.fetchmany()
+
+    workbook.save(path)
+    return count
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import db
+from config import DB_PATH, DB_READERS, DB_COMMIT_WINDOW_MS
+from services.hashing import hasher
+from services.stats import add_time
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей максимум фиксируется одним COMMIT
+MAX_BATCH = 128
+_STOP = object()
+
+
+def _open(path, **kwargs):
+    # isolation_level=None — транзакциями управляем явно;
+    # cached_statements — подготовленные выражения переиспользуются по тексту SQL
+    c = sqlite3.connect(path, check_same_thread=False, isolation_level=None, cached_statements=256, **kwargs)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA busy_timeout=5000")
+    return c
+
+
+class AsyncDatabase:
+    """
+    Асинхронный доступ к SQLite поверх синхронных функций db.py.
+
+    Все записи идут через одну очередь в поток-писатель, который собирает
+    их в пачки (group commit): задачи, пришедшие в течение окна
+    DB_COMMIT_WINDOW_MS, фиксируются одним COMMIT. Каждая задача выполняется
+    в своём SAVEPOINT, поэтому ошибка одной не откатывает соседние.
+    Чтения выполняются в небольшом пуле потоков со своими соединениями.
+    """
+
+    def __init__(self, path, readers: int = 2, commit_window: float = 0.002):
+        self.path = str(path)
+        self.readers = readers
+        self.commit_window = commit_window
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: threading.Thread | None = None
+        self._read_pool: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.commits = 0
+        self.writes = 0
+        self.reads = 0
+
+    # --- Жизненный цикл ---
+    def start(self):
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._read_pool = ThreadPoolExecutor(
+                max_workers=self.readers,
+                thread_name_prefix="db-read",
+                initializer=self._init_reader
+            )
+            self._writer = threading.Thread(target=self._writer_loop, name="db-write", daemon=True)
+            self._writer.start()
+            logger.info(f"🗄 Async DB запущена: {self.readers} читателя(ей), окно коммита {self.commit_window * 1000:.0f} мс")
+
+    async def close(self):
+        with self._lock:
+            writer, pool = self._writer, self._read_pool
+            self._writer = self._read_pool = None
+        if writer is None:
+            return
+        self._queue.put(_STOP)
+        await asyncio.to_thread(writer.join)
+        pool.shutdown(wait=True)
+        logger.info("🗄 Async DB остановлена")
+
+    def _init_reader(self):
+        c = _open(self.path)
+        c.execute("PRAGMA query_only=ON")
+        db._local.conn = c
+
+    # --- Выполнение ---
+    async def read(self, fn, *args, **kwargs):
+        self.start()
+        self.reads += 1
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._read_pool, lambda: fn(*args, **kwargs))
+        finally:
+            add_time("db", time.perf_counter() - start)
+
+    async def read_long(self, fn, *args, **kwargs):
+        """
+        Долгое чтение (выгрузка всей таблицы) — в отдельном потоке со своим
+        соединением, чтобы не занимать пул читателей: за это время через него
+        идут проверки авторизации и состояния FSM.
+        """
+        def run():
+            c = _open(self.path)
+            c.execute("PRAGMA query_only=ON")
+            db._local.conn = c
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                db._local.conn = None
+                c.close()
+
+        self.reads += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(run)
+        finally:
+            add_time("db", time.perf_counter() - start)
+
+    async def write(self, fn, *args, **kwargs):
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        start = time.perf_counter()
+        self._queue.put((loop, future, fn, args, kwargs))
+        try:
+            return await future
+        finally:
+            add_time("db", time.perf_counter() - start)
+
+    def _collect(self, first):
+        # _STOP всегда последний в пачке: после него ничего не забираем
+        batch = [first]
+        if first is _STOP:
+            return batch
+        deadline = time.monotonic() + self.commit_window
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+            if job is _STOP:
+                break
+        return batch
+
+    def _writer_loop(self):
+        c = _open(self.path)
+        db._local.conn = c
+        db._local.batch = True
+        db._local.pending = []
+        stopping = False
+
+        while not stopping:
+            batch = self._collect(self._queue.get())
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+            if not batch:
+                continue
+
+            results = []
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                for _, _, fn, args, kwargs in batch:
+                    c.execute("SAVEPOINT job")
+                    try:
+                        results.append((True, fn(*args, **kwargs)))
+                        c.execute("RELEASE job")
+                    except Exception as e:
+                        c.execute("ROLLBACK TO job")
+                        c.execute("RELEASE job")
+                        results.append((False, e))
+                c.execute("COMMIT")
+                self.commits += 1
+                self.writes += len(batch)
+            except Exception as e:
+                logger.exception(f"❌ Ошибка фиксации пачки из {len(batch)} записей: {e}")
+                if c.in_transaction:
+                    c.execute("ROLLBACK")
+                results = [(False, e)] * len(batch)
+            finally:
+                db.flush_changes()
+
+            for (loop, future, *_), (ok, value) in zip(batch, results):
+                loop.call_soon_threadsafe(_resolve, future, ok, value)
+
+        c.close()
+
+    def metrics(self) -> dict:
+        return {
+            "write_queue": self._queue.qsize(),
+            "writes": self.writes,
+            "commits": self.commits,
+            "reads": self.reads,
+        }
+
+
+def _resolve(future, ok, value):
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+database = AsyncDatabase(DB_PATH, readers=DB_READERS, commit_window=DB_COMMIT_WINDOW_MS / 1000)
+
+
+def _reader(fn):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await database.read(fn, *args, **kwargs)
+    return wrapper
+
+
+def _writer(fn):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await database.write(fn, *args, **kwargs)
+    return wrapper
+
+
+# --- Чтение ---
+is_authorized = _reader(db.is_authorized)
+get_user_role = _reader(db.get_user_role)
+get_auth_state = _reader(db.get_auth_state)
+is_blocked = _reader(db.is_blocked)
+get_last_users = _reader(db.get_last_users)
+get_user_number = _reader(db.get_user_number)
+get_user_number_digest = _reader(db.get_user_number_digest)
+get_number_owner = _reader(db.get_number_owner)
+is_number_taken = _reader(db.is_number_taken)
+is_same_user = _reader(db.is_same_user)
+search_fts = _reader(db.search_fts)
+load_fsm_state = _reader(db.load_fsm_state)
+get_active_blocks = _reader(db.get_active_blocks)
+get_blocks = _reader(db.get_blocks)
+
+
+async def write_users_export(path, fmt="xlsx"):
+    return await database.read_long(db.write_users_export, path, fmt)
+
+
+# --- Запись ---
+save_user = _writer(db.save_user)
+set_subscription = _writer(db.set_subscription)
+remove_user = _writer(db.remove_user)
+remove_revoked_users = _writer(db.remove_revoked_users)
+add_block = _writer(db.add_block)
+extend_block = _writer(db.extend_block)
+remove_block = _writer(db.remove_block)
+release_block = _writer(db.release_block)
+remove_expired_blocks = _writer(db.remove_expired_blocks)
+clear_blocks = _writer(db.clear_blocks)
+sync_documents = _writer(db.sync_documents)
+save_fsm_states = _writer(db.save_fsm_states)
+remove_idle_fsm_states = _writer(db.remove_idle_fsm_states)
+
+
+async def add_user(user_id, number, full_name, role="user"):
+    # Быстрый отказ до bcrypt; окончательно занятость номера решает
+    # уникальный индекс в save_user
+    digest = db.number_digest(number)
+    owner = await get_number_owner(digest)
+    if owner is not None and str(owner) != str(user_id):
+        raise ValueError(db.NUMBER_TAKEN_ERROR)
+
+    hashed_number = await hasher.hash_number(number)
+    await save_user(user_id, hashed_number, digest, full_name, role)
+    logger.info(f"[LOGIN] {user_id=}, {number=}, {full_name=}")
@@ -1,22 +1,33 @@
+import html
+import os
+import tempfile
+
 from aiogram import Router, types
 from aiogram.filters import Command
 from config import ADMIN_IDS
-from db import get_last_users
+from db_async import get_last_users, write_users_export
+from services.stats import stats
+from services.sharding import worker_index
 from aiogram.types import FSInputFile
-from db import export_users_to_excel
 
 router = Router(name="admin")
 
+# Сколько самых затратных хендлеров показывает /stats
+STATS_TOP = 15
+# Предел одного сообщения (у Telegram 4096) и одной строки сервиса в /stats
+MESSAGE_LIMIT = 4000
+LINE_LIMIT = 500
+
 import logging
 logger = logging.getLogger(__name__) # Тоже корневой логгер
 
 @router.message(Command("users"))
 async def show_last_users(message: types.Message):
-    if str(message.from_user.id) not in ADMIN_IDS:
+    if message.from_user.id not in ADMIN_IDS:
         await message.answer("⛔ У вас нет прав для этой команды.")
         return
 
-    users = get_last_users(limit=10)
+    users = await get_last_users(limit=10)
     if not users:
         await message.answer("👥 Нет авторизованных пользователей.")
         return
@@ -34,12 +45,69 @@ async def show_last_users(message: types.Message):
 
 @router.message(Command("export"))
 async def export_users(message: types.Message):
-    if str(message.from_user.id) not in ADMIN_IDS:
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ У вас нет прав для этой команды.")
+        return
+
+    # /export — Excel, /export csv — CSV
+    fmt = "csv" if "csv" in message.text.lower().split()[1:] else "xlsx"
+
+    # Свой временный файл на каждый запрос: параллельные выгрузки не пересекаются
+    fd, path = tempfile.mkstemp(prefix="users_export_", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = await write_users_export(path, fmt)
+        await message.answer_document(
+            FSInputFile(path=path, filename=f"users_export.{fmt}"),
+            caption=f"📁 Экспорт пользователей в {'CSV' if fmt == 'csv' else 'Excel'}: {count}"
+        )
+    except Exception as e:
+        logger.exception(f"[EXPORT ERROR] {e}")
+        await message.answer("⚠️ Не удалось выгрузить пользователей.")
+    finally:
+        os.remove(path)
+
+@router.message(Command("stats"))
+async def show_stats(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
         await message.answer("⛔ У вас нет прав для этой команды.")
         return
 
-    filename = export_users_to_excel()
-    await message.answer_document(
-        FSInputFile(path=filename),
-        caption="📁 Экспорт пользователей в Excel"
-    )
+    worker = worker_index()
+    title = "📈 <b>Статистика</b>" + (f" (воркер {worker})" if worker is not None else "")
+    lines = [title, "", "Хендлер: вызовов · p50/p99, мс · БД/API/bcrypt/CPU, % · ошибки"]
+    for row in stats.handlers()[:STATS_TOP]:
+        total = row["total"] or 1
+        shares = "/".join(f"{row['spent'][kind] / total * 100:.0f}" for kind in ("db", "api", "hash", "compute"))
+        errors = f" · ❌ {row['errors']}" if row["errors"] else ""
+        lines.append(
+            f"<code>{row['handler']}</code>: {row['count']} · "
+            f"{row['p50'] * 1000:.0f}/{row['p99'] * 1000:.0f} · {shares}{errors}"
+        )
+
+    lag = stats.histogram("update_lag_seconds")
+    if lag is not None:
+        lines.append(f"\n⏱ Задержка доставки апдейтов p50/p99: {lag.quantile(0.5):.1f}/{lag.quantile(0.99):.1f} с")
+
+    lines.append("\n⚙️ <b>Сервисы</b>")
+    for component, values in stats.components().items():
+        pairs = ", ".join(f"{key}={value}" for key, value in values.items())
+        if len(pairs) > LINE_LIMIT:
+            pairs = pairs[:LINE_LIMIT] + "…"  # режем до разметки, не посреди тега
+        lines.append(f"<b>{component}</b>: {html.escape(pairs)}")
+
+    for chunk in split_lines(lines, MESSAGE_LIMIT):
+        await message.answer(chunk)
+
+def split_lines(lines, limit):
+    # Сообщения по границам строк: теги HTML не разрываются между частями
+    chunk = []
+    size = 0
+    for line in lines:
+        if chunk and size + len(line) + 1 > limit:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield "\n".join(chunk)
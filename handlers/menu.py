@@ -3,13 +3,14 @@ import asyncio
 import logging
 import html
 import os
-import bcrypt
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from functools import wraps
 from aiogram import types, Router, F
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
 from config import get_authorized_numbers
 from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
@@ -17,32 +18,41 @@ from aiogram.types import (
     CallbackQuery
 )
 from dotenv import load_dotenv
-import aiofiles
-import json
 from pathlib import Path
-from db import (
-    is_authorized, add_user, is_number_taken, is_same_user,
-    add_block, remove_block, is_blocked, get_last_users, get_user_number
+from db import number_digest
+from db_async import (
+    add_user, get_user_number, remove_user, search_fts
 )
-
-from db import (
-    is_authorized, add_user, is_number_taken, is_same_user,
-    add_block, remove_block, is_blocked, get_last_users
-)
-from config import BOT_TOKEN, AUTHORIZED_NUMBERS, ADMIN_IDS, BLOCK_DURATION, BASE_DIR
-from utils import DATA_JSON, FLAT_DATA
+from config import BOT_TOKEN, AUTHORIZED_NUMBERS, ADMIN_IDS, BLOCK_DURATION, BASE_DIR, SEARCH_BACKEND
+from services import docs
 from middlewares.auth import auth_required
+from services.hashing import hasher, HashingBusy
+from services.auth_cache import auth_cache
+from services.blocks import block_user
+from services.scheduler import scheduler
+from services.notifier import notifier
+from services.chat_cleanup import chat_cleanup
+from services import outbound
+from services.sharding import broadcast, on_broadcast
+from services.audit import audit, MAX_PAGE, LOGIN_ATTEMPTS, AUTH_BLOCKS, ADMIN_VIOLATIONS, ACCESS_REQUESTS
+from services.menu_tree import BACK_KEYBOARD
 
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 bot_instance = None
+storage_instance = None
 
 def register_bot_instance(bot):
     global bot_instance
     bot_instance = bot
 
+def register_storage(storage):
+    # Хранилище FSM — чтобы сбрасывать состояние вне хендлера (выход по неактивности)
+    global storage_instance
+    storage_instance = storage
+
 class MenuState(StatesGroup):
     path = State()
     authorized = State()
@@ -51,8 +61,7 @@ class MenuState(StatesGroup):
 
 auth_attempts = {}
 MAX_AUTH_ATTEMPTS = 5
-INACTIVITY_TIMEOUT = 600
-LAST_ACTIVE = {}
+INACTIVITY_TIMEOUT = 600  # 10 минут
 
 SYNONYMS = {
     "заправка": ["зарядка", "дозаправка"],
@@ -64,46 +73,13 @@ SYNONYMS = {
 def escape_html(text: str) -> str:
     return html.escape(text)
 
-def normalize(text: str) -> str:
-    return re.sub(r"[^\w\s]", "", text).strip().lower()
-
-
-def flatten_json(d, path=None):
-    path = path or []
-    flat = []
-    if isinstance(d, dict):
-        for k, v in d.items():
-            flat.extend(flatten_json(v, path + [k]))
-    else:
-        flat.append({"категория": " > ".join(path), "путь": path, "ссылка": str(d)})
-    return flat
 
 def generate_back_menu():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="⬅ Назад"), KeyboardButton(text="🏠 Главное меню")]],
-        resize_keyboard=True
-    )
+    return BACK_KEYBOARD
 
-def generate_menu(current_data, is_root=True):
-    buttons = []
-    if is_root:
-        buttons.append([KeyboardButton(text="🔍 Поиск документации")])
-    for key in sorted(current_data):
-        if not key.startswith("_"):
-            buttons.append([KeyboardButton(text=key)])
-    if not is_root:
-        buttons.append([KeyboardButton(text="⬅ Назад"), KeyboardButton(text="🏠 Главное меню")])
-    buttons.append([KeyboardButton(text="🚪 Выйти")])
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-
-def get_node_from_path(path_list):
-    current_node = DATA_JSON
-    for key in path_list:
-        if isinstance(current_node, dict) and key in current_node:
-            current_node = current_node[key]
-        else:
-            return None
-    return current_node
+def menu_keyboard(path=()):
+    # Готовая клавиатура раздела из дерева меню — без сортировки и сборки кнопок
+    return docs.current().menu.keyboard(path)
 
 def expand_query(query):
     query = query.lower().strip()
@@ -114,73 +90,58 @@ def expand_query(query):
             terms.update(synonyms)
     return terms
 
-def search_documents(query):
-    search_terms = expand_query(query)
-    result_paths = {}
-    for entry in FLAT_DATA:
-        entry_text = f"{entry['категория']} {entry['ссылка']}".lower()
-        if any(term in entry_text for term in search_terms):
-            key = entry["путь"][1] if len(entry["путь"]) > 1 else entry["путь"][0]
-            result_paths[key] = entry["путь"][:2]
-    return result_paths
-
+# Маркеры подсветки во фрагментах FTS — заменяются на теги после экранирования
+HIGHLIGHT = ("\x02", "\x03")
+SNIPPETS_SHOWN = 5
+
+async def search_documents(query):
+    if SEARCH_BACKEND == "fts":
+        return {key: path for key, (path, _) in (await search_documents_ranked(query)).items()}
+    return docs.current().search_index.search(expand_query(query))
+
+async def search_documents_ranked(query):
+    # {ключ: (путь[:2], фрагмент)} в порядке убывания релевантности
+    results = {}
+    for path, snippet in await search_fts(expand_query(query), highlight=HIGHLIGHT):
+        key = path[1] if len(path) > 1 else path[0]
+        if key not in results:
+            results[key] = (path[:2], snippet)
+    return results
+
+def format_snippet(snippet: str) -> str:
+    return escape_html(snippet.replace("\n", " ")).replace(HIGHLIGHT[0], "<b>").replace(HIGHLIGHT[1], "</b>")
+
+# === Журнал аудита ===
+# Записи уходят в очередь фонового писателя: хендлер не трогает диск
 def log_login_attempt(user_id, full_name, number, status):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"{timestamp} | LOGIN ATTEMPT | user_id={user_id} | full_name={full_name} | number={number} | status={status}\n"
-    with open("login_attempts.log", "a", encoding="utf-8") as f:
-        f.write(line)
-    logger.info(line.strip())
+    audit.record(LOGIN_ATTEMPTS, "LOGIN ATTEMPT", user_id=user_id, full_name=full_name, number=number, status=status)
 
 def log_auth_block(user_id, full_name, number, attempts):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"{timestamp} | AUTH BLOCK | user_id={user_id} | full_name={full_name} | number={number} | attempts={attempts}\n"
-    with open("auth_blocks.log", "a", encoding="utf-8") as f:
-        f.write(line)
-    logger.warning(line.strip())
+    audit.record(AUTH_BLOCKS, "AUTH BLOCK", user_id=user_id, full_name=full_name, number=number, attempts=attempts)
+    logger.warning(f"AUTH BLOCK | user_id={user_id} | attempts={attempts}")
 
 def log_admin_violation(user_id, full_name, command):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"{timestamp} | ADMIN VIOLATION | user_id={user_id} | full_name={full_name} | tried: {command}\n"
-    with open("admin_violations.log", "a", encoding="utf-8") as f:
-        f.write(line)
-    logger.warning(line.strip())
-
-async def read_json(file_path: str) -> dict:
-    try:
-        async with aiofiles.open(file_path, mode='r', encoding='utf-8') as f:
-            contents = await f.read()
-        return json.loads(contents)
-    except Exception as e:
-        logger.error(f"Ошибка чтения {file_path}: {e}")
-        return {}
+    audit.record(ADMIN_VIOLATIONS, "ADMIN VIOLATION", user_id=user_id, full_name=full_name, tried=command)
+    logger.warning(f"ADMIN VIOLATION | user_id={user_id} | tried: {command}")
 
 def log_access_request(user_id: int, full_name: str, number: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = (
-        f"{timestamp} | ACCESS REQUEST | user_id={user_id} | "
-        f"full_name={full_name} | number={number}\n"
-    )
-    with open("access_requests.log", "a", encoding="utf-8") as f:
-        f.write(line)
-    logger.info(line.strip())
+    audit.record(ACCESS_REQUESTS, "ACCESS REQUEST", user_id=user_id, full_name=full_name, number=number)
 
 
 logger = logging.getLogger(__name__)
 
-import bcrypt
+async def check_still_authorized(user_id: int) -> bool:
+    digest = await auth_cache.get_user_number_digest(user_id)
+    if digest:
+        return any(number_digest(number) == digest for number in AUTHORIZED_NUMBERS)
 
-def check_still_authorized(user_id: int) -> bool:
-    from db import get_user_number
-    number_hash = get_user_number(user_id)
+    # Запись без ключа (не прошла миграцию) — сверяем по bcrypt
+    number_hash = await get_user_number(user_id)
 
     if not number_hash:
         return False
 
-    for number in AUTHORIZED_NUMBERS:
-        if bcrypt.checkpw(number.encode(), number_hash.encode()):
-            return True
-
-    return False
+    return await hasher.check_any(AUTHORIZED_NUMBERS, number_hash)
 
 @router.callback_query(F.data.startswith("deny_number:"))
 async def handle_deny_number(callback: CallbackQuery):
@@ -242,6 +203,7 @@ async def handle_add_number(callback: CallbackQuery):
 
         load_dotenv(dotenv_path=env_path, override=True)
         AUTHORIZED_NUMBERS.add(number)
+        broadcast("authorized_number", number)  # Остальным воркерам, если их несколько
 
         await callback.answer("✅ Добавлено!")
         await callback.message.edit_text(
@@ -263,12 +225,23 @@ async def handle_add_number(callback: CallbackQuery):
 
 
 
+# === События от других воркеров (WORKERS > 1) ===
+@on_broadcast("authorized_number")
+async def add_authorized_number(number: str):
+    AUTHORIZED_NUMBERS.add(number)
+
+
+@on_broadcast("reload_docs")
+async def reload_docs_from_peer():
+    await docs.reload()
+
+
 def admin_only(handler):
     @wraps(handler)
     async def wrapper(message: types.Message, *args, **kwargs):
         user_id = message.from_user.id
         if user_id not in ADMIN_IDS:
-            if is_blocked(user_id):
+            if await auth_cache.is_blocked(user_id):
                 await message.answer("⛔ Вы временно заблокированы.")
                 return
             await handle_admin_violation(user_id, message.from_user.full_name, message.text)
@@ -277,23 +250,19 @@ def admin_only(handler):
     return wrapper
 
 async def handle_admin_violation(user_id: int, full_name: str, command: str):
+    log_admin_violation(user_id, full_name, command)
     full_name = escape_html(full_name)
     command = escape_html(command)
-    log_admin_violation(user_id, full_name, command)
 
-    unblock_time = int(datetime.now().timestamp()) + BLOCK_DURATION
-    add_block(user_id, unblock_time)
+    # Снятие блокировки — в планировщике, хендлер не ждёт BLOCK_DURATION
+    await block_user(user_id, BLOCK_DURATION)
 
-    try:
-        for admin_id in ADMIN_IDS:
-            await bot_instance.send_message(
-                admin_id,
-                f"🚫 <b>Блокировка:</b> Пользователь {full_name} ({user_id}) "
-                f"попытался использовать <code>{command}</code> и был временно заблокирован.",
-                parse_mode="HTML"
-            )
-    except Exception as e:
-        logger.error(f"[ADMIN BLOCK ALERT] Не удалось уведомить админов: {e}")
+    notifier.notify(
+        f"🚫 <b>Блокировка:</b> Пользователь {full_name} ({user_id}) "
+        f"попытался использовать <code>{command}</code> и был временно заблокирован.",
+        key=("violation", user_id),
+        parse_mode="HTML"
+    )
 
     try:
         await bot_instance.send_message(
@@ -304,25 +273,79 @@ async def handle_admin_violation(user_id: int, full_name: str, command: str):
     except Exception:
         pass
 
-    await asyncio.sleep(BLOCK_DURATION)
-    remove_block(user_id)
+AUDIT_TYPES = {
+    "login": LOGIN_ATTEMPTS,
+    "block": AUTH_BLOCKS,
+    "violation": ADMIN_VIOLATIONS,
+    "access": ACCESS_REQUESTS,
+    "all": None,
+}
+AUDIT_FILTERS_HELP = (
+    "Фильтры: <code>user=ID</code> (или просто ID), <code>from=2024-01-31</code>, "
+    "<code>to=2024-02-01T12:00</code>, <code>type=login|block|violation|access|all</code>, "
+    "<code>limit=N</code>, <code>before=ID</code> — следующая страница."
+)
 
-async def delete_previous_message(message: types.Message):
+def _parse_time(value: str, end_of_day=False) -> float:
+    moment = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        moment += timedelta(days=1)  # to=2024-02-01 — включая весь этот день
+    return moment.timestamp()
+
+def parse_audit_filters(text: str, stream=None) -> dict:
+    # "/log user=123 from=2024-01-01 limit=20" -> аргументы audit.query
+    filters = {"stream": stream, "limit": 10}
+    for token in text.split()[1:]:
+        name, sep, value = token.partition("=")
+        if not sep and token.isdigit():
+            name, value = "user", token
+        try:
+            if name == "user":
+                filters["user_id"] = int(value)
+            elif name == "from":
+                filters["since"] = _parse_time(value)
+            elif name == "to":
+                filters["until"] = _parse_time(value, end_of_day=True)
+            elif name == "type" and value in AUDIT_TYPES:
+                filters["stream"] = AUDIT_TYPES[value]
+            elif name == "limit":
+                filters["limit"] = max(1, min(int(value), MAX_PAGE))
+            elif name == "before":
+                filters["before_id"] = int(value)
+            else:
+                raise ValueError
+        except (ValueError, OverflowError, OSError):
+            # OverflowError/OSError — дата вне диапазона timestamp (9999-12-31)
+            raise ValueError(f"⚠️ Не понял фильтр «{escape_html(token)}».\n{AUDIT_FILTERS_HELP}")
+    return filters
+
+def format_audit_record(record: dict) -> str:
+    # Прежний вид строки журнала: «время | событие | поле=значение»
+    fields = [f"{key}={value}" for key, value in record.items() if key not in ("id", "ts", "stream", "event")]
+    ts = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    return " | ".join([f"#{record['id']} {ts}", record["event"], *fields])
+
+async def answer_audit_query(message: types.Message, stream, empty_message: str):
+    command = message.text.split()[0]
     try:
-        await bot_instance.delete_message(chat_id=message.chat.id, message_id=message.message_id - 1)
-    except Exception as e:
-        logger.warning(f"[DELETE ERROR] Не удалось удалить сообщение: {e}")
+        filters = parse_audit_filters(message.text, stream)
+    except ValueError as e:
+        await message.answer(str(e), parse_mode="HTML")
+        return
 
-async def read_log_file(path: str, empty_message: str):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            return "".join(lines[-10:]) if lines else empty_message
-    except FileNotFoundError:
-        return empty_message
-    except Exception as e:
-        logger.error(f"[LOG READ ERROR] {path}: {e}")
-        return "⚠️ Ошибка при чтении журнала."
+    records = await audit.query(**filters)
+    if not records:
+        await message.answer(empty_message)
+        return
+
+    text = "\n".join(format_audit_record(r) for r in reversed(records))
+    reply = f"<pre>{escape_html(text)}</pre>"
+    if len(records) == filters["limit"]:
+        # Ключ страницы — id последней записи: следующая выборка тоже по индексу
+        args = [t for t in message.text.split()[1:] if not t.startswith("before=")]
+        next_page = " ".join([command, *args, f"before={records[-1]['id']}"])
+        reply += f"\n➡️ Дальше: <code>{escape_html(next_page)}</code>"
+    await message.answer(reply, parse_mode="HTML")
 
 @router.message(Command("help"))
 async def help_command(message: types.Message):
@@ -347,9 +370,8 @@ async def start_search(message: types.Message, state: FSMContext):
 @router.message(Command("reset"))
 @auth_required
 async def reset_auth(message: types.Message, state: FSMContext):
-    from db import remove_user
     user_id = message.from_user.id
-    remove_user(user_id)
+    await remove_user(user_id)
     await state.clear()
     await message.answer("🔁 Авторизация сброшена.\n🔐 Введите табельный номер повторно:", reply_markup=ReplyKeyboardRemove())
     await state.set_state(MenuState.authorized)
@@ -363,39 +385,30 @@ async def admin_panel(message: types.Message):
         "/log — Последние попытки входа\n"
         "/violations — Попытки доступа к админ-командам\n"
         "/clear_log — Очистить лог входа\n"
+        "/reload_docs — Перезагрузить документацию\n"
+        "/stats — Время обработки и состояние сервисов\n"
         "/reset — Сброс авторизации\n"
-        "/start — Главное меню",
+        "/start — Главное меню\n\n"
+        f"{AUDIT_FILTERS_HELP}",
         parse_mode="HTML"
     )
 
 @router.message(Command("log"))
 @admin_only
 async def show_login_log(message: types.Message):
-    users = get_last_users()
-    if not users:
-        await message.answer("📭 Журнал пуст.")
-        return
-
-    lines = [
-        f"👤 <b>{u[2]}</b>\nID: <code>{u[0]}</code>\nНомер: {u[1]}\n⏱ {u[3]}"
-        for u in users
-    ]
-    await message.answer("\n\n".join(lines), parse_mode="HTML")
+    await answer_audit_query(message, LOGIN_ATTEMPTS, "📭 Журнал пуст.")
 
 
 @router.message(Command("violations"))
 @admin_only
 async def show_admin_violations(message: types.Message):
-    text = await read_log_file("admin_violations.log", "📭 Нарушений не зафиксировано.")
-    await message.answer(f"<pre>{escape_html(text)}</pre>", parse_mode="HTML")
+    await answer_audit_query(message, ADMIN_VIOLATIONS, "📭 Нарушений не зафиксировано.")
 
 @router.message(Command("clear_log"))
 @admin_only
 async def clear_login_log(message: types.Message):
-    import os
     try:
-        if os.path.exists("login_attempts.log"):
-            os.remove("login_attempts.log")
+        if await audit.clear(LOGIN_ATTEMPTS):
             await message.answer("🧹 Лог входа очищен.")
         else:
             await message.answer("📭 Лог уже пуст.")
@@ -403,21 +416,37 @@ async def clear_login_log(message: types.Message):
         logger.error(f"[CLEAR LOG ERROR] Не удалось удалить лог: {e}")
         await message.answer("⚠️ Ошибка при удалении лога.")
 
+@router.message(Command("reload_docs"))
+@admin_only
+async def reload_docs(message: types.Message):
+    snapshot = await docs.reload()
+    if snapshot is None:
+        await message.answer("⚠️ Не удалось загрузить data.json — работает прежняя версия. Подробности в логе.")
+        return
+    broadcast("reload_docs")
+    await message.answer(
+        f"🔄 Документация обновлена: {len(snapshot.flat)} записей, "
+        f"{len(snapshot.menu)} узлов меню за {snapshot.build_time * 1000:.0f} мс.\n"
+        f"💾 Память процесса: {snapshot.rss_mb:.0f} МБ"
+    )
+
 @router.message(CommandStart())
 async def cmd_start(message: types.Message, state: FSMContext):
-    try:
-        for i in range(1, 100):
-            await bot_instance.delete_message(chat_id=message.chat.id, message_id=message.message_id - i)
-    except Exception:
-        pass
+    # Старые сообщения удаляются в фоне пачками, ответ не ждёт
+    chat_cleanup.clear(message.chat.id, message.message_id)
 
     user_id = message.from_user.id
     full_name = message.from_user.full_name
 
-    if is_authorized(user_id):
-        if not check_still_authorized(user_id):
-            from db import remove_user
-            remove_user(user_id)
+    if await auth_cache.is_authorized(user_id):
+        try:
+            still_authorized = await check_still_authorized(user_id)
+        except HashingBusy as e:
+            await message.answer(str(e))
+            return
+
+        if not still_authorized:
+            await remove_user(user_id)
             await state.clear()
             await message.answer(
                 "⛔ Ваш доступ был отозван администратором.\n"
@@ -431,7 +460,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
         await message.answer(
             escape_html("👋 механик Никитич рад тебя видеть снова!\nВыберите раздел:"),
             parse_mode="HTML",
-            reply_markup=generate_menu(DATA_JSON)
+            reply_markup=menu_keyboard()
         )
     else:
         await state.clear()
@@ -451,7 +480,9 @@ async def navigate_menu(message: types.Message, state: FSMContext):
         await message.answer("⚠️ Для использования команды используйте /search или /reset, а не обычный текст.")
         return
 
-    current_path = (await state.get_data()).get("path", [])
+    snapshot = docs.current()
+    tree = snapshot.menu
+    current = snapshot.node_from_state(await state.get_data())
 
     if user_text_lower in ["🚪 выйти", "выйти"]:
         await state.clear()
@@ -463,16 +494,14 @@ async def navigate_menu(message: types.Message, state: FSMContext):
         return
 
     elif user_text_lower in ["⬅ назад", "назад"]:
-        if current_path:
-            current_path.pop()
-            await state.update_data(path=current_path)
-        current_node = get_node_from_path(current_path)
-        await message.answer("📂 Назад", reply_markup=generate_menu(current_node, is_root=not current_path))
+        parent = tree.parent_of(current)
+        await state.update_data(tree.state_of(parent))
+        await message.answer("📂 Назад", reply_markup=parent.keyboard)
         return
 
     elif user_text_lower in ["🏠 главное меню", "главное меню"]:
-        await state.update_data(path=[])
-        await message.answer("🏠 Главное меню", reply_markup=generate_menu(DATA_JSON))
+        await state.update_data(tree.state_of(tree.root))
+        await message.answer("🏠 Главное меню", reply_markup=menu_keyboard())
         return
 
     if user_text == "🔍 Поиск документации":
@@ -480,10 +509,9 @@ async def navigate_menu(message: types.Message, state: FSMContext):
         await message.answer("🔎 Введите ключевое слово для поиска:", reply_markup=ReplyKeyboardRemove())
         return
 
-    current_node = get_node_from_path(current_path)
-    matching_key = next((key for key in current_node if normalize(key) == normalize(user_text)), None)
-    if matching_key:
-        user_text = matching_key
+    menu_node = tree.resolve(current, user_text)
+    if menu_node:
+        user_text = menu_node.key
         # Проверка подписки для раздела "Ресеты"
             # Проверка подписки на раздел "Ресеты"
         if user_text.lower() == "ресеты":
@@ -514,13 +542,12 @@ async def navigate_menu(message: types.Message, state: FSMContext):
 
                 return
 
-        current_path.append(user_text)
-        await state.update_data(path=current_path)
-        next_node = current_node[user_text]
+        await state.update_data(tree.state_of(menu_node))
+        next_node = menu_node.value
 
-        if isinstance(next_node, dict): 
-            description = next_node.get("_описание")
-            submenu = {k: v for k, v in next_node.items() if not k.startswith("_")}
+        if menu_node.is_section: 
+            description = menu_node.description
+            submenu = menu_node.children
 
             if description and not submenu:
                 # Только описание, без вложений — выводим и выходим
@@ -534,7 +561,7 @@ async def navigate_menu(message: types.Message, state: FSMContext):
                 await message.answer(
                     f"📁 Раздел: <b>{escape_html(user_text)}</b>",
                     parse_mode="HTML",
-                    reply_markup=generate_menu(submenu, is_root=False)
+                    reply_markup=menu_node.keyboard
                 )
             else:
                 await message.answer(
@@ -544,14 +571,8 @@ async def navigate_menu(message: types.Message, state: FSMContext):
                 )
 
         else:
-            # Если значение — словарь и в нём есть _описание
-            if isinstance(next_node, dict) and "_описание" in next_node:
-                description = next_node["_описание"]
-            else:
-                description = str(next_node)
-
             await message.answer(
-                f"📄 <b>Описание:</b>\n\n{escape_html(description)}",
+                f"📄 <b>Описание:</b>\n\n{escape_html(str(next_node))}",
                 parse_mode="HTML",
                 reply_markup=generate_back_menu()
             )
@@ -562,34 +583,28 @@ async def handle_authorization(message: types.Message, state: FSMContext):
         await message.answer("⚠️ Пожалуйста, введите только табельный номер.")
         return
 
-    start_time = datetime.now()
     number = message.text.strip()
     user_id = message.from_user.id
     full_name = message.from_user.full_name
-    logger.info(f"[TIME] START handle_authorization | {start_time}")
 
-    if is_blocked(user_id):
-        logger.info(f"[TIME] BLOCKED | {datetime.now() - start_time}")
+    if await auth_cache.is_blocked(user_id):
         await message.answer("⛔ Вы временно заблокированы за превышение попыток входа. Попробуйте позже.")
         return
 
     if number in AUTHORIZED_NUMBERS:
         try:
-            add_user(user_id, number, full_name)
-            logger.info(f"[TIME] USER ADDED TO DB | {datetime.now() - start_time}")
+            await add_user(user_id, number, full_name)
             log_login_attempt(user_id, full_name, number, "accepted")
-            auth_attempts.pop(user_id, None)
+            reset_auth_attempts(user_id)
             await state.set_state(MenuState.path)
             await message.answer(
                 f"✅ Авторизация успешна! Добро пожаловать {escape_html(full_name)} к механику Никитичу 🔧✨.",
                 parse_mode="HTML",
-                reply_markup=generate_menu(DATA_JSON)
+                reply_markup=menu_keyboard()
             )
-            logger.info(f"[TIME] SUCCESS RESPONSE SENT | {datetime.now() - start_time}")
             return
         except ValueError as e:
             warning = await message.answer(str(e))
-            logger.info(f"[TIME] DUPLICATE NUMBER ERROR | {datetime.now() - start_time}")
             log_login_attempt(user_id, full_name, number, "rejected: duplicate number")
             await asyncio.sleep(5)
             try:
@@ -599,38 +614,33 @@ async def handle_authorization(message: types.Message, state: FSMContext):
                 pass
             await message.answer("🔐 Введите табельный номер для входа ещё раз:")
             return
+        except HashingBusy as e:
+            await message.answer(str(e))
+            return
 
 
     # Если номер не найден
     count = auth_attempts.get(user_id, 0) + 1
     auth_attempts[user_id] = count
+    # Счётчик забывается через BLOCK_DURATION после последней неудачной попытки
+    scheduler.schedule(("auth_attempts", user_id), time.time() + BLOCK_DURATION, reset_auth_attempts, user_id)
     log_login_attempt(user_id, full_name, number, f"denied (attempt {count})")
 
     if count >= MAX_AUTH_ATTEMPTS:
-        unblock_time = int(datetime.now().timestamp()) + BLOCK_DURATION
-        add_block(user_id, unblock_time)
-        auth_attempts.pop(user_id, None)
+        await block_user(user_id, BLOCK_DURATION)
+        reset_auth_attempts(user_id)
         log_auth_block(user_id, full_name, number, count)
 
-        logger.info(f"[TIME] BLOCKED USER | {datetime.now() - start_time}")
-
-        if bot_instance:
-            for admin_id in ADMIN_IDS:
-                try:
-                    await bot_instance.send_message(
-                        chat_id=admin_id,
-                        text=(
-                            f"🚫 <b>Блокировка по логину</b>\n\n"
-                            f"<b>Имя:</b> {escape_html(full_name)}\n"
-                            f"<b>ID:</b> <code>{user_id}</code>\n"
-                            f"<b>Введённый номер:</b> <code>{escape_html(number)}</code>\n"
-                            f"<b>Попытки:</b> {count}\n"
-                            f"⏱ Блокировка на {BLOCK_DURATION // 60} минут(ы)"
-                        ),
-                        parse_mode="HTML"
-                    )
-                except Exception as e:
-                    logger.error(f"[ADMIN ALERT] Не удалось уведомить админа {admin_id}: {e}")
+        notifier.notify(
+            f"🚫 <b>Блокировка по логину</b>\n\n"
+            f"<b>Имя:</b> {escape_html(full_name)}\n"
+            f"<b>ID:</b> <code>{user_id}</code>\n"
+            f"<b>Введённый номер:</b> <code>{escape_html(number)}</code>\n"
+            f"<b>Попытки:</b> {count}\n"
+            f"⏱ Блокировка на {BLOCK_DURATION // 60} минут(ы)",
+            key=("auth_block", user_id),
+            parse_mode="HTML"
+        )
 
         await message.answer(
             f"⛔ Превышено число попыток входа.\nВы временно заблокированы на {BLOCK_DURATION // 60} минут(ы)."
@@ -640,43 +650,29 @@ async def handle_authorization(message: types.Message, state: FSMContext):
     # Запрос на доступ
     await message.answer("📨 Ваш запрос на доступ отправлен администратору.\n⏳ Пожалуйста, дождитесь подтверждения.")
 
-    logger.info(f"[TIME] ACCESS REQUEST SENT | {datetime.now() - start_time}")
-
-    if bot_instance:
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot_instance.send_message(
-                    chat_id=admin_id,
-                    text=(
-                        f"📥 <b>Запрос на доступ</b>\n\n"
-                        f"<b>Имя:</b> {escape_html(full_name)}\n"
-                        f"<b>ID:</b> <code>{user_id}</code>\n"
-                        f"<b>Введённый номер:</b> <code>{escape_html(number)}</code>\n\n"
-                        f"⬇️ Добавьте в список:"
-                    ),
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [
-                            InlineKeyboardButton(text="✅ Добавить", callback_data=f"add_number:{user_id}:{number}"),
-                            InlineKeyboardButton(text="❌ Отклонить", callback_data=f"deny_number:{user_id}")
-                        ]
-                    ]),
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                logger.error(f"[ACCESS REQUEST] Ошибка отправки админу: {e}")
+    # Повторные запросы пользователя, ещё не ушедшие админам, схлопываются в последний
+    notifier.notify(
+        f"📥 <b>Запрос на доступ</b>\n\n"
+        f"<b>Имя:</b> {escape_html(full_name)}\n"
+        f"<b>ID:</b> <code>{user_id}</code>\n"
+        f"<b>Введённый номер:</b> <code>{escape_html(number)}</code>\n\n"
+        f"⬇️ Добавьте в список:",
+        key=("access", user_id),
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Добавить", callback_data=f"add_number:{user_id}:{number}"),
+                InlineKeyboardButton(text="❌ Отклонить", callback_data=f"deny_number:{user_id}")
+            ]
+        ]),
+        parse_mode="HTML"
+    )
 
-    logger.info(f"[TIME] FINISHED handle_authorization | {datetime.now() - start_time}")
 
    
     log_access_request(user_id, full_name, number)
 
     return
 
-def check_still_authorized(user_id: int) -> bool:
-    from db import get_user_number
-    number = get_user_number(user_id)
-    return number in AUTHORIZED_NUMBERS
-
 @router.message(MenuState.searching)
 async def handle_search(message: types.Message, state: FSMContext):
     user_text = message.text.strip().lower()
@@ -685,64 +681,104 @@ async def handle_search(message: types.Message, state: FSMContext):
         return
 
     query = message.text.strip()
-    matches = search_documents(query)
+    text = "🔍 Найдено:\nВыберите раздел:"
+    if SEARCH_BACKEND == "fts":
+        ranked = await search_documents_ranked(query)
+        matches = {key: path for key, (path, _) in ranked.items()}
+        keys = list(matches)  # уже по релевантности
+        if ranked:
+            lines = [
+                f"• <b>{escape_html(key)}</b> — {format_snippet(snippet)}"
+                for key, (_, snippet) in list(ranked.items())[:SNIPPETS_SHOWN]
+            ]
+            text = "🔍 Найдено:\n" + "\n".join(lines) + "\n\nВыберите раздел:"
+    else:
+        matches = await search_documents(query)
+        keys = sorted(matches)
 
     if not matches:
         await message.answer("❌ По вашему запросу ничего не найдено. Попробуйте другое слово.")
         return
 
+    # В состоянии храним id узлов, а не списки ключей
+    snapshot = docs.current()
+    tree = snapshot.menu
+    found = {}
+    for key, path in matches.items():
+        node = tree.find(path)
+        if node is not None:
+            found[key] = node.id
+
+    # node и menu пишем вместе: после перезагрузки data.json старый id
+    # узла в новом дереве указывал бы на чужой раздел
+    current = snapshot.node_from_state(await state.get_data())
     await state.set_state(MenuState.waiting_for_selection)
-    await state.update_data(search_results=matches)
+    await state.update_data(search_results=found, **tree.state_of(current))
 
-    buttons = [[KeyboardButton(text=key)] for key in sorted(matches)]
+    buttons = [[KeyboardButton(text=key)] for key in keys]
     buttons.append([KeyboardButton(text="⬅ Назад"), KeyboardButton(text="🏠 Главное меню")])
-    await message.answer("🔍 Найдено:\nВыберите раздел:", reply_markup=ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True))
+    await message.answer(text, parse_mode="HTML", reply_markup=ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True))
 
 
 @router.message(MenuState.waiting_for_selection)
 async def handle_search_selection(message: types.Message, state: FSMContext):
     user_text = message.text
     data = await state.get_data()
+    snapshot = docs.current()
 
     if user_text in data.get("search_results", {}):
-        path = data["search_results"][user_text]
-        await state.update_data(path=path)
+        node = snapshot.node_from_state({"node": data["search_results"][user_text], "menu": data.get("menu")})
+        await state.update_data(snapshot.menu.state_of(node))
         await state.set_state(MenuState.path)
-        current_node = get_node_from_path(path)
         await message.answer(
             f"📁 Перейдено к: <b>{escape_html(user_text)}</b>",
             parse_mode="HTML",
-            reply_markup=generate_menu(current_node, is_root=False)
+            reply_markup=node.keyboard
         )
     elif user_text == "⬅ Назад":
         await state.set_state(MenuState.path)
-        await message.answer("🔙 Назад в меню", reply_markup=generate_menu(DATA_JSON))
+        await message.answer("🔙 Назад в меню", reply_markup=menu_keyboard())
     elif user_text == "🏠 Главное меню":
-        await state.update_data(path=[])
+        await state.update_data(snapshot.menu.state_of(snapshot.menu.root))
         await state.set_state(MenuState.path)
-        await message.answer("🏠 Главное меню", reply_markup=generate_menu(DATA_JSON))
+        await message.answer("🏠 Главное меню", reply_markup=menu_keyboard())
     else:
         await message.answer("❗ Раздел не найден. Пожалуйста, выберите из списка.")
 
 __all__ = [
     "router",
     "register_bot_instance",
-    "on_startup"
+    "register_storage",
+    "mark_active"
 ]
 
-INACTIVITY_TIMEOUT = 600  # 10 минут
-LAST_ACTIVE = {}
-
-async def auto_logout_checker():
-    while True:
-        now = datetime.now()
-        for user_id, last_active in list(LAST_ACTIVE.items()):
-            if (now - last_active).total_seconds() > INACTIVITY_TIMEOUT:
-                if is_authorized(user_id):
-                    remove_block(user_id)
-                    LAST_ACTIVE.pop(user_id)
-        await asyncio.sleep(60)
-
-async def on_startup(bot):
-    asyncio.create_task(auto_logout_checker())
+def reset_auth_attempts(user_id):
+    auth_attempts.pop(user_id, None)
+    scheduler.cancel(("auth_attempts", user_id))
+
+async def logout_inactive(user_id):
+    # Завершается только сессия FSM (позиция в меню, поиск), привязка
+    # табельного номера и подписка остаются — заново вводить номер не нужно
+    if storage_instance is None or bot_instance is None:
+        return
+    key = StorageKey(bot_id=bot_instance.id, chat_id=user_id, user_id=user_id)
+    if await storage_instance.get_state(key) is None:
+        return
+    await storage_instance.set_state(key, None)
+    await storage_instance.set_data(key, {})
+    logger.info(f"🔒 Сессия пользователя {user_id} завершена по неактивности")
+    try:
+        with outbound.priority(outbound.BACKGROUND):
+            await bot_instance.send_message(
+                user_id,
+                "🔒 Сессия завершена из-за неактивности.\n/start — чтобы продолжить",
+                reply_markup=ReplyKeyboardRemove()
+            )
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сообщить {user_id} о выходе: {e}")
+
+def mark_active(user_id):
+    # Каждое действие переносит срок: событие сработает ровно через
+    # INACTIVITY_TIMEOUT после последней активности
+    scheduler.schedule(("inactive", user_id), time.time() + INACTIVITY_TIMEOUT, logout_inactive, user_id)
 
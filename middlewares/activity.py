@@ -0,0 +1,24 @@
+import logging
+from aiogram import BaseMiddleware, types
+from typing import Any, Callable, Dict, Awaitable
+
+from services.auth_cache import auth_cache
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Отмечает активность авторизованных пользователей (сообщения и кнопки):
+    on_active(user_id) переносит срок выхода по неактивности.
+    """
+
+    def __init__(self, on_active: Callable[[int], None]):
+        self.on_active = on_active
+
+    async def __call__(self, handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable],
+                       event: types.TelegramObject, data: Dict[str, Any]):
+        user = getattr(event, "from_user", None)
+        if user is not None and await auth_cache.is_authorized(user.id):
+            self.on_active(user.id)
+        return await handler(event, data)
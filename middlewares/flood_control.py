@@ -1,43 +1,119 @@
 import time
 import logging
-from collections import defaultdict
 from aiogram import BaseMiddleware, types
-from typing import Callable, Dict, Awaitable
+from typing import Any, Callable, Dict, Awaitable
+
+from db_async import get_active_blocks
+from services.blocks import block_user
 
 logger = logging.getLogger(__name__)
 
+BLOCK_REASON = "flood"
+# Не чаще, чем раз в столько секунд, вычищаем простаивающих пользователей
+SWEEP_INTERVAL = 60
+
+
+class _Window:
+    """
+    Кольцо из limit последних отметок времени. Новое событие замещает
+    самое старое: если и оно ещё внутри периода — лимит превышен.
+    """
+    __slots__ = ("stamps", "pos")
+
+    def __init__(self, limit: int):
+        self.stamps = [float("-inf")] * limit
+        self.pos = 0
+
+
 class FloodControlMiddleware(BaseMiddleware):
-    def __init__(self, limit: int = 5, period: int = 10, block_time: int = 15, admin_ids=None):
+    """
+    Антифлуд для сообщений и нажатий inline-кнопок: не больше limit событий
+    за period секунд, иначе блокировка на block_time секунд.
+
+    Стоимость события — O(1) независимо от limit; пользователи, которые
+    молчат дольше периода, и истёкшие блокировки периодически удаляются,
+    так что память ограничена числом активных пользователей.
+    """
+
+    def __init__(self, limit: int = 5, period: int = 10, block_time: int = 15, admin_ids=None,
+                 persist_blocks: bool = False):
         self.limit = limit
         self.period = period
         self.block_time = block_time
-        self.user_messages: Dict[int, list] = defaultdict(list)
+        self.persist_blocks = persist_blocks
+        self.user_windows: Dict[int, _Window] = {}
         self.blocked_until: Dict[int, float] = {}
         self.admin_ids = {int(a) for a in admin_ids} if admin_ids else set()
+        self._next_sweep = time.monotonic() + max(period, SWEEP_INTERVAL)
+        self.blocks = 0
+
+    async def restore_blocks(self):
+        # Действующие блокировки антифлуда из blocked_users — после перезапуска
+        if not self.persist_blocks:
+            return
+        wall_now = time.time()
+        now = time.monotonic()
+        for user_id, unblock_time in await get_active_blocks(BLOCK_REASON):
+            self.blocked_until[int(user_id)] = now + (unblock_time - wall_now)
+        if self.blocked_until:
+            logger.info(f"[FLOOD] Восстановлено блокировок: {len(self.blocked_until)}")
+
+    def _sweep(self, now: float):
+        idle_before = now - self.period
+        for user_id in [u for u, w in self.user_windows.items() if w.stamps[w.pos - 1] < idle_before]:
+            del self.user_windows[user_id]
+        for user_id in [u for u, until in self.blocked_until.items() if until <= now]:
+            del self.blocked_until[user_id]
+        self._next_sweep = now + max(self.period, SWEEP_INTERVAL)
 
-    async def __call__(self, handler: Callable[[types.Message, Dict], Awaitable], event: types.Message, data: Dict):
-        user_id = event.from_user.id
-        now = time.time()
+    def _hit(self, user_id: int, now: float) -> bool:
+        window = self.user_windows.get(user_id)
+        if window is None:
+            window = self.user_windows[user_id] = _Window(self.limit)
+        pos = window.pos
+        oldest = window.stamps[pos]
+        window.stamps[pos] = now
+        window.pos = pos + 1 if pos + 1 < self.limit else 0
+        return now - oldest <= self.period
 
-        if user_id in self.admin_ids:
+    async def __call__(self, handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable],
+                       event: types.TelegramObject, data: Dict[str, Any]):
+        user = getattr(event, "from_user", None)
+        if user is None or user.id in self.admin_ids:
             return await handler(event, data)
 
-        # Блокировка активна?
-        if user_id in self.blocked_until and now < self.blocked_until[user_id]:
-            return  # Молча игнорируем
+        user_id = user.id
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
 
-        # Очистка старых сообщений
-        timestamps = [t for t in self.user_messages[user_id] if now - t <= self.period]
-        timestamps.append(now)
-        self.user_messages[user_id] = timestamps
+        # Блокировка активна?
+        until = self.blocked_until.get(user_id)
+        if until is not None:
+            if now < until:
+                return  # Молча игнорируем
+            del self.blocked_until[user_id]
 
         # Проверка лимита
-        if len(timestamps) > self.limit:
+        if self._hit(user_id, now):
             self.blocked_until[user_id] = now + self.block_time
+            self.blocks += 1
             logger.warning(
                 f"[FLOOD] User {user_id} заблокирован на {self.block_time} секунд (лимит {self.limit}/{self.period}s)"
             )
+            if self.persist_blocks:
+                try:
+                    await block_user(user_id, self.block_time, BLOCK_REASON, extend=True)
+                except Exception as e:
+                    logger.error(f"[FLOOD] Не удалось сохранить блокировку {user_id}: {e}")
             await event.answer("🚫 Слишком много сообщений! Вы временно заблокированы.")
             return
 
         return await handler(event, data)
+
+    def metrics(self) -> dict:
+        return {
+            "tracked_users": len(self.user_windows),
+            "blocked_users": len(self.blocked_until),
+            "blocks": self.blocks,
+        }
@@ -0,0 +1,49 @@
+import time
+import logging
+from aiogram import BaseMiddleware, types
+from typing import Any, Callable, Dict, Awaitable
+
+from services import stats as timings
+from services.stats import stats
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейта: полное время обработки по хендлеру и
+    состоянию FSM, из него — ожидание БД, Telegram API и bcrypt (остаток
+    считается вычислениями), задержка доставки и ошибки.
+    """
+
+    async def __call__(self, handler: Callable[[types.Update, Dict[str, Any]], Awaitable],
+                       event: types.Update, data: Dict[str, Any]):
+        date = getattr(event.message or event.edited_message, "date", None)
+        if date is not None:
+            # Сколько апдейт шёл до нас: очередь Telegram, polling, воркеры
+            stats.observe("update_lag_seconds", max(time.time() - date.timestamp(), 0.0))
+
+        timing, token = timings.begin()
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            timings.end(token)
+            stats.record_update(timing, elapsed, data.get("raw_state") or "none", failed)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренний middleware сообщений и кнопок: какой хендлер выбран."""
+
+    async def __call__(self, handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable],
+                       event: types.TelegramObject, data: Dict[str, Any]):
+        timing = timings.current()
+        handler_object = data.get("handler")
+        if timing is not None and handler_object is not None:
+            timing.handler = handler_object.callback.__name__
+        return await handler(event, data)
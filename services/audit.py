@@ -0,0 +1,353 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, date
+from pathlib import Path
+
+from config import AUDIT_DIR, AUDIT_MAX_BYTES, AUDIT_BACKUPS, AUDIT_FLUSH_INTERVAL, AUDIT_RETENTION_DAYS
+from services.stats import add_time
+
+logger = logging.getLogger(__name__)
+
+# Журналы аудита: имя потока -> файл
+LOGIN_ATTEMPTS = "login_attempts"
+AUTH_BLOCKS = "auth_blocks"
+ADMIN_VIOLATIONS = "admin_violations"
+ACCESS_REQUESTS = "access_requests"
+
+STREAMS = (LOGIN_ATTEMPTS, AUTH_BLOCKS, ADMIN_VIOLATIONS, ACCESS_REQUESTS)
+
+# Сколько записей максимум пишется одной пачкой
+MAX_BATCH = 512
+# Сколько записей максимум отдаёт один запрос
+MAX_PAGE = 50
+_STOP = object()
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        stream TEXT NOT NULL,
+        event TEXT NOT NULL,
+        user_id INTEGER,
+        data TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_audit_stream ON audit_log (stream, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_log (ts)",
+)
+
+
+def _open(path: Path) -> sqlite3.Connection:
+    c = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA busy_timeout=5000")
+    return c
+
+
+class _Sink:
+    __slots__ = ("path", "file", "size", "day")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = None
+        self.size = 0
+        self.day = None
+
+
+class AuditWriter:
+    """
+    Журнал аудита в формате JSON Lines с записью в фоновом потоке.
+
+    Хендлеры только кладут запись в очередь. Поток-писатель ждёт первую
+    запись, ещё flush_interval собирает следующие и пишет всю пачку одним
+    write() на каждый файл. Файл ротируется при превышении max_bytes и
+    при смене суток: <поток>.jsonl -> .1 -> ... -> .<backups>.
+
+    Та же пачка одной транзакцией попадает в audit.db — таблицу
+    с индексами по потоку, пользователю и времени. По ней отвечают
+    админ-команды: выборка идёт по индексу и не зависит от объёма журнала.
+    Записи старше retention_days удаляются раз в сутки (0 — хранить всё).
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, backups: int, flush_interval: float,
+                 retention_days: int = 0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.db_path = self.directory / "audit.db"
+        # Свой набор JSONL-файлов у каждого воркера; audit.db — общая
+        self.suffix = ""
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._sinks: dict[str, _Sink] = {}
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pruned_day = None
+        self.records = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.rotations = 0
+        self.errors = 0
+
+    def path(self, stream: str) -> Path:
+        return self.directory / f"{stream}{self.suffix}.jsonl"
+
+    # --- Жизненный цикл ---
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            c = _open(self.db_path)
+            for statement in _SCHEMA:
+                c.execute(statement)
+            c.close()
+            self._thread = threading.Thread(target=self._run, name="audit-write", daemon=True)
+            self._thread.start()
+
+    async def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        await asyncio.to_thread(thread.join)
+
+    # --- Запись ---
+    def record(self, stream: str, event: str, **fields):
+        # Вызывается из хендлеров: никакого I/O, только очередь
+        if self._thread is None:
+            self.start()
+        self._queue.put((stream, (time.time(), event, fields)))
+
+    async def clear(self, stream: str) -> bool:
+        # Через ту же очередь: удаление не разойдётся с записями, стоящими перед ним
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._queue.put((stream, future))
+        return await asyncio.wrap_future(future)
+
+    def _collect(self, first):
+        # _STOP всегда последний в пачке: после него ничего не забираем
+        batch = [first]
+        if first is _STOP:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        c = _open(self.db_path)
+        stopping = False
+        while not stopping:
+            batch = self._collect(self._queue.get())
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+
+            lines: dict[str, list[str]] = {}
+            rows = []
+            for stream, item in batch:
+                if isinstance(item, Future):
+                    # Сначала дописываем накопленное, затем выполняем очистку
+                    self._flush(c, lines, rows)
+                    lines, rows = {}, []
+                    try:
+                        item.set_result(self._clear(c, stream))
+                    except (OSError, sqlite3.Error) as e:
+                        item.set_exception(e)
+                    continue
+                ts, event, fields = item
+                record = {"ts": datetime.fromtimestamp(ts).isoformat(timespec="seconds"), "event": event, **fields}
+                lines.setdefault(stream, []).append(json.dumps(record, ensure_ascii=False) + "\n")
+                data = json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+                rows.append((int(ts), stream, event, _user_id(fields), data))
+            self._flush(c, lines, rows)
+            if batch:
+                self.batches += 1
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self._prune(c)
+
+        for sink in self._sinks.values():
+            if sink.file is not None:
+                sink.file.close()
+        c.close()
+
+    def _flush(self, c: sqlite3.Connection, lines: dict, rows: list):
+        self._write_all(lines)
+        if not rows:
+            return
+        try:
+            c.execute("BEGIN")
+            c.executemany(
+                "INSERT INTO audit_log (ts, stream, event, user_id, data) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            c.execute("COMMIT")
+        except sqlite3.Error as e:
+            if c.in_transaction:
+                c.execute("ROLLBACK")
+            self.errors += 1
+            logger.error(f"❌ Не удалось записать {len(rows)} записей аудита в БД: {e}")
+
+    def _prune(self, c: sqlite3.Connection):
+        today = date.today()
+        if not self.retention_days or self._pruned_day == today:
+            return
+        self._pruned_day = today
+        cutoff = int(time.time()) - self.retention_days * 86400
+        try:
+            removed = c.execute("DELETE FROM audit_log WHERE ts < ?", (cutoff,)).rowcount
+            if removed:
+                logger.info(f"🧹 Аудит: удалено записей старше {self.retention_days} дн.: {removed}")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось очистить старые записи аудита: {e}")
+
+    def _write_all(self, lines: dict):
+        for stream, chunk in lines.items():
+            try:
+                self._write(stream, "".join(chunk))
+                self.records += len(chunk)
+            except OSError as e:
+                self.errors += 1
+                logger.error(f"❌ Не удалось записать журнал {stream}: {e}")
+
+    def _sink(self, stream: str) -> _Sink:
+        sink = self._sinks.get(stream)
+        if sink is None:
+            sink = self._sinks[stream] = _Sink(self.path(stream))
+        if sink.file is None:
+            sink.file = open(sink.path, "a", encoding="utf-8")
+            stat = os.fstat(sink.file.fileno())
+            sink.size = stat.st_size
+            sink.day = date.fromtimestamp(stat.st_mtime) if sink.size else date.today()
+        return sink
+
+    def _write(self, stream: str, text: str):
+        sink = self._sink(stream)
+        data_size = len(text.encode("utf-8"))
+        if sink.size and (sink.size + data_size > self.max_bytes or sink.day != date.today()):
+            self._rotate(sink)
+            sink = self._sink(stream)
+        sink.file.write(text)
+        sink.file.flush()
+        sink.size += data_size
+
+    def _rotate(self, sink: _Sink):
+        sink.file.close()
+        sink.file = None
+        base = str(sink.path)
+        if self.backups <= 0:
+            os.remove(base)
+        else:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{base}.{i}"):
+                    os.replace(f"{base}.{i}", f"{base}.{i + 1}")
+            os.replace(base, f"{base}.1")
+        self.rotations += 1
+
+    def _clear(self, c: sqlite3.Connection, stream: str) -> bool:
+        sink = self._sinks.get(stream)
+        if sink is not None and sink.file is not None:
+            sink.file.close()
+            sink.file = None
+        removed = c.execute("DELETE FROM audit_log WHERE stream = ?", (stream,)).rowcount > 0
+        # Вместе с ротированными копиями .1 … .N (в том числе от прежнего AUDIT_BACKUPS)
+        path = self.path(stream)
+        backups = [p for p in path.parent.glob(f"{path.name}.*") if p.suffix[1:].isdigit()]
+        for file in (path, *backups):
+            try:
+                os.remove(file)
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    # --- Чтение ---
+    def _reader(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = self._local.conn = _open(self.db_path)
+            c.execute("PRAGMA query_only=ON")
+        return c
+
+    def _query(self, stream, user_id, since, until, before_id, limit):
+        conditions, params = [], []
+        if stream is not None:
+            conditions.append("stream = ?")
+            params.append(stream)
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(int(since))
+        if until is not None:
+            conditions.append("ts < ?")
+            params.append(int(until))
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._reader().execute(
+            f"SELECT id, ts, stream, event, data FROM audit_log {where} ORDER BY id DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        return [
+            {"id": row_id, "ts": ts, "stream": row_stream, "event": event, **json.loads(data)}
+            for row_id, ts, row_stream, event, data in rows
+        ]
+
+    async def query(self, stream=None, user_id=None, since=None, until=None, before_id=None, limit=10):
+        """
+        Последние записи по фильтрам, от новых к старым. Следующая страница —
+        тот же запрос с before_id = id последней полученной записи.
+        """
+        if self._thread is None:
+            self.start()  # создаёт схему, если журнал ещё пуст
+        limit = max(1, min(limit, MAX_PAGE))
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(self._query, stream, user_id, since, until, before_id, limit)
+        finally:
+            add_time("db", time.perf_counter() - start)
+
+    def metrics(self) -> dict:
+        return {
+            "queue": self._queue.qsize(),
+            "records": self.records,
+            "batches": self.batches,
+            "max_batch": self.max_batch_seen,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+
+def _user_id(fields: dict):
+    try:
+        return int(fields["user_id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+audit = AuditWriter(AUDIT_DIR, AUDIT_MAX_BYTES, AUDIT_BACKUPS, AUDIT_FLUSH_INTERVAL, AUDIT_RETENTION_DAYS)
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import db
+from config import AUTH_CACHE_TTL, AUTH_CACHE_SIZE
+from db_async import get_auth_state
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class AuthState:
+    authorized: bool
+    role: str | None
+    number_digest: str | None
+    blocked: bool
+    expires: float
+
+
+class AuthCache:
+    """
+    Кэш состояния авторизации пользователя: авторизован ли, роль,
+    ключ табельного номера и блокировка — всё одним запросом к БД.
+
+    db.py вызывает invalidate() после каждой фиксации изменений
+    пользователей и блокировок, поэтому TTL нужен только как страховка
+    от правок базы в обход бота (admin_tool.py).
+
+    Записей не больше max_size (LRU), истёкшие удаляются. Версии
+    пользователя хранятся, только пока по нему идёт запрос к БД, — так
+    память не растёт с каждым, кто когда-либо писал боту.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[int, AuthState] = OrderedDict()
+        self._versions: dict[int, int] = {}
+        self._in_flight: dict[int, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def get(self, user_id: int) -> AuthState:
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                if entry.expires > now:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return entry
+                del self._entries[user_id]
+            self.misses += 1
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+            stamp = (self._epoch, self._versions.get(user_id, 0))
+
+        try:
+            authorized, role, digest, blocked = await get_auth_state(user_id)
+        except BaseException:
+            with self._lock:
+                self._done(user_id)
+            raise
+        entry = AuthState(authorized, role, digest, blocked, time.monotonic() + self.ttl)
+
+        with self._lock:
+            # Если пока шёл запрос данные изменились — результат уже устарел
+            if stamp == (self._epoch, self._versions.get(user_id, 0)):
+                self._store(user_id, entry)
+            self._done(user_id)
+        return entry
+
+    def _store(self, user_id: int, entry: AuthState):
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        # Сначала истёкшие с холодного конца, затем сверх лимита
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_size and oldest.expires > time.monotonic():
+                break
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _done(self, user_id: int):
+        left = self._in_flight[user_id] - 1
+        if left:
+            self._in_flight[user_id] = left
+        else:
+            del self._in_flight[user_id]
+            self._versions.pop(user_id, None)
+
+    async def is_authorized(self, user_id: int) -> bool:
+        return (await self.get(user_id)).authorized
+
+    async def get_user_role(self, user_id: int) -> str | None:
+        return (await self.get(user_id)).role
+
+    async def get_user_number_digest(self, user_id: int) -> str | None:
+        return (await self.get(user_id)).number_digest
+
+    async def is_blocked(self, user_id: int) -> bool:
+        return (await self.get(user_id)).blocked
+
+    def invalidate(self, user_id: int | None = None):
+        # None — сбросить всех (массовые операции над блокировками)
+        with self._lock:
+            self.invalidations += 1
+            if user_id is None:
+                self._epoch += 1
+                self._entries.clear()
+                self._versions.clear()
+                return
+            user_id = int(user_id)
+            if user_id in self._in_flight:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+auth_cache = AuthCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+db.on_user_change(auth_cache.invalidate)
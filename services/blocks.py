@@ -0,0 +1,43 @@
+import logging
+import time
+
+from db_async import add_block, extend_block, release_block, get_blocks
+from services.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _key(user_id):
+    return ("unblock", int(user_id))
+
+
+async def _release(user_id):
+    # Срок могли продлить в обход планировщика — тогда ждём новый
+    unblock_time = await release_block(user_id)
+    if unblock_time is not None:
+        scheduler.schedule(_key(user_id), unblock_time, _release, user_id)
+    else:
+        logger.info(f"🔓 Блокировка {user_id} снята")
+
+
+async def block_user(user_id, duration, reason=None, extend=False) -> int:
+    """
+    Блокирует пользователя на duration секунд и ставит снятие в планировщик.
+    extend=True не укорачивает уже действующую блокировку.
+    """
+    unblock_time = int(time.time()) + int(duration)
+    if extend:
+        await extend_block(user_id, unblock_time, reason)
+    else:
+        await add_block(user_id, unblock_time)
+    scheduler.schedule(_key(user_id), unblock_time, _release, user_id)
+    return unblock_time
+
+
+async def reload_blocks():
+    # После перезапуска: сроки из blocked_users снова в планировщике,
+    # истёкшие снимаются сразу
+    blocks = await get_blocks()
+    for user_id, unblock_time in blocks:
+        scheduler.schedule(_key(user_id), unblock_time or 0, _release, user_id)
+    logger.info(f"⏱ Загружено блокировок: {len(blocks)}")
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message
+
+from config import CLEANUP_MAX_MESSAGES
+from services import outbound, stats
+
+logger = logging.getLogger(__name__)
+
+# Сколько id принимает один вызов deleteMessages
+BATCH_SIZE = 100
+# Чат, о котором ничего не известно (после перезапуска), чистим как раньше — на столько назад
+FALLBACK_DEPTH = 99
+# Сколько чатов помним; самые давние забываются и чистятся на FALLBACK_DEPTH
+MAX_CHATS = 10000
+
+
+class ChatCleanup(BaseRequestMiddleware):
+    """
+    Очистка чата по /start.
+
+    Как middleware сессии запоминает первое сообщение, отправленное ботом
+    в чат после прошлой очистки. clear() удаляет всё от него до команды —
+    сообщения бота и пользователя между ними — пачками deleteMessages
+    по 100 id в фоновой задаче, не задерживая ответ. Диапазон ограничен
+    max_messages; для незнакомого чата берутся FALLBACK_DEPTH предыдущих id.
+    Помнит не больше max_chats чатов.
+    """
+
+    def __init__(self, max_messages: int = 500, max_chats: int = MAX_CHATS):
+        self.max_messages = max_messages
+        self.max_chats = max_chats
+        self.bot = None
+        self._first: OrderedDict[int, int] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self.cleanups = 0
+        self.batches = 0
+        self.failed = 0
+
+    def bind(self, bot):
+        self.bot = bot
+
+    async def __call__(self, make_request, bot, method):
+        result = await make_request(bot, method)
+        if isinstance(result, Message):
+            self._remember(result.chat.id, result.message_id)
+        elif isinstance(result, list) and result and isinstance(result[0], Message):
+            self._remember(result[0].chat.id, result[0].message_id)  # sendMediaGroup
+        return result
+
+    def _remember(self, chat_id: int, message_id: int):
+        if chat_id in self._first:
+            return
+        self._first[chat_id] = message_id
+        if len(self._first) > self.max_chats:
+            self._first.popitem(last=False)
+
+    def clear(self, chat_id: int, before_id: int):
+        """Удалить сообщения чата до before_id (не включая) в фоне."""
+        first = self._first.pop(chat_id, None)
+        if first is None:
+            first = before_id - FALLBACK_DEPTH
+        first = max(first, before_id - self.max_messages, 1)
+        self.delete(chat_id, range(first, before_id))
+
+    def delete(self, chat_id: int, message_ids):
+        message_ids = list(message_ids)
+        if self.bot is None or not message_ids:
+            return
+        task = asyncio.create_task(self._delete(chat_id, message_ids), context=stats.detached())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _delete(self, chat_id: int, message_ids: list):
+        self.cleanups += 1
+        with outbound.priority(outbound.BACKGROUND):
+            # С конца: сначала исчезает то, что пользователь видит на экране
+            for end in range(len(message_ids), 0, -BATCH_SIZE):
+                batch = message_ids[max(0, end - BATCH_SIZE):end]
+                try:
+                    await self.bot.delete_messages(chat_id=chat_id, message_ids=batch)
+                    self.batches += 1
+                except TelegramAPIError as e:
+                    # Ни одного удаляемого сообщения в пачке — обычное дело
+                    self.failed += 1
+                    logger.debug(f"[CLEANUP] Чат {chat_id}: {e}")
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"[CLEANUP] Не удалось очистить чат {chat_id}: {e}")
+                    return
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def metrics(self) -> dict:
+        return {
+            "tracked_chats": len(self._first),
+            "running": len(self._tasks),
+            "cleanups": self.cleanups,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+
+chat_cleanup = ChatCleanup(max_messages=CLEANUP_MAX_MESSAGES)
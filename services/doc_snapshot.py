@@ -0,0 +1,270 @@
+"""
+Бинарный снимок документации: таблица строк, таблица узлов меню
+и готовый поисковый индекс в одном файле.
+
+Файл открывается через mmap и читается лениво: тексты групп и списки
+n-грамм разбираются только при первом обращении. Заголовок хранит
+SHA-256 исходного data.json — если он не совпал, снимок не используется
+и документация собирается из JSON заново.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from bisect import bisect_left
+from pathlib import Path
+
+from services.menu_tree import MenuTree
+from services.search_index import NGRAM_SIZE, SearchIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NKDS"
+# Увеличивать при любом изменении раскладки файла
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHI32s")
+_SECTION = struct.Struct("<QQ")
+_NODE = struct.Struct("<IIIIB")
+_TARGET = struct.Struct("<III")
+_NONE = 0xFFFFFFFF
+
+# Секции в порядке записи
+STRINGS, NODES, TEXTS, TARGETS, GRAMS, POSTINGS = range(6)
+_SECTIONS = 6
+
+# Тип значения узла
+_DICT, _STR, _JSON = range(3)
+
+
+def menu_version(digest: bytes) -> int:
+    # Одинаковый data.json даёт одинаковые id узлов, значит и одну версию меню
+    return int.from_bytes(digest[:6], "big")
+
+
+def content_hash(path: Path) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.digest()
+
+
+# === Запись ===
+
+def _pack_u32(values) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def _pack_strings(strings) -> bytes:
+    # count, смещения (count + 1), затем UTF-8 подряд
+    blobs = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return _pack_u32([len(blobs)]) + _pack_u32(offsets) + b"".join(blobs)
+
+
+class _StringPool:
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+
+    def add(self, text) -> int:
+        if text is None:
+            return _NONE
+        sid = self.ids.get(text)
+        if sid is None:
+            sid = self.ids[text] = len(self.ids)
+        return sid
+
+
+def write(path: Path, digest: bytes, search_index: SearchIndex, menu: MenuTree):
+    """
+    Сохраняет снимок для data.json с хешем digest. Индекс должен быть
+    построен через build(), а не загружен из другого снимка.
+    Файл подменяется атомарно — читатели старого mmap не пострадают.
+    """
+    pool = _StringPool()
+
+    nodes = bytearray()
+    for parent, key, norm, value in menu.records():
+        if isinstance(value, dict):
+            kind, value_id = _DICT, _NONE
+        elif isinstance(value, str):
+            kind, value_id = _STR, pool.add(value)
+        else:
+            kind, value_id = _JSON, pool.add(json.dumps(value, ensure_ascii=False))
+        nodes += _NODE.pack(
+            _NONE if parent is None else parent, pool.add(key), pool.add(norm), value_id, kind
+        )
+
+    texts, targets, postings = search_index.parts()
+    packed_targets = bytearray()
+    for key, target in targets:
+        packed_targets += _TARGET.pack(
+            pool.add(key), pool.add(target[0]), pool.add(target[1]) if len(target) > 1 else _NONE
+        )
+
+    grams = sorted(postings)
+    offsets = [0]
+    ids = []
+    for gram in grams:
+        ids.extend(sorted(postings[gram]))
+        offsets.append(len(ids))
+
+    sections = [
+        _pack_strings(pool.ids),
+        bytes(nodes),
+        _pack_strings(texts),
+        bytes(packed_targets),
+        _pack_strings(grams),
+        _pack_u32(offsets) + _pack_u32(ids),
+    ]
+
+    # Секции выравниваем по 4 байтам, чтобы читать массивы u32 без копирования
+    sections = [section + b"\0" * (-len(section) % 4) for section in sections]
+    position = _HEADER.size + _SECTION.size * _SECTIONS
+    table = bytearray()
+    for section in sections:
+        table += _SECTION.pack(position, len(section))
+        position += len(section)
+
+    # Свой временный файл у каждого писателя: воркеры (WORKERS>1) собирают
+    # снимок одновременно и не должны подменять путь чужим недописанным
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, NGRAM_SIZE, _SECTIONS, digest))
+            f.write(table)
+            for section in sections:
+                f.write(section)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    logger.info(f"💾 Снимок документации записан: {path.name}, {position / 2**20:.1f} МБ")
+
+
+# === Чтение ===
+
+class _Strings:
+    """Таблица строк поверх mmap: строка декодируется при первом обращении."""
+
+    def __init__(self, view: memoryview):
+        count = struct.unpack_from("<I", view)[0]
+        self._offsets = view[4:4 + 4 * (count + 1)].cast("I")
+        self._blob = view[4 + 4 * (count + 1):]
+        self._decoded: list = [None] * count
+
+    def __len__(self):
+        return len(self._decoded)
+
+    def __getitem__(self, index: int) -> str:
+        text = self._decoded[index]
+        if text is None:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            text = self._decoded[index] = str(self._blob[start:end], "utf-8")
+        return text
+
+
+class _Postings:
+    """Списки групп по n-граммам: бинарный поиск n-граммы и разбор при первом запросе."""
+
+    def __init__(self, grams: _Strings, view: memoryview):
+        self._grams = grams
+        words = view.cast("I")
+        self._offsets = words[:len(grams) + 1]
+        self._ids = words[len(grams) + 1:]
+        self._cache: dict[str, frozenset] = {}
+
+    def __len__(self):
+        return len(self._grams)
+
+    def get(self, gram: str, default=None):
+        ids = self._cache.get(gram)
+        if ids is not None:
+            return ids
+        index = bisect_left(self._grams, gram)
+        if index == len(self._grams) or self._grams[index] != gram:
+            return default
+        ids = self._cache[gram] = frozenset(self._ids[self._offsets[index]:self._offsets[index + 1]])
+        return ids
+
+
+def load(path: Path, digest: bytes):
+    """
+    Открывает снимок и возвращает (data, search_index, menu) или None,
+    если файла нет, он от другой версии формата или от другого data.json.
+    """
+    if sys.byteorder != "little":
+        return None  # таблицы читаются напрямую через memoryview.cast
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None  # нет файла или он пустой
+
+    view = memoryview(buffer)
+    if len(view) < _HEADER.size + _SECTION.size * _SECTIONS:
+        logger.warning(f"⚠️ {path.name}: файл обрезан")
+        return None
+    magic, version, ngram_size, count, stored = _HEADER.unpack_from(view)
+    if magic != MAGIC or version != FORMAT_VERSION or ngram_size != NGRAM_SIZE or count != _SECTIONS:
+        logger.info(f"ℹ️ {path.name}: другой формат снимка — пересобираем")
+        return None
+    if stored != digest:
+        logger.info(f"ℹ️ {path.name}: data.json изменился — пересобираем")
+        return None
+
+    sections = []
+    for i in range(_SECTIONS):
+        start, length = _SECTION.unpack_from(view, _HEADER.size + _SECTION.size * i)
+        if start + length > len(view):
+            logger.warning(f"⚠️ {path.name}: файл обрезан")
+            return None
+        sections.append(view[start:start + length])
+
+    strings = _Strings(sections[STRINGS])
+
+    # Дерево нужно целиком сразу: из него строятся меню и плоский список.
+    # Дети раздела идут подряд в порядке ключей, поэтому словари
+    # заполняются в исходном порядке.
+    records = []
+    values = []
+    nodes = sections[NODES]
+    nodes = nodes[:len(nodes) - len(nodes) % _NODE.size]  # без выравнивания
+    for parent, key_id, norm_id, value_id, kind in _NODE.iter_unpack(nodes):
+        if kind == _DICT:
+            value = {}
+        elif kind == _STR:
+            value = strings[value_id]
+        else:
+            value = json.loads(strings[value_id])
+        if parent == _NONE:
+            records.append((None, None, None, value))
+        else:
+            key = sys.intern(strings[key_id])
+            values[parent][key] = value
+            records.append((parent, key, strings[norm_id], value))
+        values.append(value)
+
+    menu = MenuTree()
+    menu.restore(records, menu_version(digest))
+
+    targets = []
+    for key_id, first_id, second_id in _TARGET.iter_unpack(sections[TARGETS]):
+        target = (strings[first_id],) if second_id == _NONE else (strings[first_id], strings[second_id])
+        targets.append((strings[key_id], target))
+
+    search_index = SearchIndex()
+    search_index.restore(
+        _Strings(sections[TEXTS]), targets, _Postings(_Strings(sections[GRAMS]), sections[POSTINGS])
+    )
+    return values[0], search_index, menu
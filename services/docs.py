@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    import ijson  # потоковый разбор без чтения файла в строку
+except ImportError:
+    ijson = None
+
+from config import DATA_PATH, DOCS_SNAPSHOT, SNAPSHOT_PATH
+from db_async import sync_documents
+from services import doc_snapshot
+from services.menu_tree import MenuTree
+from services.search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+
+class DocEntry:
+    """
+    Конечная запись документации. Префикс пути — общий кортеж для всех
+    записей одного раздела, поэтому путь и категория не хранятся
+    в каждой записи, а собираются по запросу.
+    """
+    __slots__ = ("prefix", "key", "text")
+
+    def __init__(self, prefix: tuple, key, text: str):
+        self.prefix = prefix
+        self.key = key
+        self.text = text
+
+    @property
+    def path(self) -> list:
+        return [*self.prefix, self.key] if self.key is not None else list(self.prefix)
+
+    @property
+    def category(self) -> str:
+        return " > ".join(self.path)
+
+    def __repr__(self):
+        return f"DocEntry({self.category!r})"
+
+
+def flatten_json(d, path=None) -> list[DocEntry]:
+    # Итеративный обход в глубину в порядке ключей — как у прежней рекурсии,
+    # но без копирования пути на каждом уровне
+    prefix = tuple(path or ())
+    if not isinstance(d, dict):
+        return [DocEntry(prefix[:-1], prefix[-1] if prefix else None, str(d))]
+
+    flat = []
+    stack = [(prefix, iter(d.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for key, value in items:
+            if isinstance(value, dict):
+                stack.append((prefix + (key,), iter(value.items())))
+                break
+            flat.append(DocEntry(prefix, key, str(value)))
+        else:
+            stack.pop()
+    return flat
+
+
+def _intern_keys(pairs):
+    return {sys.intern(k): v for k, v in pairs}
+
+
+def _load_stream(f):
+    # Собираем дерево прямо из событий парсера: файл не читается в строку целиком
+    root = None
+    stack = []
+    key = None
+
+    def attach(value):
+        nonlocal root
+        if not stack:
+            root = value
+        elif isinstance(stack[-1], dict):
+            stack[-1][key] = value
+        else:
+            stack[-1].append(value)
+
+    for _, event, value in ijson.parse(f, use_float=True):
+        if event == "map_key":
+            key = sys.intern(value)
+        elif event == "start_map":
+            container = {}
+            attach(container)
+            stack.append(container)
+        elif event == "start_array":
+            container = []
+            attach(container)
+            stack.append(container)
+        elif event in ("end_map", "end_array"):
+            stack.pop()
+        else:
+            attach(value)
+    return root
+
+
+def load_json(path: Path):
+    if ijson is not None:
+        with open(path, "rb") as f:
+            return _load_stream(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f, object_pairs_hook=_intern_keys)
+
+
+def resident_mb() -> float:
+    # Текущий RSS из /proc (Linux, Docker); иначе — пиковый из getrusage
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass(frozen=True)
+class DocsSnapshot:
+    """
+    Всё, что построено из одной версии data.json. Снимок не меняется после
+    создания: перезагрузка собирает новый и подменяет ссылку целиком,
+    поэтому обработчик, взявший current() один раз, не увидит смешения версий.
+    """
+    data: dict
+    flat: list
+    search_index: SearchIndex
+    menu: MenuTree
+    path: Path
+    mtime_ns: int
+    size: int
+    build_time: float
+    rss_mb: float
+    digest: bytes
+    source: str
+    previous_menu: MenuTree | None = None
+
+    def node_from_state(self, data: dict):
+        # Сессии, начатые до перезагрузки, переводим на новое дерево по пути
+        return self.menu.from_state(data, self.previous_menu)
+
+
+_current: DocsSnapshot | None = None
+_failed_signature = None
+_reload_lock = asyncio.Lock()
+
+
+def current() -> DocsSnapshot:
+    if _current is None:
+        raise RuntimeError("Документация ещё не загружена")
+    return _current
+
+
+def _file_signature(path: Path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def build_snapshot(
+    path: Path,
+    previous_menu: MenuTree | None = None,
+    snapshot_path: Path | None = SNAPSHOT_PATH if DOCS_SNAPSHOT else None,
+) -> DocsSnapshot:
+    # Выполняется в отдельном потоке: чтение, разбор и все индексы.
+    # Если бинарный снимок собран из этого же data.json — берём готовое.
+    started = time.perf_counter()
+    mtime_ns, size = _file_signature(path)
+    digest = doc_snapshot.content_hash(path)
+
+    loaded = None
+    if snapshot_path is not None:
+        try:
+            loaded = doc_snapshot.load(snapshot_path, digest)
+        except Exception as e:
+            logger.warning(f"⚠️ Снимок {snapshot_path.name} не прочитан, собираем из JSON: {e}")
+
+    if loaded is not None:
+        source = "snapshot"
+        data, search_index, menu = loaded
+        flat = flatten_json(data)
+    else:
+        source = "json"
+        data = load_json(path)
+        if not isinstance(data, dict) or not data:
+            raise ValueError(f"{path}: ожидается непустой JSON-объект")
+
+        flat = flatten_json(data)
+        search_index = SearchIndex()
+        search_index.build(flat)
+        menu = MenuTree()
+        menu.build(data, doc_snapshot.menu_version(digest))
+        if snapshot_path is not None:
+            try:
+                doc_snapshot.write(snapshot_path, digest, search_index, menu)
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось записать снимок {snapshot_path.name}: {e}")
+
+    return DocsSnapshot(
+        data=data,
+        flat=flat,
+        search_index=search_index,
+        menu=menu,
+        path=Path(path),
+        mtime_ns=mtime_ns,
+        size=size,
+        build_time=time.perf_counter() - started,
+        rss_mb=resident_mb(),
+        digest=digest,
+        source=source,
+        previous_menu=previous_menu,
+    )
+
+
+async def reload(path: Path = DATA_PATH) -> DocsSnapshot | None:
+    """
+    Пересобирает документацию вне цикла событий и атомарно подменяет снимок,
+    затем синхронизирует FTS. При ошибке остаётся прежний снимок
+    и возвращается None.
+    """
+    global _current, _failed_signature
+    async with _reload_lock:
+        previous = _current
+        try:
+            snapshot = await asyncio.to_thread(
+                build_snapshot, path, previous.menu if previous else None
+            )
+        except Exception as e:
+            logger.exception(f"❌ Не удалось загрузить {path}: {e}")
+            try:
+                _failed_signature = _file_signature(path)
+            except OSError:
+                _failed_signature = None
+            return None
+
+        _current = snapshot
+        logger.info(
+            f"📥 Документация загружена ({snapshot.source}): {len(snapshot.flat)} записей "
+            f"из {snapshot.size / 2**20:.1f} МБ за {snapshot.build_time * 1000:.0f} мс, "
+            f"RSS {snapshot.rss_mb:.0f} МБ"
+        )
+        try:
+            added, updated, removed = await sync_documents(snapshot.flat)
+            logger.info(f"🗂 FTS синхронизирован: +{added}, ~{updated}, -{removed}")
+        except Exception as e:
+            logger.exception(f"❌ Ошибка синхронизации FTS: {e}")
+        return snapshot
+
+
+async def watch(interval: float, path: Path = DATA_PATH):
+    # Опрос mtime/размера: дёшево и работает на смонтированных томах Docker
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            signature = _file_signature(path)
+        except FileNotFoundError:
+            continue
+        snapshot = _current
+        if signature == _failed_signature:
+            continue  # этот вариант файла уже не разобрался — ждём следующего
+        if snapshot is not None and signature != (snapshot.mtime_ns, snapshot.size):
+            logger.info(f"🔄 {path.name} изменён — перезагрузка")
+            await reload(path)
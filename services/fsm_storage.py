@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from db_async import load_fsm_state, save_fsm_states, remove_idle_fsm_states
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд простоя сессия выгружается из памяти (в БД она остаётся)
+CACHE_IDLE = 15 * 60
+# Как часто чистить память и БД от простаивающих сессий
+SWEEP_INTERVAL = 60
+
+
+class _Session:
+    __slots__ = ("state", "data", "touched")
+
+    def __init__(self, state: Optional[str], data: dict):
+        self.state = state
+        self.data = data
+        self.touched = time.monotonic()
+
+
+def _storage_key(key: StorageKey) -> str:
+    thread_id = "" if key.thread_id is None else key.thread_id
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{thread_id}:{key.destiny}"
+
+
+def _dump(data: dict) -> str:
+    # Без пробелов и \u-экранирования: путь — это id узла, результаты поиска — {кнопка: id}
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states той же SQLite-базы.
+
+    Горячие сессии лежат в LRU в памяти, изменения копятся и пишутся
+    в БД одной пачкой раз в flush_interval (write-behind). Сессии,
+    простоявшие дольше CACHE_IDLE, выгружаются из памяти, а в БД
+    удаляются после session_ttl секунд без изменений (0 — хранить всегда).
+    """
+
+    def __init__(self, cache_size: int = 5000, flush_interval: float = 1.0, session_ttl: float = 0):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.session_ttl = session_ttl
+        self._cache: OrderedDict[str, _Session] = OrderedDict()
+        self._dirty: dict[str, _Session] = {}
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    # --- Жизненный цикл ---
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        last_sweep = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_sweep >= SWEEP_INTERVAL:
+                    last_sweep = time.monotonic()
+                    await self.sweep()
+            except Exception as e:
+                logger.exception(f"❌ Ошибка сохранения состояний FSM: {e}")
+
+    # --- Кэш ---
+    async def _session(self, key: StorageKey) -> _Session:
+        skey = _storage_key(key)
+        session = self._cache.get(skey)
+        if session is not None:
+            self.hits += 1
+            self._cache.move_to_end(skey)
+        else:
+            # Вытесненная, но ещё не записанная сессия — берём её, а не старую из БД
+            session = self._dirty.get(skey)
+            if session is None:
+                self.misses += 1
+                row = await load_fsm_state(skey)
+                # Пока ждали БД, сессию мог создать параллельный апдейт
+                session = self._cache.get(skey) or self._dirty.get(skey)
+                if session is None:
+                    session = _Session(row[0], json.loads(row[1])) if row else _Session(None, {})
+            self._cache[skey] = session
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        session.touched = time.monotonic()
+        return session
+
+    def _mark_dirty(self, key: StorageKey, session: _Session):
+        self._dirty[_storage_key(key)] = session
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            now = int(time.time())
+            rows = [
+                (skey, session.state, _dump(session.data) if session.data else None, now)
+                for skey, session in dirty.items()
+            ]
+            try:
+                await save_fsm_states(rows)
+            except Exception:
+                # Вернём в очередь то, что не успели перезаписать заново
+                for skey, session in dirty.items():
+                    self._dirty.setdefault(skey, session)
+                raise
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+
+    async def sweep(self):
+        idle_before = time.monotonic() - CACHE_IDLE
+        stale = [
+            skey for skey, session in self._cache.items()
+            if session.touched < idle_before and skey not in self._dirty
+        ]
+        for skey in stale:
+            del self._cache[skey]
+
+        removed = 0
+        if self.session_ttl:
+            removed = await remove_idle_fsm_states(int(time.time() - self.session_ttl))
+        if stale or removed:
+            logger.info(f"🧹 FSM: выгружено из памяти {len(stale)}, удалено из БД {removed}")
+
+    def metrics(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        session = await self._session(key)
+        session.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, session)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._session(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        session = await self._session(key)
+        session.data = data.copy()
+        self._mark_dirty(key, session)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._session(key)).data.copy()
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from config import HASH_WORKERS, HASH_QUEUE_LIMIT
+from services.stats import add_time
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Очередь на хеширование переполнена — запрос стоит повторить позже."""
+
+
+class HashingService:
+    """
+    Пул потоков для bcrypt. bcrypt отпускает GIL на время хеширования,
+    поэтому потоков достаточно, а цикл событий не блокируется.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.hash_time = 0.0
+        self.wait_time = 0.0
+        self.max_hash_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.workers)
+
+    def _timed(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.wait_time += started - submitted
+            self.hash_time += elapsed
+            self.max_hash_time = max(self.max_hash_time, elapsed)
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            logger.warning(f"[HASH] Очередь переполнена ({self.queue_depth}), запрос отклонён")
+            raise HashingBusy("⏳ Сервер перегружен, попробуйте через минуту.")
+
+        self._pending += 1
+        self.calls += 1
+        self.max_depth = max(self.max_depth, self.queue_depth)
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._timed, submitted, fn, *args)
+        finally:
+            self._pending -= 1
+            add_time("hash", time.perf_counter() - submitted)
+
+    async def hash_number(self, number: str) -> str:
+        return await self._run(_hash, number)
+
+    async def check_number(self, number: str, hashed: str) -> bool:
+        return await self._run(_check, number, hashed)
+
+    async def check_any(self, numbers, hashed: str) -> bool:
+        # Одна задача на весь список — не занимаем очередь N раз
+        return await self._run(_check_any, tuple(numbers), hashed)
+
+    def metrics(self) -> dict:
+        done = max(self.calls - self._pending, 1)
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": min(self._pending, self.workers),
+            "max_queue_depth": self.max_depth,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_hash_ms": round(self.hash_time / done * 1000, 2),
+            "max_hash_ms": round(self.max_hash_time * 1000, 2),
+            "avg_wait_ms": round(self.wait_time / done * 1000, 2),
+        }
+
+
+def _hash(number: str) -> str:
+    return bcrypt.hashpw(number.encode(), bcrypt.gensalt()).decode()
+
+
+def _check(number: str, hashed: str) -> bool:
+    return bcrypt.checkpw(number.encode(), hashed.encode())
+
+
+def _check_any(numbers, hashed: str) -> bool:
+    return any(_check(number, hashed) for number in numbers)
+
+
+hasher = HashingService(HASH_WORKERS, HASH_QUEUE_LIMIT)
@@ -0,0 +1,184 @@
+import re
+import logging
+from itertools import count
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BUTTON = "🔍 Поиск документации"
+BACK_BUTTON = "⬅ Назад"
+HOME_BUTTON = "🏠 Главное меню"
+EXIT_BUTTON = "🚪 Выйти"
+
+ROOT_ID = 0
+_versions = count(1)
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"[^\w\s]", "", text).strip().lower()
+
+
+def build_keyboard(keys, is_root=True) -> ReplyKeyboardMarkup:
+    buttons = []
+    if is_root:
+        buttons.append([KeyboardButton(text=SEARCH_BUTTON)])
+    for key in keys:
+        buttons.append([KeyboardButton(text=key)])
+    if not is_root:
+        buttons.append([KeyboardButton(text=BACK_BUTTON), KeyboardButton(text=HOME_BUTTON)])
+    buttons.append([KeyboardButton(text=EXIT_BUTTON)])
+    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+
+
+BACK_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=BACK_BUTTON), KeyboardButton(text=HOME_BUTTON)]],
+    resize_keyboard=True
+)
+
+
+class MenuNode:
+    __slots__ = ("id", "parent", "key", "value", "children", "description", "_keyboard", "_tree")
+
+    def __init__(self, tree, node_id, parent, key, value):
+        self._tree = tree
+        self.id = node_id
+        self.parent = parent
+        self.key = key
+        self.value = value
+        if isinstance(value, dict):
+            self.children = sorted(k for k in value if not k.startswith("_"))
+            self.description = value.get("_описание")
+        else:
+            self.children = []
+            self.description = None
+        self._keyboard = None
+
+    @property
+    def is_section(self) -> bool:
+        return isinstance(self.value, dict)
+
+    @property
+    def path(self) -> list:
+        # Путь не хранится в узле, а собирается по родителям — он нужен редко
+        keys = []
+        node = self
+        while node.parent is not None:
+            keys.append(node.key)
+            node = self._tree.node(node.parent)
+        return keys[::-1]
+
+    @property
+    def keyboard(self) -> ReplyKeyboardMarkup:
+        # Клавиатура строится при первом обращении и дальше переиспользуется.
+        # У конечной записи — только «Назад» и «Главное меню».
+        if self._keyboard is None:
+            if self.is_section:
+                self._keyboard = build_keyboard(self.children, is_root=self.id == ROOT_ID)
+            else:
+                self._keyboard = BACK_KEYBOARD
+        return self._keyboard
+
+
+class MenuTree:
+    """
+    Разделы документации с числовыми идентификаторами.
+
+    Для каждого узла хранятся отсортированный список подразделов и готовая
+    клавиатура, а индекс (родитель, нормализованный ключ) -> узел позволяет
+    найти нажатую кнопку без перебора соседей. В состоянии FSM хранится
+    только id узла и версия дерева; дерево перестраивается целиком при
+    загрузке data.json, и устаревшие id ведут в корень.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._nodes: list[MenuNode] = []
+        self._exact: dict[tuple, int] = {}
+        self._normalized: dict[tuple, int] = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def build(self, data: dict, version: int | None = None):
+        records = [(None, None, None, data)]
+        stack = [(ROOT_ID, data)]
+        while stack:
+            parent_id, value = stack.pop()
+            if not isinstance(value, dict):
+                continue
+            # Дети одного раздела получают идущие подряд id в порядке ключей
+            for key, child in value.items():
+                stack.append((len(records), child))
+                records.append((parent_id, key, normalize(key), child))
+        self.restore(records, version)
+
+    def restore(self, records, version: int | None = None):
+        """
+        Собирает дерево из записей (родитель, ключ, нормализованный ключ,
+        значение) в порядке id. Так же загружается готовый снимок.
+        Версия, заданная от содержимого data.json, не меняется между
+        перезапусками — id в сохранённых состояниях FSM остаются верными.
+        """
+        nodes = []
+        exact = {}
+        normalized = {}
+        for parent_id, key, norm, value in records:
+            node = MenuNode(self, len(nodes), parent_id, key, value)
+            nodes.append(node)
+            if parent_id is not None:
+                exact[(parent_id, key)] = node.id
+                # Как и прежний перебор, берём первый ключ с таким написанием
+                normalized.setdefault((parent_id, norm), node.id)
+
+        self._nodes = nodes
+        self._exact = exact
+        self._normalized = normalized
+        self.version = version if version is not None else next(_versions)
+        logger.info(f"📂 Меню построено: {len(nodes)} узлов")
+
+    def records(self):
+        # Обратное к restore: то, что нужно сохранить в снимок
+        for node in self._nodes:
+            norm = normalize(node.key) if node.parent is not None else None
+            yield node.parent, node.key, norm, node.value
+
+    @property
+    def root(self) -> MenuNode:
+        return self._nodes[ROOT_ID]
+
+    def node(self, node_id) -> MenuNode:
+        return self._nodes[node_id]
+
+    def find(self, path) -> MenuNode | None:
+        node_id = ROOT_ID
+        for key in path:
+            node_id = self._exact.get((node_id, key))
+            if node_id is None:
+                return None
+        return self._nodes[node_id]
+
+    def resolve(self, parent: MenuNode, text: str) -> MenuNode | None:
+        node_id = self._normalized.get((parent.id, normalize(text)))
+        return self._nodes[node_id] if node_id is not None else None
+
+    def parent_of(self, node: MenuNode) -> MenuNode:
+        return self._nodes[node.parent] if node.parent is not None else node
+
+    def keyboard(self, path=()) -> ReplyKeyboardMarkup:
+        node = self.find(path)
+        return node.keyboard if node is not None else BACK_KEYBOARD
+
+    # --- Состояние FSM ---
+    def state_of(self, node: MenuNode) -> dict:
+        return {"node": node.id, "menu": self.version}
+
+    def from_state(self, data: dict, previous: "MenuTree | None" = None) -> MenuNode:
+        node_id = data.get("node", ROOT_ID)
+        version = data.get("menu")
+        if version == self.version and 0 <= node_id < len(self._nodes):
+            return self._nodes[node_id]
+        if previous is not None and version == previous.version and 0 <= node_id < len(previous):
+            # Состояние от предыдущей сборки — ищем тот же раздел по пути
+            return self.find(previous.node(node_id).path) or self.root
+        return self.root
@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from config import ADMIN_IDS, NOTIFY_MAX_RETRIES, NOTIFY_MAX_PENDING
+from services import outbound, stats
+
+logger = logging.getLogger(__name__)
+
+# Потолок паузы между повторами при сетевых ошибках, секунд
+MAX_BACKOFF = 30
+
+
+class _Alert:
+    __slots__ = ("text", "kwargs", "repeats")
+
+    def __init__(self, text: str, kwargs: dict):
+        self.text = text
+        self.kwargs = kwargs
+        self.repeats = 0
+
+
+class _Chat:
+    __slots__ = ("chat_id", "pending", "task", "next_at")
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.pending: OrderedDict = OrderedDict()
+        self.task: asyncio.Task | None = None
+        self.next_at = 0.0
+
+
+class AdminNotifier:
+    """
+    Уведомления админам в фоне.
+
+    notify() только ставит сообщение в очередь каждого админа и сразу
+    возвращает управление хендлеру. На каждый чат работает своя задача,
+    так что чаты обслуживаются параллельно. Темп отправки задаёт очередь
+    исходящих (services.outbound): уведомления идут фоновым приоритетом
+    и не задерживают ответы пользователям.
+
+    Если 429 дошёл до уведомления (retry_after длиннее, чем готова ждать
+    очередь исходящих), задача ждёт retry_after и повторяет; на
+    сетевые и 5xx — повторяет с растущей паузой, не больше max_retries раз.
+    Ошибки 400/403 не повторяются. Сообщения с одинаковым key, ещё
+    не ушедшие из очереди, схлопываются в одно — последнее, с числом повторов.
+    """
+
+    def __init__(self, admin_ids, max_retries: int = 5, max_pending: int = 100):
+        self.admin_ids = [int(a) for a in admin_ids]
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.bot = None
+        self._chats: dict[int, _Chat] = {}
+        self._keys = itertools.count()
+        self.queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def bind(self, bot):
+        self.bot = bot
+
+    def notify(self, text: str, key=None, **kwargs):
+        """Уведомление всем админам; kwargs уходят в send_message."""
+        if self.bot is None:
+            logger.warning("[NOTIFY] Бот не подключён — уведомление пропущено")
+            return
+        for admin_id in self.admin_ids:
+            self._enqueue(admin_id, text, key, kwargs)
+
+    def _enqueue(self, chat_id: int, text: str, key, kwargs: dict):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(chat_id)
+
+        alert = chat.pending.get(key) if key is not None else None
+        if alert is not None:
+            # Такое же уведомление ещё ждёт отправки — заменяем его свежим
+            alert.text = text
+            alert.kwargs = kwargs
+            alert.repeats += 1
+            self.coalesced += 1
+        else:
+            if len(chat.pending) >= self.max_pending:
+                chat.pending.popitem(last=False)
+                self.dropped += 1
+            chat.pending[key if key is not None else ("_", next(self._keys))] = _Alert(text, kwargs)
+            self.queued += 1
+
+        if chat.task is None:
+            chat.task = asyncio.create_task(self._drain(chat), context=stats.detached())
+
+    async def _drain(self, chat: _Chat):
+        try:
+            with outbound.priority(outbound.BACKGROUND):
+                while chat.pending:
+                    _, alert = chat.pending.popitem(last=False)
+                    await self._send(chat, alert)
+        finally:
+            chat.task = None
+
+    async def _wait(self, chat: _Chat):
+        # Пауза после 429 или сбоя; обычный темп держит очередь исходящих
+        delay = chat.next_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, chat: _Chat, alert: _Alert):
+        text = alert.text
+        if alert.repeats:
+            text += f"\n\n🔁 Повторов: {alert.repeats}"
+
+        for attempt in range(self.max_retries + 1):
+            await self._wait(chat)
+            try:
+                await self.bot.send_message(chat.chat_id, text, **alert.kwargs)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Telegram сам говорит, сколько ждать
+                chat.next_at = time.monotonic() + e.retry_after
+                logger.warning(f"[NOTIFY] 429 для {chat.chat_id}, повтор через {e.retry_after} с")
+            except (TelegramNetworkError, TelegramServerError) as e:
+                chat.next_at = time.monotonic() + min(2 ** attempt, MAX_BACKOFF)
+                logger.warning(f"[NOTIFY] Сбой отправки админу {chat.chat_id}: {e}")
+            except TelegramAPIError as e:
+                # 400/403: бот заблокирован, чат не найден — повтор не поможет
+                self.failed += 1
+                logger.error(f"[NOTIFY] Не удалось уведомить админа {chat.chat_id}: {e}")
+                return
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"[NOTIFY] Ошибка отправки админу {chat.chat_id}: {e}")
+                return
+            self.retried += 1
+
+        self.failed += 1
+        logger.error(f"[NOTIFY] Уведомление админу {chat.chat_id} не доставлено за {self.max_retries + 1} попыток")
+
+    async def close(self, timeout: float = 5.0):
+        # Даём очереди дойти, остальное снимаем
+        tasks = [c.task for c in self._chats.values() if c.task is not None]
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            left = sum(len(c.pending) for c in self._chats.values())
+            logger.warning(f"[NOTIFY] При остановке не отправлено уведомлений: {left + len(pending)}")
+
+    def metrics(self) -> dict:
+        return {
+            "pending": sum(len(c.pending) for c in self._chats.values()),
+            "active_chats": sum(1 for c in self._chats.values() if c.task is not None),
+            "queued": self.queued,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+notifier = AdminNotifier(
+    ADMIN_IDS,
+    max_retries=NOTIFY_MAX_RETRIES,
+    max_pending=NOTIFY_MAX_PENDING
+)
@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    OUTBOUND_RATE,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_MAX_RETRIES,
+    OUTBOUND_MAX_RETRY_WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: меньше — раньше
+REPLY = 0        # ответы пользователю в хендлерах
+BACKGROUND = 1   # уведомления админам, рассылки, фоновая чистка
+PRIORITY_NAMES = {REPLY: "reply", BACKGROUND: "background"}
+
+# Не чаще, чем раз в столько секунд, выбрасываем вёдра простаивающих чатов
+SWEEP_INTERVAL = 60
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_priority", default=REPLY)
+
+
+@contextmanager
+def priority(level: int):
+    """Класс приоритета для всех запросов к API внутри блока (и созданных в нём задач)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Маркерное ведро: rate маркеров в секунду, запас не больше burst."""
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self) -> bool:
+        # Маркер, если он есть прямо сейчас
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def reserve(self) -> float:
+        # Маркер в долг: возвращает, сколько ждать; следующие встают в очередь за ним
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        # Ни одного маркера ближайшие seconds секунд
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+def _limited(api_method: str) -> bool:
+    # Лимиты Telegram касаются сообщений в чат; getUpdates, answerCallbackQuery
+    # и служебные вызовы идут мимо очереди
+    return api_method.startswith(("send", "copyMessage", "forwardMessage", "editMessage")) \
+        and api_method != "sendChatAction"
+
+
+class _ChatSlot:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = asyncio.Lock()
+
+
+class _Stats:
+    __slots__ = ("requests", "delayed", "wait_sum", "wait_max")
+
+    def __init__(self):
+        self.requests = 0
+        self.delayed = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Очередь исходящих сообщений на сессии Bot: все message.answer,
+    send_message, send_photo и т.п. проходят через неё.
+
+    Запрос ждёт своей очереди в чате (ведро chat_rate в секунду с запасом
+    chat_burst), а затем — общего маркера (rate в секунду на весь бот).
+    Очередь чата держится до выдачи общего маркера: иначе сообщения одного
+    чата, застрявшие за чужими, вышли бы пачкой и получили 429. Общие
+    маркеры раздаются по приоритету: ответ пользователю обгоняет фоновые
+    уведомления, внутри класса — по порядку прихода.
+
+    На 429 чат ставится на паузу retry_after, и запрос повторяется, если
+    ждать не дольше max_retry_wait. Иначе ошибка уходит вызывающему.
+    """
+
+    def __init__(self, rate: float = 25, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 2, max_retry_wait: float = 10):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self._global = TokenBucket(rate, max(1.0, rate))
+        self._chats: dict[int | str, _ChatSlot] = {}
+        self._heap: list = []
+        self._counter = itertools.count()
+        self._pump: asyncio.Task | None = None
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+        self._stats = {level: _Stats() for level in PRIORITY_NAMES}
+        self.throttled = 0
+        self.retried = 0
+
+    def set_rate(self, rate: float):
+        # Общий лимит на процесс: при нескольких воркерах он делится между ними
+        self.rate = rate
+        self._global = TokenBucket(rate, max(1.0, rate))
+
+    async def __call__(self, make_request, bot, method):
+        if not _limited(method.__api_method__):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        level = _priority.get()
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, level)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.throttled += 1
+                self._pause(chat_id, e.retry_after)
+                if attempt >= self.max_retries or e.retry_after > self.max_retry_wait:
+                    raise
+                attempt += 1
+                self.retried += 1
+                logger.warning(f"[OUTBOUND] 429 для чата {chat_id}, повтор через {e.retry_after} с")
+
+    def _pause(self, chat_id, seconds: float):
+        if chat_id is None:
+            self._global.pause(seconds)
+        else:
+            self._chat(chat_id).bucket.pause(seconds)
+
+    def _chat(self, chat_id) -> _ChatSlot:
+        slot = self._chats.get(chat_id)
+        if slot is None:
+            slot = self._chats[chat_id] = _ChatSlot(self.chat_rate, self.chat_burst)
+        return slot
+
+    def _sweep(self, now: float):
+        idle = [c for c, s in self._chats.items() if not s.lock.locked() and s.bucket.idle(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+        self._next_sweep = now + SWEEP_INTERVAL
+
+    async def _acquire(self, chat_id, level: int):
+        start = time.monotonic()
+        if start >= self._next_sweep:
+            self._sweep(start)
+
+        if chat_id is None:
+            await self._acquire_global(level)
+        else:
+            slot = self._chat(chat_id)
+            async with slot.lock:
+                delay = slot.bucket.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                await self._acquire_global(level)
+
+        waited = time.monotonic() - start
+        stats = self._stats[level]
+        stats.requests += 1
+        if waited > 0.001:
+            stats.delayed += 1
+            stats.wait_sum += waited
+            stats.wait_max = max(stats.wait_max, waited)
+
+    async def _acquire_global(self, level: int):
+        if not self._heap and self._global.take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (level, next(self._counter), future))
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self):
+        # Единственный раздающий общие маркеры: ждёт маркер и отдаёт его
+        # самому приоритетному из ожидающих на момент появления
+        try:
+            while self._heap:
+                delay = self._global.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                while self._heap:
+                    _, _, future = heapq.heappop(self._heap)
+                    if not future.done():
+                        future.set_result(None)
+                        break
+        finally:
+            self._pump = None
+
+    def metrics(self) -> dict:
+        waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+        for level, _, future in self._heap:
+            if not future.done():
+                waiting[PRIORITY_NAMES[level]] += 1
+        result = {
+            "chats": len(self._chats),
+            "throttled_429": self.throttled,
+            "retried": self.retried,
+        }
+        for level, name in PRIORITY_NAMES.items():
+            stats = self._stats[level]
+            result[f"{name}_waiting"] = waiting[name]
+            result[f"{name}_requests"] = stats.requests
+            result[f"{name}_delayed"] = stats.delayed
+            result[f"{name}_wait_avg_ms"] = round(stats.wait_sum / stats.delayed * 1000, 1) if stats.delayed else 0.0
+            result[f"{name}_wait_max_ms"] = round(stats.wait_max * 1000, 1)
+        return result
+
+
+outbound = OutboundLimiter(
+    rate=OUTBOUND_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    chat_burst=OUTBOUND_CHAT_BURST,
+    max_retries=OUTBOUND_MAX_RETRIES,
+    max_retry_wait=OUTBOUND_MAX_RETRY_WAIT
+)
@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+
+from services import stats
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    Отложенные события по абсолютному времени (unix timestamp).
+
+    Сроки лежат в куче, а в цикле событий взведён один таймер — на
+    ближайший из них, поэтому постановка и снятие стоят O(log n), а
+    ожидающих корутин нет вовсе. У каждого события есть ключ: повторная
+    постановка с тем же ключом переносит срок, cancel() снимает событие.
+    Колбэк может быть обычной функцией или корутинной.
+    """
+
+    def __init__(self):
+        self._heap: list = []
+        self._entries: dict = {}
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_at: float | None = None
+        self._tasks: set = set()
+        self.fired = 0
+        self.failed = 0
+        self.max_lateness = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, when: float, callback, *args):
+        entry = [when, next(self._counter), key, callback, args, time.time()]
+        old = self._entries.get(key)
+        if old is not None:
+            old[2] = None  # ленивое удаление из кучи
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            # Частые переносы оставляют в куче снятые записи — пересобираем
+            self._heap = [e for e in self._heap if e[2] is not None]
+            heapq.heapify(self._heap)
+        if self._timer_at is None or when < self._timer_at:
+            self._arm()
+
+    def cancel(self, key) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        return True
+
+    def deadline(self, key) -> float | None:
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def _arm(self):
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        if not heap:
+            return
+        when = heap[0][0]
+        loop = asyncio.get_running_loop()
+        # Таймер взводится из хендлера, но колбэки к его апдейту не относятся
+        self._timer = loop.call_later(max(0.0, when - time.time()), self._fire, context=stats.detached())
+        self._timer_at = when
+
+    def _fire(self):
+        self._timer = self._timer_at = None
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            when, _, key, callback, args, created = heapq.heappop(heap)
+            if key is None:
+                continue
+            del self._entries[key]
+            self.fired += 1
+            # Сроки, уже истёкшие при постановке (после перезапуска), не в счёт
+            self.max_lateness = max(self.max_lateness, now - max(when, created))
+            try:
+                result = callback(*args)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._tasks.add(task)
+                    task.add_done_callback(self._done)
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"❌ Ошибка в отложенном событии {key}: {e}")
+        self._arm()
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            logger.error(f"❌ Ошибка в отложенном событии: {task.exception()!r}")
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def metrics(self) -> dict:
+        return {
+            "pending": len(self._entries),
+            "heap": len(self._heap),
+            "fired": self.fired,
+            "failed": self.failed,
+            "max_lateness_ms": round(self.max_lateness * 1000, 1),
+        }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,129 @@
+import logging
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Длина n-грамм, по которым строится индекс
+NGRAM_SIZE = 3
+# Сколько последних запросов держать в кэше
+CACHE_SIZE = 256
+# Разделитель записей внутри группы — в тексте запроса его не бывает
+_SEPARATOR = "\x00"
+
+
+def _ngrams(text: str):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс по n-граммам плоской документации.
+
+    Строится один раз из результата flatten_json и отвечает на запросы
+    в том же формате, что и линейный поиск: {ключ: путь[:2]}.
+    Семантика совпадения прежняя — вхождение подстроки в
+    «категория + ссылка» без учёта регистра.
+    """
+
+    def __init__(self):
+        self._texts: list[str] = []
+        self._targets: list[tuple[str, tuple]] = []
+        self._postings: dict[str, frozenset] = {}
+        self._cache: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def build(self, flat_data):
+        # flatten_json обходит дерево в глубину, поэтому записи с общим
+        # путь[:2] идут подряд. Индексируем такие группы целиком: результат
+        # поиска всё равно состоит из групп, а не из отдельных записей.
+        texts = []
+        targets = []
+        current = None
+        parts = []
+
+        for entry in flat_data:
+            path = entry.path
+            target = tuple(path[:2])
+            if target != current:
+                if parts:
+                    texts.append(_SEPARATOR.join(parts))
+                    parts = []
+                current = target
+                targets.append((path[1] if len(path) > 1 else path[0], target))
+            parts.append(f"{entry.category} {entry.text}".lower())
+        if parts:
+            texts.append(_SEPARATOR.join(parts))
+
+        postings = defaultdict(list)
+        for group_id, text in enumerate(texts):
+            for gram in _ngrams(text):
+                postings[gram].append(group_id)
+
+        self.restore(texts, targets, {gram: frozenset(ids) for gram, ids in postings.items()})
+        logger.info(f"🔎 Поисковый индекс построен: {len(texts)} групп, {len(flat_data)} записей")
+
+    def restore(self, texts, targets, postings):
+        """
+        Подставляет готовые части индекса. texts — последовательность строк,
+        postings — любое отображение с .get(), например ленивое чтение
+        из снимка на диске.
+        """
+        # Подмена целиком — параллельные запросы видят либо старый, либо новый индекс
+        self._postings = postings
+        self._targets = targets
+        self._texts = texts
+        self._cache = OrderedDict()
+
+    def parts(self):
+        return self._texts, self._targets, self._postings
+
+    def _candidates(self, term: str):
+        if len(term) < NGRAM_SIZE:
+            # Короткий запрос — n-граммы не помогут, проверяем все группы
+            return range(len(self._texts))
+
+        lists = []
+        for gram in _ngrams(term):
+            ids = self._postings.get(gram)
+            if not ids:
+                return ()
+            lists.append(ids)
+        lists.sort(key=len)
+        result = lists[0]
+        for ids in lists[1:]:
+            result = result & ids
+            if not result:
+                break
+        return result
+
+    def _match(self, terms) -> list[int]:
+        texts = self._texts
+        matched = set()
+        for term in terms:
+            if _SEPARATOR in term:
+                continue
+            matched.update(i for i in self._candidates(term) if i not in matched and term in texts[i])
+        return sorted(matched)
+
+    def search(self, terms) -> dict:
+        cache_key = frozenset(terms)
+        cache = self._cache
+        matched = cache.get(cache_key)
+        if matched is None:
+            matched = self._match(cache_key)
+            cache[cache_key] = matched
+            if len(cache) > CACHE_SIZE:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(cache_key)
+
+        # Порядок как у линейного прохода: поздние записи перезаписывают ранние.
+        # Путь отдаём новым списком — его потом изменяют в состоянии FSM.
+        targets = self._targets
+        result_paths = {}
+        for group_id in matched:
+            key, path = targets[group_id]
+            result_paths[key] = list(path)
+        return result_paths
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Сколько апдейтов воркер обрабатывает одновременно
+MAX_IN_FLIGHT = 100
+_STOP = None
+
+# Номер текущего воркера и канал к фронту; None — обычный однопроцессный режим
+_worker: "_WorkerSide | None" = None
+_broadcast_handlers: dict = {}
+
+
+def user_of(update: Update) -> int | None:
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:
+        return None
+    return user.id if user is not None else None
+
+
+def shard_of(user_id: int | None, workers: int) -> int:
+    # Апдейты без пользователя (редкость) — в первый воркер
+    return user_id % workers if user_id is not None else 0
+
+
+# === Общее состояние воркеров ===
+def on_broadcast(action: str):
+    """Обработчик широковещательного события от другого воркера."""
+    def decorator(fn):
+        _broadcast_handlers[action] = fn
+        return fn
+    return decorator
+
+
+def broadcast(action: str, *args):
+    """
+    Сообщить остальным воркерам об изменении, которое они держат в памяти
+    (новый табельный номер, перечитанная документация). В однопроцессном
+    режиме ничего не делает.
+    """
+    if _worker is not None:
+        _worker.upstream.put((_worker.index, action, args))
+
+
+def worker_index() -> int | None:
+    return _worker.index if _worker is not None else None
+
+
+# === Фронт ===
+class ShardForwarder(BaseMiddleware):
+    """Внешний middleware фронта: вместо обработки отдаёт апдейт воркеру."""
+
+    def __init__(self, pool: "WorkerPool"):
+        self.pool = pool
+
+    async def __call__(self, handler, event: Update, data):
+        self.pool.submit(event)
+
+
+class WorkerPool:
+    """
+    Воркеры-процессы, между которыми апдейты делятся по user_id % workers.
+
+    Фронт получает апдейты (polling или webhook) и кладёт их в очередь
+    воркера-владельца пользователя. Каждый воркер — полноценный бот со
+    своими состояниями FSM, антифлудом и кэшами для своей доли
+    пользователей; база общая (SQLite в режиме WAL). Внутри воркера апдейты
+    одного пользователя обрабатываются строго по очереди.
+
+    Процессы создаются через fork до запуска цикла событий: воркер получает
+    уже собранные, но ещё не запущенные объекты модуля bot.py.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._ctx = multiprocessing.get_context("fork")
+        self._queues = []
+        self._upstream = None
+        self._processes = []
+        self._relay: threading.Thread | None = None
+        self.forwarded = [0] * workers
+        self.broadcasts = 0
+
+    def start(self, target):
+        """target(worker) — корутинная функция воркера, апдейты принимает worker.serve(dp, bot)."""
+        self._upstream = self._ctx.Queue()
+        for index in range(self.workers):
+            queue = self._ctx.Queue()
+            process = self._ctx.Process(
+                target=_run_worker,
+                args=(index, queue, self._upstream, target),
+                name=f"worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self._queues.append(queue)
+            self._processes.append(process)
+        self._relay = threading.Thread(target=self._relay_loop, name="shard-relay", daemon=True)
+        self._relay.start()
+        logger.info(f"🧩 Запущено воркеров: {self.workers}")
+
+    def submit(self, update: Update):
+        shard = shard_of(user_of(update), self.workers)
+        self.forwarded[shard] += 1
+        self._queues[shard].put(update.model_dump_json(by_alias=True, exclude_none=True))
+
+    def _relay_loop(self):
+        # События от воркеров — всем остальным
+        while True:
+            item = self._upstream.get()
+            if item is _STOP:
+                return
+            origin, action, args = item
+            self.broadcasts += 1
+            for index, queue in enumerate(self._queues):
+                if index != origin:
+                    queue.put((action, args))
+
+    async def close(self, timeout: float = 15):
+        for queue in self._queues:
+            queue.put(_STOP)
+        for process in self._processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"⚠️ {process.name} не остановился за {timeout} с — завершаем")
+                process.terminate()
+        if self._upstream is not None:
+            self._upstream.put(_STOP)
+        logger.info("🧩 Воркеры остановлены")
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(p.is_alive() for p in self._processes),
+            "forwarded": list(self.forwarded),
+            "broadcasts": self.broadcasts,
+        }
+
+
+# === Воркер ===
+class _WorkerSide:
+    def __init__(self, index: int, queue, upstream):
+        self.index = index
+        self.queue = queue
+        self.upstream = upstream
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard-read")
+        self._chains: dict = {}
+        self._slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self._tasks: set = set()
+
+    async def serve(self, dp: Dispatcher, bot: Bot):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(self._reader, self.queue.get)
+            if item is _STOP:
+                break
+            if isinstance(item, tuple):
+                await self._on_broadcast(*item)
+                continue
+            update = Update.model_validate_json(item, context={"bot": bot})
+            await self._slots.acquire()
+            user_id = user_of(update)
+            task = asyncio.create_task(self._process(dp, bot, update, self._chains.get(user_id)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if user_id is not None:
+                self._chains[user_id] = task
+                task.add_done_callback(lambda t, u=user_id: self._chains.pop(u, None) if self._chains.get(u) is t else None)
+
+        # Дорабатываем принятые апдейты
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._reader.shutdown(wait=False)
+
+    async def _process(self, dp: Dispatcher, bot: Bot, update: Update, previous: asyncio.Task | None):
+        try:
+            if previous is not None:
+                # Предыдущий апдейт того же пользователя — сначала он
+                await asyncio.wait([previous])
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.exception(f"❌ Воркер {self.index}: ошибка обработки апдейта {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+
+    async def _on_broadcast(self, action: str, args: tuple):
+        handler = _broadcast_handlers.get(action)
+        if handler is None:
+            logger.warning(f"⚠️ Воркер {self.index}: неизвестное событие {action}")
+            return
+        try:
+            await handler(*args)
+        except Exception as e:
+            logger.exception(f"❌ Воркер {self.index}: ошибка события {action}: {e}")
+
+
+def _run_worker(index: int, queue, upstream, target):
+    # Останавливает воркеры фронт: Ctrl+C и SIGTERM ловит только он
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    async def main():
+        global _worker
+        _worker = _WorkerSide(index, queue, upstream)
+        await target(_worker)
+
+    asyncio.run(main())
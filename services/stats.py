@@ -0,0 +1,232 @@
+import bisect
+import contextvars
+import logging
+import time
+
+from aiohttp import web
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# На что уходит время обработки апдейта; остаток — собственные вычисления
+KINDS = ("db", "api", "hash")
+PREFIX = "nikitich"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Оценка по корзинам: линейно внутри корзины, как histogram_quantile
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                low = BUCKETS[i - 1] if i else 0.0
+                return low + (BUCKETS[i] - low) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class Timing:
+    """Время одного апдейта по видам ожидания; живёт в контекстной переменной."""
+    __slots__ = ("handler", "spent")
+
+    def __init__(self):
+        self.handler = "unhandled"
+        self.spent = dict.fromkeys(KINDS, 0.0)
+
+
+_current: contextvars.ContextVar[Timing | None] = contextvars.ContextVar("update_timing", default=None)
+
+
+def begin() -> tuple[Timing, contextvars.Token]:
+    timing = Timing()
+    return timing, _current.set(timing)
+
+
+def end(token: contextvars.Token):
+    _current.reset(token)
+
+
+def current() -> Timing | None:
+    return _current.get()
+
+
+def detached() -> contextvars.Context:
+    """
+    Контекст для фоновой работы, начатой из хендлера (задачи, таймеры):
+    без текущего апдейта, чтобы её время не приписалось хендлеру.
+    """
+    context = contextvars.copy_context()
+    context.run(_current.set, None)
+    return context
+
+
+def add_time(kind: str, seconds: float):
+    """Учесть ожидание (БД, Telegram API, bcrypt) в текущем апдейте, если он есть."""
+    timing = _current.get()
+    if timing is not None:
+        timing.spent[kind] += seconds
+
+
+class ApiTimer(BaseRequestMiddleware):
+    """Время запросов к Telegram API, включая ожидание лимитов исходящих."""
+
+    async def __call__(self, make_request, bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            add_time("api", time.perf_counter() - start)
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Stats:
+    """
+    Счётчики и гистограммы процесса плюс metrics() сервисов, собранные
+    в текст Prometheus (GET /metrics) и в сводку для /stats.
+    """
+
+    def __init__(self):
+        self.histograms: dict[tuple, Histogram] = {}
+        self.counters: dict[tuple, float] = {}
+        self.collectors: dict[str, callable] = {}
+        self.started = time.time()
+        self._runner: web.AppRunner | None = None
+
+    # --- Запись ---
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(labels.items()))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def register(self, component: str, collector):
+        """collector() -> dict чисел; попадает в /metrics и /stats."""
+        self.collectors[component] = collector
+
+    def record_update(self, timing: Timing, elapsed: float, state: str, failed: bool):
+        handler = timing.handler
+        self.observe("handler_seconds", elapsed, handler=handler)
+        self.observe("state_seconds", elapsed, state=state)
+        waited = 0.0
+        for kind, spent in timing.spent.items():
+            waited += spent
+            self.inc("handler_time_seconds_total", spent, handler=handler, kind=kind)
+        self.inc("handler_time_seconds_total", max(elapsed - waited, 0.0), handler=handler, kind="compute")
+        if failed:
+            self.inc("handler_errors_total", handler=handler)
+
+    # --- Чтение ---
+    def components(self) -> dict[str, dict]:
+        result = {}
+        for component, collector in self.collectors.items():
+            try:
+                result[component] = collector()
+            except Exception as e:
+                logger.warning(f"[STATS] {component}.metrics() упал: {e}")
+        return result
+
+    def handlers(self) -> list[dict]:
+        rows = []
+        for (name, labels), histogram in self.histograms.items():
+            if name != "handler_seconds":
+                continue
+            handler = dict(labels)["handler"]
+            spent = {
+                kind: self.counters.get(("handler_time_seconds_total", (("handler", handler), ("kind", kind))), 0.0)
+                for kind in (*KINDS, "compute")
+            }
+            rows.append({
+                "handler": handler,
+                "count": histogram.count,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+                "total": histogram.sum,
+                "spent": spent,
+                "errors": int(self.counters.get(("handler_errors_total", (("handler", handler),)), 0)),
+            })
+        rows.sort(key=lambda r: r["total"], reverse=True)
+        return rows
+
+    def histogram(self, name: str, **labels) -> Histogram | None:
+        return self.histograms.get((name, tuple(labels.items())))
+
+    def prometheus(self) -> str:
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            full = f"{PREFIX}_{name}"
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} histogram")
+            cumulative = 0
+            for bound, n in zip((*BUCKETS, "+Inf"), histogram.counts):
+                cumulative += n
+                lines.append(f"{full}_bucket{_labels((*labels, ('le', bound)))} {cumulative}")
+            lines.append(f"{full}_sum{_labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{full}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            full = f"{PREFIX}_{name}"
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{_labels(labels)} {value:g}")
+        lines.append(f"# TYPE {PREFIX}_component gauge")
+        for component, values in self.components().items():
+            for metric, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"{PREFIX}_component{_labels((('component', component), ('metric', metric)))} {value:g}")
+        lines.append(f"{PREFIX}_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    # --- HTTP ---
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def start_server(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"📈 Метрики Prometheus: http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+stats = Stats()
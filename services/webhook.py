@@ -0,0 +1,115 @@
+import asyncio
+import hmac
+import logging
+import time
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Приём апдейтов через webhook вместо long polling.
+
+    Telegram присылает апдейт POST-запросом; сервер сразу отвечает 200,
+    а апдейт обрабатывается в фоновой задаче. Одновременно обрабатывается
+    не больше max_concurrency апдейтов: пока все места заняты, следующий
+    запрос ждёт ответа, и Telegram сам придерживает поток (у него не больше
+    max_connections открытых соединений на бот).
+
+    При остановке новые апдейты больше не принимаются, начатые дорабатывают
+    до drain_timeout секунд, остальные отменяются.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = "/webhook", secret: str = "",
+                 max_concurrency: int = 100, drain_timeout: float = 10):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.max_concurrency = max_concurrency
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._runner: web.AppRunner | None = None
+        self._accepting = False
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_in_flight = 0
+        self.processing_time = 0.0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        return app
+
+    # --- Жизненный цикл ---
+    async def start(self, host: str, port: int):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._accepting = True
+        logger.info(f"🌐 Webhook слушает {host}:{port}{self.path}, до {self.max_concurrency} апдейтов одновременно")
+
+    async def close(self):
+        self._accepting = False
+        if self._tasks:
+            logger.info(f"⏳ Webhook: дорабатываем {len(self._tasks)} апдейт(ов)")
+            done, pending = await asyncio.wait(list(self._tasks), timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning(f"⚠️ Webhook: прервано апдейтов при остановке: {len(pending)}")
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        logger.info("🌐 Webhook остановлен")
+
+    # --- Обработка ---
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if not self._accepting:
+            # Telegram повторит позже — апдейт достанется следующему запуску
+            self.rejected += 1
+            return web.Response(status=503)
+
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        self.received += 1
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        self.max_in_flight = max(self.max_in_flight, len(self._tasks))
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception(f"❌ Ошибка обработки апдейта {update.update_id}: {e}")
+        finally:
+            self.processing_time += time.perf_counter() - start
+            self._slots.release()
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": len(self._tasks),
+            "max_in_flight": self.max_in_flight,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.processing_time / self.processed * 1000, 1) if self.processed else 0.0,
+        }
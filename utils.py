@@ -4,8 +4,6 @@ import logging
 logger = logging.getLogger(__name__)
 
 AUTHORIZED_NUMBERS = {num.strip() for num in os.getenv("AUTHORIZED_NUMBERS", "").split(",") if num.strip()}
-DATA_JSON = {}
-FLAT_DATA = []
 
 
 from typing import TypeVar, Type, Callable